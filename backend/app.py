@@ -1,6 +1,7 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import os
+import sys
 import cv2
 import mediapipe as mp
 import numpy as np
@@ -9,12 +10,39 @@ import shutil
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
+import hashlib
+import json
+import base64
+import logging
+import time
 from datetime import datetime, timedelta
+from log_config import setup_logging, sampled
+setup_logging()  # 在导入 database 之前配置，建表和迁移的日志也经过同一套处理
 from database import db
+from db_instrumentation import DB_INSTRUMENTATION, query_stats
+from pose_store import PoseArrays, pack_poses, pose_arrays_to_dict
+from pose_compare import compare_pose_arrays, clean_differences
+from task_queue import TaskQueue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from pose_workers import pose_worker_pool, POSE_WORKER_PROCESSES
+from pose_pipeline import (
+    POSE_EXTRACTION_MODE, open_frame_source, iter_sampled_frames, extract_poses_pipelined, plan_keyframe_chunks,
+)
+from capabilities import (
+    OPENCV_FOURCCS, detect_capabilities, get_capabilities, has_ffmpeg, has_ffprobe,
+    h264_encoder, ffmpeg_frame_rate_args, opencv_fourccs,
+)
+from report_manifest import lookup_pose_video, record_pose_video
+from range_serving import serve_file
+from media_probe import probe_keyframes, probe_media, probe_video_stream, remember_media_info
+from metrics import (
+    POSE_STAGE_SECONDS, REQUEST_SECONDS, SUBPROCESS_SECONDS, TASK_QUEUE_DEPTH, registry as metrics_registry,
+)
 import jwt
 from functools import wraps
 import threading
-import traceback
+
+# 固定名称：直接运行 app.py 时 __name__ 为 __main__，LOG_LEVELS 中仍按 app 配置
+logger = logging.getLogger('app')
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -30,6 +58,12 @@ UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
 TEMP_FOLDER = os.environ.get('TEMP_FOLDER', default_temp_folder)
 THUMBNAIL_FOLDER = os.environ.get('THUMBNAIL_FOLDER', 'thumbnails')
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+# 视频列表接口每页最多返回的条数（limit 和 cursor 都不传时不分页，返回全部）
+VIDEO_LIST_MAX_LIMIT = 200
+# 批量互动计数接口一次最多查询的视频数
+ENGAGEMENT_MAX_VIDEOS = 200
+# 评论列表每页最多返回的条数（未指定 limit 时也按此上限分页）
+COMMENTS_MAX_LIMIT = 200
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -41,9 +75,88 @@ if not os.path.exists(THUMBNAIL_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB 限制
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    """按 Flask 接口（endpoint，而不是带参数的 URL）记录请求耗时，见 GET /metrics"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched', method=request.method, status=response.status_code,
+        )
+    return response
+
+@app.teardown_request
+def release_db_connection(exc):
+    """回滚本次请求在线程连接上残留的未提交事务（出错的请求不能让空闲线程一直占着写锁）"""
+    db.connections.release()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def encode_list_cursor(video: dict) -> str:
+    """列表分页游标：最后一条的 (upload_time, id)，对客户端不透明"""
+    raw = json.dumps([video['upload_time'], video['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_list_cursor(cursor: str):
+    """解析 encode_list_cursor 生成的游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        upload_time, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError('cursor 参数无效')
+    if not isinstance(upload_time, str) or not isinstance(row_id, int):
+        raise ValueError('cursor 参数无效')
+    return upload_time, row_id
+
+def parse_list_params():
+    """解析视频列表接口的分页参数
+    
+    Query 参数：
+      fields = 逗号分隔的字段名，可选，只返回这些字段
+      limit  = 每页条数，最多 VIDEO_LIST_MAX_LIMIT；只传 cursor 时按 VIDEO_LIST_MAX_LIMIT 分页
+      cursor = 上一页返回的 next_cursor
+    
+    limit 和 cursor 都不传时不分页，返回全部视频（前端列表页按此方式读取）。
+    
+    Returns:
+        (fields 或 None, limit 或 None（不分页）, after 或 None)；cursor 无效时抛出 ValueError
+    """
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    cursor = request.args.get('cursor')
+    if 'limit' not in request.args and not cursor:
+        return fields, None, None
+    limit = request.args.get('limit', VIDEO_LIST_MAX_LIMIT, type=int)
+    limit = max(1, min(limit, VIDEO_LIST_MAX_LIMIT))
+    after = decode_list_cursor(cursor) if cursor else None
+    return fields, limit, after
+
+def paginate_video_list(videos, limit, fields, derived):
+    """多查了一条用于判断是否还有下一页（limit 为 None 时不分页）；按 fields 裁剪返回字段
+    
+    derived: 由查询字段计算出的附加字段（如 has_pose_data），未指定 fields 或 fields 中包含时返回
+    
+    Returns:
+        (videos, next_cursor 或 None)
+    """
+    has_more = limit is not None and len(videos) > limit
+    videos = videos[:limit]
+    next_cursor = encode_list_cursor(videos[-1]) if has_more else None
+    
+    for video in videos:
+        for name, compute in derived.items():
+            if not fields or name in fields:
+                video[name] = compute(video)
+    if fields:
+        keep = set(fields) | {'video_id'}
+        videos = [{key: value for key, value in video.items() if key in keep} for video in videos]
+    return videos, next_cursor
+
 # ========== 认证相关函数 ==========
 
 def generate_auth_token(user_id: int, username: str, role: str = 'user') -> str:
@@ -53,7 +166,9 @@ def generate_auth_token(user_id: int, username: str, role: str = 'user') -> str:
         'username': username,
         'role': role,
         'exp': datetime.utcnow() + timedelta(days=TOKEN_EXPIRY_DAYS),
-        'iat': datetime.utcnow()
+        'iat': datetime.utcnow(),
+        # 每个 Token 唯一：同一秒内多次登录也会得到不同的 Token（user_sessions.token 有唯一约束）
+        'jti': uuid.uuid4().hex
     }
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
@@ -65,34 +180,58 @@ def verify_auth_token(token: str) -> dict:
             'valid': True,
             'user_id': payload['user_id'],
             'username': payload['username'],
-            'role': payload.get('role', 'user')
+            'role': payload.get('role', 'user'),
+            'exp': payload.get('exp')
         }
     except jwt.ExpiredSignatureError:
         return {'valid': False, 'error': 'Token已过期'}
     except jwt.InvalidTokenError:
         return {'valid': False, 'error': 'Token无效'}
 
+def authenticate_token(token: str) -> dict:
+    """验证Token并确认会话未注销（结果缓存在 db.auth_cache 中，重复请求不再解码和查库）
+    
+    验证失败时结果中的 status 为建议的 HTTP 状态码：会话查询出错时为 503（客户端应稍后重试，不要退出登录），
+    其余为 401。
+    """
+    cached = db.auth_cache.get_token(token)
+    if cached is not None:
+        return cached
+    
+    result = verify_auth_token(token)
+    if not result['valid']:
+        return result
+    session_exists = db.session_exists(token)
+    if session_exists is None:
+        # 数据库暂时不可用不代表会话已注销：不缓存，也不让客户端以为登录已失效
+        return {'valid': False, 'error': '登录状态校验失败，请稍后重试', 'status': 503}
+    if not session_exists:
+        return {'valid': False, 'error': '登录已失效，请重新登录'}
+    
+    db.auth_cache.put_token(token, result, result.get('exp'))
+    return result
+
 def require_auth(f):
     """认证装饰器 - 保护需要登录的接口"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # 添加日志，记录认证过程
         if f.__name__ == 'add_comment':
-            print(f"[认证装饰器] 检查评论接口认证，路径: {request.path}")
+            logger.debug("[认证装饰器] 检查评论接口认证，路径: %s", request.path)
         
         auth_header = request.headers.get('Authorization', '')
         token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else ''
         
         if not token:
             if f.__name__ == 'add_comment':
-                print("[认证装饰器] 错误: 未提供Token")
+                logger.debug("[认证装饰器] 错误: 未提供Token")
             return jsonify({'success': False, 'error': '未登录'}), 401
         
-        result = verify_auth_token(token)
+        result = authenticate_token(token)
         if not result['valid']:
             if f.__name__ == 'add_comment':
-                print(f"[认证装饰器] 错误: Token验证失败 - {result.get('error', '未知错误')}")
-            return jsonify({'success': False, 'error': result.get('error', 'Token验证失败')}), 401
+                logger.debug("[认证装饰器] 错误: Token验证失败 - %s", result.get('error', '未知错误'))
+            return jsonify({'success': False, 'error': result.get('error', 'Token验证失败')}), result.get('status', 401)
         
         # 将用户信息附加到请求上下文
         request.current_user = {
@@ -102,12 +241,19 @@ def require_auth(f):
         }
         
         if f.__name__ == 'add_comment':
-            print(f"[认证装饰器] 认证成功，用户ID: {result['user_id']}, 用户名: {result['username']}")
+            logger.debug("[认证装饰器] 认证成功，用户ID: %s, 用户名: %s", result['user_id'], result['username'])
         
         return f(*args, **kwargs)
     
     return decorated_function
 
+def load_user_role(user_id: int):
+    """从数据库读取用户角色，用户不存在时返回 None"""
+    user = db.get_user_by_id(user_id)
+    if not user:
+        return None
+    return user.get('role', 'user') or 'user'
+
 def require_admin(f):
     """管理员权限装饰器 - 保护需要管理员权限的接口"""
     @wraps(f)
@@ -116,10 +262,10 @@ def require_admin(f):
         # 先从token中获取role
         role = request.current_user.get('role', 'user')
         
-        # 再从数据库确认（防止token中的role过期）
-        user = db.get_user_by_id(request.current_user['user_id'])
-        if user:
-            role = user.get('role', 'user') or 'user'
+        # 再以数据库为准（防止token中的role过期）；角色缓存在修改角色时失效
+        db_role = db.auth_cache.get_role(request.current_user['user_id'], load_user_role)
+        if db_role is not None:
+            role = db_role
         
         if role != 'admin':
             return jsonify({'success': False, 'error': '需要管理员权限'}), 403
@@ -132,8 +278,8 @@ def require_admin(f):
 
 def convert_video_to_standard_format(input_video_path, output_video_path=None):
     """
-    将视频转换为标准格式（MP4 H.264），便于AI处理
-    注意：转换后的视频是临时文件，仅用于骨骼提取，提取完成后应删除
+    将视频转换为标准格式（MP4 H.264）
+    用于生成浏览器兼容的播放文件；骨骼提取直接读取原始文件，只有原始文件无法解码时才用它生成临时文件
     
     Args:
         input_video_path: 输入视频文件路径（原始文件，会保留）
@@ -147,18 +293,18 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
     try:
         # 检查输入文件是否存在
         if not os.path.exists(input_video_path):
-            print(f"[格式转换] 错误：输入文件不存在: {input_video_path}")
+            logger.error("[格式转换] 错误：输入文件不存在: %s", input_video_path)
             return None
         
         # 检查输入文件大小和权限
         try:
             input_size = os.path.getsize(input_video_path)
-            print(f"[格式转换] 输入文件大小: {input_size} 字节")
+            logger.debug("[格式转换] 输入文件大小: %s 字节", input_size)
             if input_size == 0:
-                print(f"[格式转换] 错误：输入文件为空")
+                logger.error("[格式转换] 错误：输入文件为空")
                 return None
         except Exception as size_error:
-            print(f"[格式转换] 警告：无法获取输入文件大小: {size_error}")
+            logger.warning("[格式转换] 警告：无法获取输入文件大小: %s", size_error)
         
         # 如果输出路径未指定，先自动生成
         if output_video_path is None:
@@ -167,16 +313,16 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
             video_name_without_ext = os.path.splitext(video_basename)[0]
             # 使用临时文件名，明确标识这是临时文件
             output_video_path = os.path.join(video_dir, f"{video_name_without_ext}_temp_for_pose_extraction.mp4")
-            print(f"[格式转换] 输出路径未指定，自动生成: {output_video_path}")
+            logger.debug("[格式转换] 输出路径未指定，自动生成: %s", output_video_path)
         
         # 检查输出目录是否存在和可写
         output_dir = os.path.dirname(output_video_path)
         if output_dir and not os.path.exists(output_dir):
             try:
                 os.makedirs(output_dir, exist_ok=True)
-                print(f"[格式转换] 已创建输出目录: {output_dir}")
+                logger.debug("[格式转换] 已创建输出目录: %s", output_dir)
             except Exception as dir_error:
-                print(f"[格式转换] 错误：无法创建输出目录: {dir_error}")
+                logger.error("[格式转换] 错误：无法创建输出目录: %s", dir_error)
                 return None
         
         # 检查文件扩展名，如果已经是mp4且可能是标准格式，先检查是否需要转换
@@ -187,118 +333,74 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
             try:
                 os.remove(output_video_path)
             except Exception as remove_error:
-                print(f"[格式转换] 警告：删除已存在的输出文件失败: {remove_error}")
+                logger.warning("[格式转换] 警告：删除已存在的输出文件失败: %s", remove_error)
         
-        print(f"[格式转换] 开始转换视频: {input_video_path} -> {output_video_path}")
+        logger.info("[格式转换] 开始转换视频: %s -> %s", input_video_path, output_video_path)
         
-        # 对于webm文件，添加额外的诊断信息
-        if input_ext == '.webm':
-            try:
-                # 检查webm文件的基本信息
-                probe_cmd = [
-                    'ffprobe', '-v', 'error',
-                    '-select_streams', 'v:0',
-                    '-show_entries', 'stream=codec_name,width,height,r_frame_rate',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    input_video_path
-                ]
-                probe_result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=10)
-                if probe_result.returncode == 0:
-                    print(f"[格式转换] webm文件信息: {probe_result.stdout.strip()}")
-                else:
-                    print(f"[格式转换] 警告：无法获取webm文件信息: {probe_result.stderr}")
-            except Exception as probe_error:
-                print(f"[格式转换] 警告：检查webm文件时出错: {probe_error}")
+        # 一次 ffprobe 读取编码格式、帧率和音频流信息（probe_media 结果有缓存，上传时通常已读取过）
+        media_info = probe_media(input_video_path)
+        video_stream = media_info['video'] if media_info else None
+        if video_stream:
+            logger.debug("[格式转换] 视频信息: %s, %s, %s, %sx%s, %.2f FPS", media_info['format_name'], video_stream['codec_name'],
+                         video_stream['pix_fmt'], video_stream['width'], video_stream['height'], video_stream['fps'])
+        else:
+            logger.warning("[格式转换] 警告：无法获取视频信息")
         
         # 检查ffmpeg是否可用
-        ffmpeg_available = False
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, timeout=5, check=True)
-            ffmpeg_available = True
-        except (FileNotFoundError, subprocess.TimeoutExpired, subprocess.CalledProcessError):
-            print(f"[格式转换] 警告：ffmpeg不可用，尝试使用原始文件")
+        ffmpeg_available = has_ffmpeg()
+        if not ffmpeg_available:
+            logger.warning("[格式转换] 警告：ffmpeg不可用，尝试使用原始文件")
             # 如果ffmpeg不可用，且输入文件已经是mp4，直接返回原文件路径
             if input_ext == '.mp4':
-                print(f"[格式转换] 输入文件已是mp4格式，跳过转换")
+                logger.info("[格式转换] 输入文件已是mp4格式，跳过转换")
                 return input_video_path
             else:
-                print(f"[格式转换] 错误：ffmpeg不可用且输入文件不是mp4格式")
+                logger.error("[格式转换] 错误：ffmpeg不可用且输入文件不是mp4格式")
                 return None
         
         # 对于mp4文件，检查是否已经是标准格式（H.264, yuv420p），如果是则跳过转换
-        if input_ext == '.mp4' and ffmpeg_available:
-            try:
-                # 使用ffprobe检查视频编码格式
-                probe_cmd = [
-                    'ffprobe', '-v', 'error',
-                    '-select_streams', 'v:0',
-                    '-show_entries', 'stream=codec_name,pix_fmt',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    input_video_path
-                ]
-                probe_result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=10)
-                if probe_result.returncode == 0:
-                    probe_output = probe_result.stdout.strip()
-                    codec_name = ''
-                    pix_fmt = ''
-                    for line in probe_output.split('\n'):
-                        line_lower = line.lower()
-                        if 'h264' in line_lower or 'avc' in line_lower:
-                            codec_name = 'h264'
-                        if 'yuv420p' in line_lower:
-                            pix_fmt = 'yuv420p'
-                    
-                    # 如果已经是H.264和yuv420p，可以直接使用原文件（不需要转换）
-                    if codec_name == 'h264' and pix_fmt == 'yuv420p':
-                        print(f"[格式转换] mp4文件已是标准格式(H.264, yuv420p)，跳过转换，直接使用原文件")
-                        # 如果输出路径是临时文件路径，直接复制原文件到临时路径
-                        if output_video_path and output_video_path != input_video_path:
-                            import shutil
-                            try:
-                                shutil.copy2(input_video_path, output_video_path)
-                                print(f"[格式转换] 已复制标准格式文件到临时路径: {output_video_path}")
-                                return output_video_path
-                            except Exception as copy_error:
-                                print(f"[格式转换] 警告：复制文件失败: {copy_error}，将进行转换")
-                                # 如果复制失败，继续转换流程
-                        else:
-                            return input_video_path
-                    else:
-                        print(f"[格式转换] mp4文件编码格式: {codec_name or '未知'}, 像素格式: {pix_fmt or '未知'}，需要转换")
-            except Exception as probe_error:
-                print(f"[格式转换] 警告：无法检查mp4文件格式: {probe_error}，将进行转换以确保兼容性")
+        if input_ext == '.mp4' and video_stream:
+            codec_name = video_stream['codec_name']
+            pix_fmt = video_stream['pix_fmt']
+            
+            # 如果已经是H.264和yuv420p，可以直接使用原文件（不需要转换）
+            if codec_name == 'h264' and pix_fmt == 'yuv420p':
+                logger.info("[格式转换] mp4文件已是标准格式(H.264, yuv420p)，跳过转换，直接使用原文件")
+                # 如果输出路径是临时文件路径，直接复制原文件到临时路径
+                if output_video_path and output_video_path != input_video_path:
+                    try:
+                        shutil.copy2(input_video_path, output_video_path)
+                        logger.info("[格式转换] 已复制标准格式文件到临时路径: %s", output_video_path)
+                        return output_video_path
+                    except Exception as copy_error:
+                        logger.warning("[格式转换] 警告：复制文件失败: %s，将进行转换", copy_error)
+                        # 如果复制失败，继续转换流程
+                else:
+                    return input_video_path
+            else:
+                logger.debug("[格式转换] mp4文件编码格式: %s, 像素格式: %s，需要转换", codec_name or '未知', pix_fmt or '未知')
         
         # 获取原始视频的帧率（重要：保持原始帧率，避免播放速度异常）
         try:
             original_fps = get_video_fps(input_video_path)
-            print(f"[格式转换] 原始视频帧率: {original_fps} FPS")
+            logger.debug("[格式转换] 原始视频帧率: %s FPS", original_fps)
         except Exception as fps_error:
-            print(f"[格式转换] 警告：无法获取原始帧率: {fps_error}，使用默认值30 FPS")
+            logger.warning("[格式转换] 警告：无法获取原始帧率: %s，使用默认值30 FPS", fps_error)
             original_fps = 30.0
         
         # 检查视频是否有音频流（对于webm等格式很重要）
-        has_audio = False
-        try:
-            check_audio_cmd = [
-                'ffprobe', '-v', 'error', '-select_streams', 'a:0',
-                '-show_entries', 'stream=codec_type', '-of', 'default=noprint_wrappers=1:nokey=1',
-                input_video_path
-            ]
-            audio_check = subprocess.run(check_audio_cmd, capture_output=True, text=True, timeout=10)
-            if audio_check.returncode == 0 and audio_check.stdout.strip() == 'audio':
-                has_audio = True
-                print(f"[格式转换] 检测到音频流")
-            else:
-                print(f"[格式转换] 未检测到音频流，将生成无音频版本")
-        except Exception as audio_check_error:
-            print(f"[格式转换] 警告：无法检查音频流: {audio_check_error}，假设有音频")
+        if media_info is None:
+            logger.warning("[格式转换] 警告：无法检查音频流，假设有音频")
             has_audio = True  # 默认假设有音频，如果转换失败再重试无音频版本
+        else:
+            has_audio = media_info['audio'] is not None
+            logger.debug("[格式转换] %s", '检测到音频流' if has_audio else '未检测到音频流，将生成无音频版本')
         
         # 使用ffmpeg转换为标准MP4 H.264格式
         # 参数说明：
         # -y: 覆盖输出文件
         # -i: 输入文件
-        # -c:v libx264: 使用H.264视频编码
+        # -c:v libx264: 使用H.264视频编码（libx264 不可用时使用 libopenh264，见 capabilities）
         # -r: 保持原始帧率（关键！避免播放速度异常）
         # -preset fast: 快速编码（平衡速度和质量）
         # -crf 23: 质量参数（18-28，值越小质量越高，23是默认值）
@@ -314,12 +416,12 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
             'ffmpeg', '-y',
             '-i', input_video_path,
             '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',  # 确保宽高都是2的倍数
-            '-c:v', 'libx264',  # 视频编码
+            '-c:v', h264_encoder(),  # 视频编码
             '-r', str(original_fps),  # 保持原始帧率（关键！）
             '-preset', 'fast',
             '-crf', '23',
             '-pix_fmt', 'yuv420p',
-            '-fps_mode', 'cfr',  # 恒定帧率模式（使用新的参数名，替代已弃用的-vsync）
+            *ffmpeg_frame_rate_args('cfr'),  # 恒定帧率模式（新版 ffmpeg 用 -fps_mode，旧版用 -vsync）
         ]
         
         # 根据是否有音频添加音频参数
@@ -335,30 +437,28 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
             output_video_path
         ])
         
-        print(f"[格式转换] 执行命令: {' '.join(cmd)}")
+        logger.debug("[格式转换] 执行命令: %s", ' '.join(cmd))
         # 使用更详细的错误处理
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600, check=False)  # 10分钟超时
+            with SUBPROCESS_SECONDS.time(tool='ffmpeg', purpose='transcode'):
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=600, check=False)  # 10分钟超时
         except subprocess.TimeoutExpired:
-            print(f"[格式转换] 错误：ffmpeg转换超时（超过10分钟）")
+            logger.error("[格式转换] 错误：ffmpeg转换超时（超过10分钟）")
             return None
         except Exception as e:
-            print(f"[格式转换] 错误：执行ffmpeg时发生异常: {str(e)}")
+            logger.error("[格式转换] 错误：执行ffmpeg时发生异常: %s", str(e))
             return None
         
         if result.returncode != 0:
-            print(f"[格式转换] 错误：ffmpeg转换失败 (返回码: {result.returncode})")
-            print(f"[格式转换] stderr完整输出:")
-            print(result.stderr)
-            print(f"[格式转换] stdout完整输出:")
-            print(result.stdout)
+            logger.error("[格式转换] 错误：ffmpeg转换失败 (返回码: %s)，stderr:\n%s", result.returncode, result.stderr)
+            logger.debug("[格式转换] stdout:\n%s", result.stdout)
             # 如果转换失败，且输入文件已经是mp4，返回原文件路径
             if input_ext == '.mp4':
-                print(f"[格式转换] 转换失败，但输入文件已是mp4格式，使用原文件")
+                logger.warning("[格式转换] 转换失败，但输入文件已是mp4格式，使用原文件")
                 return input_video_path
             # 对于webm等格式，如果转换失败，尝试使用更兼容的参数
             if input_ext in ['.webm', '.mkv', '.mov']:
-                print(f"[格式转换] 尝试使用更兼容的参数重新转换...")
+                logger.info("[格式转换] 尝试使用更兼容的参数重新转换...")
                 # 使用更简单的参数，避免可能的兼容性问题
                 # 使用更简单、更兼容的参数，明确映射视频流
                 # 注意：需要确保视频尺寸是2的倍数
@@ -367,54 +467,55 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
                     '-i', input_video_path,
                     '-map', '0:v:0',  # 明确映射第一个视频流（避免流选择问题）
                     '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',  # 确保宽高都是2的倍数
-                    '-c:v', 'libx264',
+                    '-c:v', h264_encoder(),
                     '-r', str(original_fps),
                     '-preset', 'ultrafast',  # 使用最快预设，减少资源消耗
                     '-crf', '23',
                     '-pix_fmt', 'yuv420p',
-                    '-fps_mode', 'cfr',  # 恒定帧率模式（使用新的参数名）
+                    *ffmpeg_frame_rate_args('cfr'),  # 恒定帧率模式
                     '-an',  # 跳过音频
                     '-movflags', '+faststart',
                     '-avoid_negative_ts', 'make_zero',
                     '-threads', '2',  # 限制线程数
                     output_video_path
                 ]
-                print(f"[格式转换] 执行命令（fallback）: {' '.join(cmd_fallback)}")
+                logger.debug("[格式转换] 执行命令（fallback）: %s", ' '.join(cmd_fallback))
                 try:
-                    result_fallback = subprocess.run(cmd_fallback, capture_output=True, text=True, timeout=600, check=False)
+                    with SUBPROCESS_SECONDS.time(tool='ffmpeg', purpose='transcode'):
+                        result_fallback = subprocess.run(cmd_fallback, capture_output=True, text=True, timeout=600, check=False)
                     if result_fallback.returncode == 0:
                         if os.path.exists(output_video_path):
                             output_size = os.path.getsize(output_video_path)
                             if output_size > 0:
-                                print(f"[格式转换] 转换成功（fallback）: {output_video_path} (大小: {output_size} 字节)")
+                                logger.info("[格式转换] 转换成功（fallback）: %s (大小: %s 字节)", output_video_path, output_size)
                                 return output_video_path
                             else:
-                                print(f"[格式转换] 错误：输出文件为空（fallback版本）")
+                                logger.error("[格式转换] 错误：输出文件为空（fallback版本）")
                         else:
-                            print(f"[格式转换] 错误：输出文件未生成（fallback版本）")
+                            logger.error("[格式转换] 错误：输出文件未生成（fallback版本）")
                     else:
-                        print(f"[格式转换] fallback版本转换也失败 (返回码: {result_fallback.returncode})")
+                        logger.error("[格式转换] fallback版本转换也失败 (返回码: %s)", result_fallback.returncode)
                         # 只显示错误信息的关键部分，避免日志过长
                         stderr_lines = result_fallback.stderr.split('\n')
                         error_lines = [line for line in stderr_lines if 'error' in line.lower() or 'failed' in line.lower() or 'invalid' in line.lower()]
                         if error_lines:
-                            print(f"[格式转换] 关键错误信息: {error_lines[:5]}")  # 只显示前5行错误
+                            logger.error("[格式转换] 关键错误信息: %s", error_lines[:5])  # 只显示前5行错误
                         else:
-                            print(f"[格式转换] stderr前500字符: {result_fallback.stderr[:500]}")
+                            logger.error("[格式转换] stderr前500字符: %s", result_fallback.stderr[:500])
                 except Exception as fallback_error:
-                    print(f"[格式转换] fallback转换时发生异常: {str(fallback_error)}")
+                    logger.error("[格式转换] fallback转换时发生异常: %s", str(fallback_error))
             return None
         
         # 验证输出文件
         if not os.path.exists(output_video_path):
-            print(f"[格式转换] 错误：输出文件未生成: {output_video_path}")
+            logger.error("[格式转换] 错误：输出文件未生成: %s", output_video_path)
             if input_ext == '.mp4':
                 return input_video_path
             return None
         
         output_size = os.path.getsize(output_video_path)
         if output_size == 0:
-            print(f"[格式转换] 错误：输出文件为空")
+            logger.error("[格式转换] 错误：输出文件为空")
             os.remove(output_video_path)
             if input_ext == '.mp4':
                 return input_video_path
@@ -423,7 +524,7 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
         # 验证视频文件是否可以正常打开
         cap = cv2.VideoCapture(output_video_path)
         if not cap.isOpened():
-            print(f"[格式转换] 警告：转换后的视频无法用OpenCV打开")
+            logger.warning("[格式转换] 警告：转换后的视频无法用OpenCV打开")
             cap.release()
             if input_ext == '.mp4':
                 return input_video_path
@@ -432,27 +533,25 @@ def convert_video_to_standard_format(input_video_path, output_video_path=None):
         ret, frame = cap.read()
         cap.release()
         if not ret or frame is None:
-            print(f"[格式转换] 警告：转换后的视频无法读取帧")
+            logger.warning("[格式转换] 警告：转换后的视频无法读取帧")
             if input_ext == '.mp4':
                 return input_video_path
             return None
         
-        print(f"[格式转换] 转换成功: {output_video_path} (大小: {output_size} 字节)")
-        print(f"[格式转换] 注意：转换后的文件是临时文件，仅用于骨骼提取，提取完成后应删除")
+        logger.info("[格式转换] 转换成功: %s (大小: %s 字节)", output_video_path, output_size)
         
-        # 原始文件保留，用于播放
+        # 原始文件保留
         return output_video_path
         
     except subprocess.TimeoutExpired:
-        print(f"[格式转换] 错误：转换超时")
+        logger.error("[格式转换] 错误：转换超时")
         # 如果转换超时，且输入文件已经是mp4，返回原文件路径
         input_ext = os.path.splitext(input_video_path)[1].lower()
         if input_ext == '.mp4':
             return input_video_path
         return None
     except Exception as e:
-        print(f"[格式转换] 错误：转换失败: {str(e)}")
-        traceback.print_exc()
+        logger.exception("[格式转换] 错误：转换失败: %s", str(e))
         # 如果转换失败，且输入文件已经是mp4，返回原文件路径
         input_ext = os.path.splitext(input_video_path)[1].lower()
         if input_ext == '.mp4':
@@ -478,7 +577,7 @@ def generate_video_thumbnail(video_path, thumbnail_folder='thumbnails'):
         # 打开视频
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
-            print(f"无法打开视频: {video_path}")
+            logger.warning("无法打开视频: %s", video_path)
             return None
         
         # 获取视频信息
@@ -496,7 +595,7 @@ def generate_video_thumbnail(video_path, thumbnail_folder='thumbnails'):
         cap.release()
         
         if not ret or frame is None:
-            print(f"无法读取视频帧: {video_path}")
+            logger.warning("无法读取视频帧: %s", video_path)
             return None
         
         # 生成缩略图文件名（使用视频文件名 + _thumb.jpg）
@@ -517,97 +616,211 @@ def generate_video_thumbnail(video_path, thumbnail_folder='thumbnails'):
         
         # 保存缩略图
         cv2.imwrite(thumbnail_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        print(f"缩略图生成成功: {thumbnail_path}")
+        logger.info("缩略图生成成功: %s", thumbnail_path)
         
         return thumbnail_path
         
     except Exception as e:
-        print(f"生成缩略图失败: {str(e)}")
-        traceback.print_exc()
+        logger.exception("生成缩略图失败: %s", str(e))
         return None
 
 def async_extract_poses_and_generate_video(task_id, video_id, original_filepath, video_type='reference'):
-    """异步提取骨骼数据并生成标记骨骼视频"""
-    converted_video_path = None  # 转换后的临时文件路径
+    """异步提取骨骼数据并生成标记骨骼视频（失败时抛出异常，由任务队列标记 failed）"""
     try:
-        print(f"[任务 {task_id}] 开始处理视频 {video_id}")
+        logger.info("[任务 %s] 开始处理视频 %s", task_id, video_id)
         
         # 更新任务状态为处理中
         db.update_task_status(task_id, 'processing', progress=10)
         
-        # 转换为标准格式（临时文件，仅用于骨骼提取）
-        print(f"[任务 {task_id}] 转换视频格式用于骨骼提取...")
-        converted_video_path = convert_video_to_standard_format(original_filepath)
-        if converted_video_path is None:
-            print(f"[任务 {task_id}] 警告：格式转换失败，使用原始文件")
-            converted_video_path = original_filepath
-        elif converted_video_path != original_filepath:
-            print(f"[任务 {task_id}] 格式转换成功: {converted_video_path}")
-        
-        # 提取骨骼数据（使用转换后的临时视频）
-        print(f"[任务 {task_id}] 正在提取骨骼数据...")
-        poses_data = extract_poses_from_video(converted_video_path, n=5)
+        # 直接从原始文件提取骨骼数据（原始文件无法解码时才会临时转码）
+        logger.debug("[任务 %s] 正在提取骨骼数据...", task_id)
+        poses_data = extract_poses_with_transcode_fallback(original_filepath, n=5)
         
         db.update_task_status(task_id, 'processing', progress=50)
-        print(f"[任务 {task_id}] 提取到 {len(poses_data)} 帧骨骼数据")
+        logger.info("[任务 %s] 提取到 %s 帧骨骼数据", task_id, len(poses_data))
         
         # 批量保存骨骼数据到数据库（性能优化）
-        print(f"[任务 {task_id}] 正在保存骨骼数据到数据库...")
+        logger.debug("[任务 %s] 正在保存骨骼数据到数据库...", task_id)
         db.update_task_status(task_id, 'processing', progress=55)
         
         # 使用批量保存方法，一次性保存所有数据
-        db.save_pose_data_batch(video_id, video_type, poses_data)
+        with POSE_STAGE_SECONDS.time(stage='db_save'):
+            db.save_pose_data_batch(video_id, video_type, poses_data)
         
         # 更新姿势数据状态
         db.update_pose_extraction_status(video_id, True, video_type)
         
         db.update_task_status(task_id, 'processing', progress=65)
-        print(f"[任务 {task_id}] 骨骼数据已保存到数据库")
+        logger.info("[任务 %s] 骨骼数据已保存到数据库", task_id)
         
         # 前端用 Canvas 实时绘制骨骼，不再生成带绿线的骨骼标注视频（节省 10-20 秒 + 磁盘空间）
         db.update_task_status(task_id, 'processing', progress=90)
 
-        # 任务完成
-        db.update_task_status(task_id, 'completed', progress=100)
-        print(f"[任务 {task_id}] 处理完成")
+        # 任务完成（由任务队列标记 completed）
+        logger.info("[任务 %s] 处理完成", task_id)
         
     except Exception as e:
-        error_msg = f"处理失败: {str(e)}\n{traceback.format_exc()}"
-        print(f"[任务 {task_id}] {error_msg}")
-        db.update_task_status(task_id, 'failed', error_message=error_msg)
+        logger.error("[任务 %s] 处理失败: %s", task_id, str(e))
+        raise
+
+
+def extract_user_video_poses(user_video_id, original_user_path):
+    """后台任务：提取用户视频的骨骼数据（进度和结果记录在 user_videos 表中）"""
+    extraction_error = None
+    try:
+        logger.info("[后台任务] 开始提取用户视频 %s 的骨骼数据...", user_video_id)
+        
+        # 更新进度：开始处理
+        db.update_pose_extraction_progress(user_video_id, 10)
+        
+        # 直接从原始文件提取骨骼数据（原始文件无法解码时才会临时转码）
+        user_poses = extract_poses_with_transcode_fallback(original_user_path, n=5, early_stop_threshold=50)
+        
+        # 更新进度：提取完成
+        db.update_pose_extraction_progress(user_video_id, 60)
+        
+        # 检查是否提取到有效的骨骼数据
+        valid_poses = sum(1 for pose in user_poses.values() if pose is not None)
+        total_frames = len(user_poses)
+        
+        logger.debug("[后台任务] 提取结果：total_frames=%s, valid_poses=%s", total_frames, valid_poses)
+        
+        if total_frames == 0:
+            extraction_error = "视频处理失败：无法读取视频帧"
+            logger.error("[后台任务] 错误：%s", extraction_error)
+        elif valid_poses == 0:
+            extraction_error = "视频中未检测到任何人像骨骼数据，请确保视频中有清晰的人物动作"
+            logger.warning("[后台任务] 警告：%s", extraction_error)
+        else:
+            logger.info("[后台任务] 提取到 %s/%s 帧有效骨骼数据", valid_poses, total_frames)
+        
+        # 更新进度：保存数据
+        db.update_pose_extraction_progress(user_video_id, 80)
+        
+        # 保存用户视频骨骼数据到数据库（使用批量保存优化性能）
+        try:
+            if total_frames > 0:
+                # 使用批量保存方法（跳过None值）
+                with POSE_STAGE_SECONDS.time(stage='db_save'):
+                    save_result = db.save_pose_data_batch(user_video_id, 'user', user_poses)
+                if save_result:
+                    logger.debug("[后台任务] 批量保存骨骼数据成功")
+                else:
+                    logger.warning("[后台任务] 警告：批量保存骨骼数据失败，但继续处理")
+        except Exception as save_error:
+            logger.error("[后台任务] 保存数据异常: %s", save_error)
+            # 不设置extraction_error，允许继续标记完成
+        
+        # 更新进度：完成
+        db.update_pose_extraction_progress(user_video_id, 100)
+        
+        # 标记骨骼数据已提取（记录错误信息）
+        db.update_pose_extraction_status(user_video_id, True, 'user', extraction_error)
+        
+        if extraction_error:
+            logger.warning("[后台任务] 用户视频 %s 处理完成但有警告: %s", user_video_id, extraction_error)
+        else:
+            logger.info("[后台任务] 用户视频 %s 骨骼数据提取完成", user_video_id)
+            
+    except Exception as e:
+        extraction_error = f"处理失败: {str(e)}"
+        logger.error("[后台任务] 提取骨骼数据失败: %s", extraction_error)
+        
+        # 标记为已提取（失败状态），记录错误信息
+        try:
+            db.update_pose_extraction_status(user_video_id, True, 'user', extraction_error)
+            db.update_pose_extraction_progress(user_video_id, 100)
+            logger.info("[后台任务] 已标记视频 %s 为提取完成（失败）", user_video_id)
+        except Exception as update_error:
+            logger.error("[后台任务] 更新状态失败: %s", str(update_error))
+        raise
+
+def extract_poses_with_transcode_fallback(video_path, **kwargs):
+    """直接从原始文件提取骨骼数据（ffmpeg / OpenCV 都能直接读取 mp4、webm、mov 等格式）
+    
+    一帧都读不出来时，才把视频转码为标准 MP4 临时文件再提取一次，提取后删除临时文件。
+    """
+    poses_data = extract_poses_from_video(video_path, **kwargs)
+    if poses_data:
+        return poses_data
+    
+    logger.info("[提取骨骼] 原始文件无法读取视频帧，转码后重试: %s", video_path)
+    with POSE_STAGE_SECONDS.time(stage='transcode'):
+        converted_video_path = convert_video_to_standard_format(video_path)
+    if not converted_video_path or converted_video_path == video_path:
+        return poses_data
+    try:
+        return extract_poses_from_video(converted_video_path, **kwargs)
     finally:
-        # 确保删除转换后的临时文件（如果存在且不是原始文件）
-        if converted_video_path and converted_video_path != original_filepath and os.path.exists(converted_video_path):
-            try:
-                os.remove(converted_video_path)
-                print(f"[任务 {task_id}] 已删除临时转换文件: {converted_video_path}")
-            except Exception as delete_error:
-                print(f"[任务 {task_id}] 警告：删除临时转换文件失败: {delete_error}")
+        try:
+            os.remove(converted_video_path)
+            logger.debug("[提取骨骼] 已删除临时转换文件: %s", converted_video_path)
+        except OSError as delete_error:
+            logger.warning("[提取骨骼] 警告：删除临时转换文件失败: %s", delete_error)
+
+def is_browser_playable(video_path):
+    """原始文件能否直接在浏览器中播放（MP4 容器 + H.264 + yuv420p）"""
+    if os.path.splitext(video_path)[1].lower() != '.mp4':
+        return False
+    stream = probe_video_stream(video_path)
+    return bool(stream) and stream['codec_name'] == 'h264' and stream['pix_fmt'] == 'yuv420p'
+
+def load_media_info(video_id, video_type, file_path):
+    """读取视频的媒体信息：文件未变化时直接使用上传时保存在数据库中的结果，否则重新 probe 并保存"""
+    video = db.get_video_by_id(video_id, video_type)
+    if video and video.get('media_info'):
+        try:
+            if remember_media_info(file_path, json.loads(video['media_info'])):
+                return probe_media(file_path)
+        except ValueError:
+            pass
+    media_info = probe_media(file_path)
+    if video and media_info:
+        db.update_media_info(video_id, media_info, video_type)
+    return media_info
+
+def run_playback_transcode_task(task):
+    """任务队列处理函数：为浏览器无法直接播放的视频生成 H.264 MP4 播放文件（低优先级，不影响骨骼提取）"""
+    video_id, video_type = task['video_id'], task['video_type']
+    file_path = task['payload']['file_path']
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"视频文件不存在: {file_path}")
+    load_media_info(video_id, video_type, file_path)
+    if is_browser_playable(file_path):
+        logger.info("[播放转码] 视频 %s 已是标准格式，直接播放原始文件", video_id)
+        return
+    
+    playback_path = f"{os.path.splitext(file_path)[0]}_playback.mp4"
+    converted_path = convert_video_to_standard_format(file_path, playback_path)
+    if converted_path != playback_path:
+        raise RuntimeError(f"播放文件转码失败: {file_path}")
+    if not db.update_playback_path(video_id, playback_path, video_type):
+        raise RuntimeError(f"保存播放文件路径失败: {video_id}")
+    logger.info("[播放转码] 视频 %s 播放文件已生成: %s", video_id, playback_path)
+
+def run_pose_extraction_task(task):
+    """任务队列处理函数：按视频类型执行骨骼提取"""
+    file_path = task['payload']['file_path']
+    with POSE_STAGE_SECONDS.time(stage='probe'):
+        load_media_info(task['video_id'], task['video_type'], file_path)
+    if task['video_type'] == 'user':
+        extract_user_video_poses(task['video_id'], file_path)
+    else:
+        async_extract_poses_and_generate_video(task['task_id'], task['video_id'], file_path, task['video_type'])
 
+# 后台任务队列（替代每次上传都新开线程）：全局并发上限 + 优先级 + 重启恢复
+task_queue = TaskQueue(db)
+task_queue.register('pose_extraction', run_pose_extraction_task)
+task_queue.register('playback_transcode', run_playback_transcode_task)
 
 
 def get_video_duration(video_file):
-    """获取视频时长（秒）- 优先使用 ffprobe，回退到 OpenCV"""
-    import subprocess
-    import json
-    
+    """获取视频时长（秒）- 优先使用 ffprobe（probe_media，结果有缓存），回退到 OpenCV"""
     # 首先尝试使用 ffprobe（对 webm 格式更可靠）
-    try:
-        cmd = [
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'json',
-            video_file
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            duration = float(data.get('format', {}).get('duration', 0))
-            if duration > 0:
-                print(f"使用 ffprobe 获取视频时长: {duration:.2f}秒")
-                return duration
-    except (FileNotFoundError, json.JSONDecodeError, ValueError, subprocess.TimeoutExpired) as e:
-        print(f"ffprobe 获取时长失败，使用 OpenCV: {e}")
+    media_info = probe_media(video_file)
+    if media_info and media_info['duration'] > 0:
+        logger.debug("使用 ffprobe 获取视频时长: %.2f秒", media_info['duration'])
+        return media_info['duration']
     
     # 回退到 OpenCV 方法
     cap = cv2.VideoCapture(video_file)
@@ -620,7 +833,7 @@ def get_video_duration(video_file):
         
         # 如果 OpenCV 无法获取有效信息，尝试通过实际读取帧来计算
         if fps <= 0 or frame_count <= 0 or frame_count > 100000000:
-            print(f"警告：OpenCV 无法获取有效信息 (fps={fps}, frames={frame_count})，尝试实际读取")
+            logger.warning("警告：OpenCV 无法获取有效信息 (fps=%s, frames=%s)，尝试实际读取", fps, frame_count)
             # 通过实际读取帧来计算时长
             frame_count = 0
             while True:
@@ -641,39 +854,19 @@ def get_video_duration(video_file):
             raise ValueError("无法获取视频帧数")
         
         duration = frame_count / fps
-        print(f"使用 OpenCV 获取视频时长: {duration:.2f}秒 (frames={frame_count}, fps={fps})")
+        logger.debug("使用 OpenCV 获取视频时长: %.2f秒 (frames=%s, fps=%s)", duration, frame_count, fps)
         return duration
     finally:
         cap.release()
 
 def get_video_fps(video_file):
-    """获取视频帧率 - 优先使用 ffprobe，回退到 OpenCV"""
-    import subprocess
-    import json
-    
+    """获取视频帧率 - 优先使用 ffprobe（probe_media，结果有缓存），回退到 OpenCV"""
     # 首先尝试使用 ffprobe（对 webm 格式更可靠）
-    try:
-        cmd = [
-            'ffprobe', '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=r_frame_rate',
-            '-of', 'json',
-            video_file
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            streams = data.get('streams', [])
-            if streams:
-                frame_rate_str = streams[0].get('r_frame_rate', '')
-                if frame_rate_str and '/' in frame_rate_str:
-                    num, den = map(int, frame_rate_str.split('/'))
-                    if den > 0:
-                        fps = num / den
-                        print(f"使用 ffprobe 获取视频帧率: {fps:.2f} FPS")
-                        return fps
-    except (FileNotFoundError, json.JSONDecodeError, ValueError, subprocess.TimeoutExpired, IndexError, ZeroDivisionError, KeyError) as e:
-        print(f"ffprobe 获取帧率失败，使用 OpenCV: {e}")
+    media_info = probe_media(video_file)
+    if media_info and media_info['video'] and media_info['video']['fps'] > 0:
+        fps = media_info['video']['fps']
+        logger.debug("使用 ffprobe 获取视频帧率: %.2f FPS", fps)
+        return fps
     
     # 回退到 OpenCV 方法
     cap = cv2.VideoCapture(video_file)
@@ -684,67 +877,37 @@ def get_video_fps(video_file):
         fps = cap.get(cv2.CAP_PROP_FPS)
         if fps <= 0:
             fps = 30.0  # 默认帧率
-        print(f"使用 OpenCV 获取视频帧率: {fps:.2f} FPS")
+        logger.debug("使用 OpenCV 获取视频帧率: %.2f FPS", fps)
         return fps
     finally:
         cap.release()
 
-def _pose_worker(args):
-    """多进程并行提取骨骼数据的 worker（处理一段视频）"""
-    video_file, start_frame, end_frame, n, max_side, selected_landmarks_list = args
-    import cv2 as _cv2
-    import mediapipe as _mp
-
-    selected_set = set(selected_landmarks_list)
-    cap = _cv2.VideoCapture(video_file)
-    if not cap.isOpened():
-        return {}
-
-    src_width = int(cap.get(_cv2.CAP_PROP_FRAME_WIDTH))
-    src_height = int(cap.get(_cv2.CAP_PROP_FRAME_HEIGHT))
-    scale = min(1.0, max_side / max(src_width, src_height)) if max(src_width, src_height) > 0 else 1.0
-    target_size = (int(src_width * scale), int(src_height * scale)) if scale < 1.0 else None
-
-    # 跳到起始帧（grab 不解码，更快）
-    for _ in range(start_frame):
-        if not cap.grab():
-            cap.release()
-            return {}
-
-    poses_data = {}
-    frame_idx = start_frame
-    mp_pose = _mp.solutions.pose
-    with mp_pose.Pose(
-        static_image_mode=False,
-        model_complexity=0,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5,
-    ) as pose:
-        while frame_idx < end_frame:
-            if frame_idx % n == 0:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                if target_size is not None:
-                    frame = _cv2.resize(frame, target_size, interpolation=_cv2.INTER_LINEAR)
-                image_rgb = _cv2.cvtColor(frame, _cv2.COLOR_BGR2RGB)
-                image_rgb.flags.writeable = False
-                results = pose.process(image_rgb)
-                if results.pose_landmarks:
-                    poses_data[frame_idx] = [
-                        [lm.x, lm.y, lm.z, lm.visibility]
-                        for i, lm in enumerate(results.pose_landmarks.landmark)
-                        if i in selected_set
-                    ]
-                else:
-                    poses_data[frame_idx] = None
-            else:
-                if not cap.grab():
-                    break
-            frame_idx += 1
-    cap.release()
-    return poses_data
-
+def get_video_frame_info(video_file):
+    """获取视频总帧数和分辨率 - 优先使用 ffprobe（probe_media，结果有缓存），回退到 OpenCV
+    
+    webm 等容器通常不记录帧数（nb_frames 为 0，OpenCV 的 CAP_PROP_FRAME_COUNT 也是 0 或负数），
+    此时按 时长×帧率 估算。
+    
+    Returns:
+        (total_frames, width, height)：无法获取帧数时 total_frames 为 0
+    """
+    media_info = probe_media(video_file)
+    video = media_info['video'] if media_info else None
+    if video:
+        total_frames = video['nb_frames']
+        if total_frames <= 0 and media_info['duration'] > 0 and video['fps'] > 0:
+            total_frames = int(round(media_info['duration'] * video['fps']))
+        if total_frames > 0:
+            return total_frames, video['width'], video['height']
+    
+    # 回退到 OpenCV 方法
+    cap = cv2.VideoCapture(video_file)
+    try:
+        return (max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))),
+                int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
 
 def extract_poses_from_video(video_file, n=5, early_stop_threshold=50, num_workers=None):
     """
@@ -755,6 +918,7 @@ def extract_poses_from_video(video_file, n=5, early_stop_threshold=50, num_worke
         n: 每隔n帧提取一次
         early_stop_threshold: 如果连续N帧都没有检测到人像，提前终止（0表示不提前终止）
         num_workers: 并行进程数；None=自动（min(4, CPU核数)），1=单进程（关闭并行）
+                     并行方式由 POSE_EXTRACTION_MODE 决定（pipeline 单解码流水线 / chunked 按帧数切段）
     
     Returns:
         dict: 帧索引到骨骼数据的映射，无骨骼时存储None
@@ -777,11 +941,7 @@ def extract_poses_from_video(video_file, n=5, early_stop_threshold=50, num_worke
     ]
 
     # 先获取视频帧数决定并行策略
-    cap_info = cv2.VideoCapture(video_file)
-    total_frames = int(cap_info.get(cv2.CAP_PROP_FRAME_COUNT))
-    src_width = int(cap_info.get(cv2.CAP_PROP_FRAME_WIDTH))
-    src_height = int(cap_info.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    cap_info.release()
+    total_frames, src_width, src_height = get_video_frame_info(video_file)
 
     MAX_SIDE = 480
 
@@ -791,46 +951,75 @@ def extract_poses_from_video(video_file, n=5, early_stop_threshold=50, num_worke
         if total_frames <= 0 or total_frames < 300:  # 少于 300 帧（约 10 秒）走单进程
             num_workers = 1
         else:
-            num_workers = min(4, max(1, cpu_count - 1))
+            num_workers = min(max(1, cpu_count - 1), POSE_WORKER_PROCESSES)
 
-    print(f"[提取骨骼] 总帧数={total_frames}, 原始分辨率={src_width}x{src_height}, 步长={n}, 并行进程={num_workers}")
+    logger.debug("[提取骨骼] 总帧数=%s, 原始分辨率=%sx%s, 步长=%s, 并行进程=%s", total_frames, src_width, src_height, n, num_workers)
 
     # 单进程：保留 early_stop 能力（多进程切段后无意义，因此并行模式不再启用早停）
     if num_workers <= 1 or total_frames <= 0:
         return _extract_poses_single_process(
             video_file, n, early_stop_threshold, selected_landmarks, MAX_SIDE
         )
+    
+    # 流水线：单线程解码采样帧，经共享内存交给常驻 worker 推理（整段视频只解码一遍）
+    if POSE_EXTRACTION_MODE == 'pipeline':
+        try:
+            source = open_frame_source(video_file, n, MAX_SIDE)
+            try:
+                poses_data = extract_poses_pipelined(source, pose_worker_pool, selected_landmarks)
+            finally:
+                source.close()
+        except Exception as e:
+            logger.warning("[提取骨骼] 流水线执行失败，回退到单进程: %s", e)
+            return _extract_poses_single_process(
+                video_file, n, early_stop_threshold, selected_landmarks, MAX_SIDE
+            )
+        
+        valid_poses = sum(1 for p in poses_data.values() if p is not None)
+        logger.info("[提取骨骼] 共处理 %s 帧，有效骨骼数据 %s 帧（流水线）", len(poses_data), valid_poses)
+        return poses_data
 
-    # 多进程：把视频按帧数等分给若干 worker
-    # 使用 spawn 启动方式（兼容 macOS / Linux），避免 mediapipe fork 问题
-    import multiprocessing as mp_proc
-    try:
-        ctx = mp_proc.get_context('spawn')
-    except Exception:
-        ctx = mp_proc
-
-    chunk_size = (total_frames + num_workers - 1) // num_workers
+    # 多进程：把视频按帧数切段分给若干 worker
+    # 有关键帧索引时每段直接跳到关键帧开始解码（启动代价只有一个 GOP），worker 数可以超过 4
+    keyframes = probe_keyframes(video_file)
     tasks = []
-    for i in range(num_workers):
-        start = i * chunk_size
-        end = min(total_frames, (i + 1) * chunk_size)
-        if start >= end:
-            continue
-        tasks.append((video_file, start, end, n, MAX_SIDE, selected_landmarks))
+    if keyframes:
+        for seek, start, end in plan_keyframe_chunks(total_frames, keyframes, num_workers, n):
+            tasks.append((video_file, start, end, n, MAX_SIDE, selected_landmarks, seek))
+        logger.debug("[提取骨骼] 按 %s 个关键帧切分为 %s 段", len(keyframes), len(tasks))
+    else:
+        # 没有关键帧索引时每段都要从第 0 帧顺序 grab，段数越多重复解码越多
+        num_workers = min(num_workers, 4)
+        chunk_size = (total_frames + num_workers - 1) // num_workers
+        for i in range(num_workers):
+            start = i * chunk_size
+            end = min(total_frames, (i + 1) * chunk_size)
+            if start >= end:
+                continue
+            tasks.append((video_file, start, end, n, MAX_SIDE, selected_landmarks))
+    # 帧数可能是按时长×帧率估算的，最后一段不设上限，读到视频结尾为止（worker 读帧失败即停止）
+    if tasks:
+        tasks[-1] = tasks[-1][:2] + (sys.maxsize,) + tasks[-1][3:]
 
     poses_data = {}
+    decode_seconds = inference_seconds = 0.0
     try:
-        with ctx.Pool(processes=len(tasks)) as pool:
-            for partial in pool.imap_unordered(_pose_worker, tasks):
-                poses_data.update(partial)
+        # 所有任务共用常驻的预热进程池，同时提取多个视频时进程总数也不超过 POSE_WORKER_PROCESSES
+        for partial, stats in pose_worker_pool.imap_unordered(tasks):
+            poses_data.update(partial)
+            # 每段的解码和推理在同一个 worker 中交替进行，推理以外的时间都算作解码
+            inference_seconds += stats['inference_seconds']
+            decode_seconds += stats['busy_seconds'] - stats['inference_seconds']
     except Exception as e:
-        print(f"[提取骨骼] 并行执行失败，回退到单进程: {e}")
+        logger.warning("[提取骨骼] 并行执行失败，回退到单进程: %s", e)
         return _extract_poses_single_process(
             video_file, n, early_stop_threshold, selected_landmarks, MAX_SIDE
         )
 
+    POSE_STAGE_SECONDS.observe(decode_seconds, stage='decode')
+    POSE_STAGE_SECONDS.observe(inference_seconds, stage='inference')
     valid_poses = sum(1 for p in poses_data.values() if p is not None)
-    print(f"[提取骨骼] 共处理 {len(poses_data)} 帧，有效骨骼数据 {valid_poses} 帧（并行）")
+    logger.info("[提取骨骼] 共处理 %s 帧，有效骨骼数据 %s 帧（并行）", len(poses_data), valid_poses)
     return poses_data
 
 
@@ -838,15 +1027,11 @@ def _extract_poses_single_process(video_file, n, early_stop_threshold, selected_
     """单进程版骨骼提取（支持早停，作为短视频/回退方案）"""
     selected_landmarks_set = set(selected_landmarks)
     mp_pose = mp.solutions.pose
-    cap = cv2.VideoCapture(video_file)
-    src_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    src_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    scale = min(1.0, max_side / max(src_width, src_height)) if max(src_width, src_height) > 0 else 1.0
-    target_size = (int(src_width * scale), int(src_height * scale)) if scale < 1.0 else None
 
     poses_data = {}
     consecutive_no_pose = 0
-    frame_idx = 0
+    started = time.perf_counter()
+    inference_seconds = 0.0
 
     with mp_pose.Pose(
         static_image_mode=False,
@@ -854,16 +1039,14 @@ def _extract_poses_single_process(video_file, n, early_stop_threshold, selected_
         min_detection_confidence=0.5,
         min_tracking_confidence=0.5,
     ) as pose:
-        while True:
-            if frame_idx % n == 0:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                if target_size is not None:
-                    frame = cv2.resize(frame, target_size, interpolation=cv2.INTER_LINEAR)
-                image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # 采样帧已经缩放并转为 RGB（ffmpeg 滤镜或 OpenCV，见 pose_pipeline.open_frame_source）
+        frames = iter_sampled_frames(video_file, n, max_side)
+        try:
+            for frame_idx, image_rgb in frames:
                 image_rgb.flags.writeable = False
+                inference_started = time.perf_counter()
                 results = pose.process(image_rgb)
+                inference_seconds += time.perf_counter() - inference_started
                 if results.pose_landmarks:
                     poses_data[frame_idx] = [
                         [lm.x, lm.y, lm.z, lm.visibility]
@@ -874,16 +1057,22 @@ def _extract_poses_single_process(video_file, n, early_stop_threshold, selected_
                 else:
                     poses_data[frame_idx] = None
                     consecutive_no_pose += 1
+                    logger.debug("[提取骨骼] 第 %s 帧未检测到人像", frame_idx, extra=sampled(50))
                     if early_stop_threshold > 0 and consecutive_no_pose >= early_stop_threshold:
-                        print(f"[提取骨骼] 连续 {consecutive_no_pose} 帧未检测到人像，提前终止提取")
+                        logger.info("[提取骨骼] 连续 %s 帧未检测到人像，提前终止提取", consecutive_no_pose)
                         break
-            else:
-                if not cap.grab():
-                    break
-            frame_idx += 1
-    cap.release()
+        except IOError as e:
+            # 一帧都没读出来时返回空结果（由调用方转码后重试）；中途解码失败时不能把截断的结果当作完整视频
+            if poses_data:
+                raise
+            logger.error("[提取骨骼] 读取视频失败: %s", e)
+        finally:
+            frames.close()
+    # 解码和推理在同一个线程中交替进行，推理以外的时间都算作解码
+    POSE_STAGE_SECONDS.observe(time.perf_counter() - started - inference_seconds, stage='decode')
+    POSE_STAGE_SECONDS.observe(inference_seconds, stage='inference')
     valid_poses = sum(1 for p in poses_data.values() if p is not None)
-    print(f"[提取骨骼] 共处理 {len(poses_data)} 帧，有效骨骼数据 {valid_poses} 帧（单进程）")
+    logger.info("[提取骨骼] 共处理 %s 帧，有效骨骼数据 %s 帧（单进程）", len(poses_data), valid_poses)
     return poses_data
 
 def generate_pose_video(video_file, output_file, n=5, poses_data=None):
@@ -927,28 +1116,28 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
         # 这对于某些格式（如 webm）的原始视频特别重要
         try:
             fps = get_video_fps(video_file)
-            print(f"[生成骨骼视频] 使用 get_video_fps 获取帧率: {fps:.2f} FPS")
+            logger.debug("[生成骨骼视频] 使用 get_video_fps 获取帧率: %.2f FPS", fps)
             # 验证 FPS 是否合理
             import math
             if fps <= 0 or fps > 120:
-                print(f"[生成骨骼视频] 警告：检测到的帧率异常 ({fps} FPS)，使用 OpenCV 重新检测")
+                logger.warning("[生成骨骼视频] 警告：检测到的帧率异常 (%s FPS)，使用 OpenCV 重新检测", fps)
                 raise ValueError(f"帧率异常: {fps}")
         except Exception as fps_error:
-            print(f"[生成骨骼视频] get_video_fps 失败，使用 OpenCV: {fps_error}")
+            logger.warning("[生成骨骼视频] get_video_fps 失败，使用 OpenCV: %s", fps_error)
             # 回退到 OpenCV 方法
             fps = cap.get(cv2.CAP_PROP_FPS)
             import math
             if math.isnan(fps) or fps <= 0:
                 fps = 30.0  # 默认帧率
-                print(f"[生成骨骼视频] OpenCV 无法获取帧率，使用默认值: {fps} FPS")
+                logger.warning("[生成骨骼视频] OpenCV 无法获取帧率，使用默认值: %s FPS", fps)
         
         # 确保 FPS 是有效的数值
         import math
         if math.isnan(fps) or fps <= 0:
             fps = 30.0
-            print(f"[生成骨骼视频] 警告：帧率无效，强制使用默认值: {fps} FPS")
+            logger.warning("[生成骨骼视频] 警告：帧率无效，强制使用默认值: %s FPS", fps)
         
-        print(f"[生成骨骼视频] 最终使用的帧率: {fps:.2f} FPS")
+        logger.debug("[生成骨骼视频] 最终使用的帧率: %.2f FPS", fps)
         
         width_raw = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
         height_raw = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
@@ -978,13 +1167,9 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
     # 确保临时目录存在
     os.makedirs(TEMP_FOLDER, exist_ok=True)
     
-    # 尝试多种编码格式，按兼容性排序
-    codecs_to_try = [
-        ('mp4v', 'mp4v'),  # MPEG-4 Part 2，最兼容
-        ('XVID', 'XVID'),  # Xvid MPEG-4
-        ('avc1', 'avc1'),  # H.264 (avc1)
-        ('H264', 'H264'),  # H.264 (H264)
-    ]
+    # 尝试多种编码格式，按兼容性排序（mp4v: MPEG-4 Part 2，最兼容 / XVID / avc1、H264: H.264）
+    # 只尝试启动时检测到能打开的 fourcc；检测结果为空时仍逐个尝试
+    codecs_to_try = [(fourcc, fourcc) for fourcc in (opencv_fourccs() or OPENCV_FOURCCS)]
     
     out = None
     used_codec = None
@@ -998,56 +1183,58 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
             # 检查是否成功初始化
             if out.isOpened():
                 used_codec = codec_name
-                print(f"成功使用 {codec_name} 编码器创建视频写入器")
+                logger.debug("成功使用 %s 编码器创建视频写入器", codec_name)
                 break
             else:
                 out.release()
                 out = None
-                print(f"警告: {codec_name} 编码器初始化失败")
+                logger.warning("警告: %s 编码器初始化失败", codec_name)
         except Exception as e:
-            print(f"警告: 尝试使用 {codec_name} 编码器时出错: {e}")
+            logger.warning("警告: 尝试使用 %s 编码器时出错: %s", codec_name, e)
             if out:
                 out.release()
                 out = None
     
     # 如果所有编码器都失败，尝试使用 ffmpeg 转换格式
     if out is None or not out.isOpened():
-        print("警告: 所有 OpenCV 编码器都失败，尝试使用 ffmpeg 转换视频格式")
+        logger.warning("警告: 所有 OpenCV 编码器都失败，尝试使用 ffmpeg 转换视频格式")
         try:
             # 检查 ffmpeg 是否可用
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, timeout=5, check=True)
+            if not has_ffmpeg():
+                raise FileNotFoundError('ffmpeg')
             
             # 使用 ffmpeg 将原视频转换为 mp4 格式（无骨骼标记，但至少格式正确）
             cmd = [
                 'ffmpeg', '-y',
                 '-i', video_file,
-                '-c:v', 'libx264',  # 使用 H.264 编码
+                '-c:v', h264_encoder(),  # 使用 H.264 编码
                 '-preset', 'fast',  # 快速编码
                 '-crf', '23',  # 质量参数
                 '-c:a', 'aac',  # 音频编码
                 '-movflags', '+faststart',  # 优化流媒体播放
                 output_file
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            with SUBPROCESS_SECONDS.time(tool='ffmpeg', purpose='pose_video'):
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
             if result.returncode == 0:
-                print("警告: 使用 ffmpeg 转换视频格式成功（无骨骼标记）")
+                logger.warning("警告: 使用 ffmpeg 转换视频格式成功（无骨骼标记）")
                 return output_file
             else:
-                print(f"FFmpeg转换失败: {result.stderr}")
+                logger.error("FFmpeg转换失败: %s", result.stderr)
                 # 如果 ffmpeg 转换失败，不能直接复制原视频（可能是 webm 格式）
                 # 因为输出文件名是 .mp4，但内容可能是 webm，会导致浏览器无法播放
                 raise Exception(f"FFmpeg转换失败，无法生成视频文件: {result.stderr}")
         except FileNotFoundError:
-            print("警告: FFmpeg未找到，无法转换视频格式")
+            logger.warning("警告: FFmpeg未找到，无法转换视频格式")
             # 如果 ffmpeg 不可用，不能直接复制原视频（可能是 webm 格式）
             # 因为输出文件名是 .mp4，但内容可能是 webm，会导致浏览器无法播放
             # 所以这里应该抛出异常，提示需要安装 ffmpeg
             raise Exception("FFmpeg未安装，无法生成视频文件。请安装 ffmpeg 或使用 Docker 环境。")
         except subprocess.TimeoutExpired:
-            print("警告: FFmpeg检查超时，无法转换视频格式")
+            logger.warning("警告: FFmpeg检查超时，无法转换视频格式")
             raise Exception("FFmpeg检查超时，无法生成视频文件")
         except Exception as e:
-            print(f"警告: 视频转换失败: {e}")
+            logger.warning("警告: 视频转换失败: %s", e)
             # 不能直接复制原视频（可能是 webm 格式），因为输出文件名是 .mp4
             raise Exception(f"无法生成视频文件: {str(e)}")
     
@@ -1061,9 +1248,9 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
     selected_landmarks_set = set(selected_landmarks)
     use_cached = poses_data is not None and len(poses_data) > 0
     if use_cached:
-        print(f"[生成骨骼视频] 复用已有姿势数据 {len(poses_data)} 帧，跳过 MediaPipe 推理")
+        logger.debug("[生成骨骼视频] 复用已有姿势数据 %s 帧，跳过 MediaPipe 推理", len(poses_data))
     else:
-        print(f"[生成骨骼视频] 推理缩放: {infer_scale:.2f}, 推理尺寸: {infer_size}")
+        logger.debug("[生成骨骼视频] 推理缩放: %.2f, 推理尺寸: %s", infer_scale, infer_size)
 
     def _draw_from_cached_pose(frame_bgr, pose_kpts):
         """根据缓存的关键点（13 个 [x,y,z,vis] 归一化坐标）在 BGR 帧上绘制骨骼"""
@@ -1169,7 +1356,7 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
     
     # 检查临时文件是否成功创建
     if not os.path.exists(temp_video):
-        print(f"错误: 临时视频文件未创建: {temp_video}")
+        logger.error("错误: 临时视频文件未创建: %s", temp_video)
         raise Exception(f"无法创建临时视频文件，使用的编码器: {used_codec}")
     
     # 使用ffmpeg合并视频和音频，并确保使用浏览器兼容的格式
@@ -1189,9 +1376,9 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
             'ffmpeg', '-y',  # -y 覆盖输出文件
             '-i', temp_video,  # 输入视频（无音频）
             '-i', video_file,  # 输入原视频（有音频）
-            '-c:v', 'libx264',  # 使用 H.264 编码（浏览器兼容）
+            '-c:v', h264_encoder(),  # 使用 H.264 编码（浏览器兼容）
             '-r', str(fps),  # 保持原始帧率（关键！）
-            '-fps_mode', 'cfr',  # 恒定帧率模式（确保帧率一致）
+            *ffmpeg_frame_rate_args('cfr'),  # 恒定帧率模式（确保帧率一致）
             '-preset', 'fast',  # 快速编码
             '-crf', '23',  # 质量参数
             '-pix_fmt', 'yuv420p',  # 像素格式（浏览器兼容）
@@ -1204,55 +1391,57 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
             output_file
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        with SUBPROCESS_SECONDS.time(tool='ffmpeg', purpose='pose_video'):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
         if result.returncode != 0:
-            print(f"FFmpeg错误: {result.stderr}")
+            logger.error("FFmpeg错误: %s", result.stderr)
             # 如果合并失败，尝试只重新编码视频（无音频）
-            print("尝试重新编码视频（无音频）...")
+            logger.info("尝试重新编码视频（无音频）...")
             cmd_no_audio = [
                 'ffmpeg', '-y',
                 '-i', temp_video,
-                '-c:v', 'libx264',
+                '-c:v', h264_encoder(),
                 '-r', str(fps),  # 保持原始帧率（关键！）
-                '-fps_mode', 'cfr',  # 恒定帧率模式（确保帧率一致）
+                *ffmpeg_frame_rate_args('cfr'),  # 恒定帧率模式（确保帧率一致）
                 '-preset', 'fast',
                 '-crf', '23',
                 '-pix_fmt', 'yuv420p',
                 '-movflags', '+faststart',
                 output_file
             ]
-            result_no_audio = subprocess.run(cmd_no_audio, capture_output=True, text=True, timeout=300)
+            with SUBPROCESS_SECONDS.time(tool='ffmpeg', purpose='pose_video'):
+                result_no_audio = subprocess.run(cmd_no_audio, capture_output=True, text=True, timeout=300)
             if result_no_audio.returncode != 0:
-                print(f"FFmpeg重新编码失败: {result_no_audio.stderr}")
+                logger.error("FFmpeg重新编码失败: %s", result_no_audio.stderr)
                 # 如果重新编码也失败，使用原始临时文件（可能不兼容）
                 if os.path.exists(temp_video):
                     shutil.copy2(temp_video, output_file)
-                    print("警告: 使用原始临时文件（可能不兼容）")
+                    logger.warning("警告: 使用原始临时文件（可能不兼容）")
                 else:
                     raise Exception(f"临时视频文件不存在且ffmpeg失败: {temp_video}")
             else:
-                print("成功重新编码视频（无音频）")
+                logger.info("成功重新编码视频（无音频）")
         else:
-            print("成功添加音频到生成的视频")
+            logger.debug("成功添加音频到生成的视频")
     except FileNotFoundError:
-        print("FFmpeg未找到，生成无音频版本")
+        logger.warning("FFmpeg未找到，生成无音频版本")
         # 如果ffmpeg不可用，使用无音频版本
         if os.path.exists(temp_video):
             shutil.copy2(temp_video, output_file)
         else:
             raise Exception(f"临时视频文件不存在且ffmpeg未安装: {temp_video}")
     except subprocess.TimeoutExpired:
-        print("FFmpeg处理超时，使用无音频版本")
+        logger.warning("FFmpeg处理超时，使用无音频版本")
         if os.path.exists(temp_video):
             shutil.copy2(temp_video, output_file)
         else:
             raise Exception(f"临时视频文件不存在且ffmpeg超时: {temp_video}")
     except Exception as e:
-        print(f"音频处理失败: {e}")
+        logger.warning("音频处理失败: %s", e)
         # 如果出现其他错误，使用无音频版本
         if os.path.exists(temp_video):
             shutil.copy2(temp_video, output_file)
-            print("使用无音频版本（处理失败）")
+            logger.warning("使用无音频版本（处理失败）")
         else:
             raise Exception(f"临时视频文件不存在: {temp_video}, 错误: {str(e)}")
     finally:
@@ -1261,7 +1450,7 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
             try:
                 os.remove(temp_video)
             except Exception as e:
-                print(f"警告: 清理临时文件失败: {e}")
+                logger.warning("警告: 清理临时文件失败: %s", e)
     
     # 验证生成的视频文件是否有效
     if not os.path.exists(output_file):
@@ -1283,22 +1472,16 @@ def generate_pose_video(video_file, output_file, n=5, poses_data=None):
         if not ret or frame is None:
             raise Exception(f"生成的视频文件无法读取帧: {output_file}")
         
-        print(f"视频文件验证成功: {output_file}, 大小: {file_size} 字节")
+        logger.debug("视频文件验证成功: %s, 大小: %s 字节", output_file, file_size)
     except Exception as validation_error:
         # 如果验证失败，尝试使用 ffprobe 验证
-        try:
-            import subprocess
-            cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=format_name', '-of', 'json', output_file]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            if result.returncode != 0:
-                raise Exception(f"ffprobe 验证失败: {result.stderr}")
-            print(f"使用 ffprobe 验证成功: {output_file}")
-        except FileNotFoundError:
+        if not has_ffprobe():
             # 如果 ffprobe 不可用，但 OpenCV 验证失败，仍然抛出错误
             raise validation_error
-        except Exception as ffprobe_error:
+        if probe_media(output_file) is None:
             # 如果两种验证都失败，抛出错误
-            raise Exception(f"视频文件验证失败: {str(validation_error)}, ffprobe: {str(ffprobe_error)}")
+            raise Exception(f"视频文件验证失败: {str(validation_error)}, ffprobe 无法读取")
+        logger.debug("使用 ffprobe 验证成功: %s", output_file)
     
     return output_file
 
@@ -1397,33 +1580,29 @@ def calculate_pose_difference(pose1, pose2):
     return total_diff / valid_points
 
 def compare_poses(reference_poses, recorded_poses, threshold=0.4):
-    """比较两个视频的姿势，找出差异较大的帧"""
-    differences = []
-
-    # 获取两个视频的帧索引
-    ref_frames = sorted(reference_poses.keys())
-    rec_frames = sorted(recorded_poses.keys())
+    """比较两个视频的姿势，找出差异较大的帧
 
-    # 计算最小帧数
-    min_frames = min(len(ref_frames), len(rec_frames))
-
-    for i in range(min_frames):
-        ref_frame_idx = ref_frames[i]
-        rec_frame_idx = rec_frames[i]
-
-        ref_pose = reference_poses[ref_frame_idx]
-        rec_pose = recorded_poses[rec_frame_idx]
+    Args:
+        reference_poses / recorded_poses: {frame_idx: pose} 字典或 PoseArrays（批量向量化计算）
+    """
+    if not isinstance(reference_poses, PoseArrays):
+        reference_poses = pack_poses(reference_poses)
+    if not isinstance(recorded_poses, PoseArrays):
+        recorded_poses = pack_poses(recorded_poses)
 
-        # 计算姿势差异
-        pose_diff = calculate_pose_difference(ref_pose, rec_pose)
+    result = compare_pose_arrays(reference_poses, recorded_poses, threshold)
+    over_threshold = result.differences > threshold
 
-        if pose_diff > threshold:
-            differences.append({
-                'frame_idx': rec_frame_idx,
-                'reference_frame': ref_frame_idx,
-                'difference': pose_diff,
-                'timestamp': rec_frame_idx * 0.2  # 假设5帧间隔，每帧0.2秒
-            })
+    differences = []
+    for ref_frame_idx, rec_frame_idx, pose_diff in zip(result.reference_frames[over_threshold].tolist(),
+                                                       result.user_frames[over_threshold].tolist(),
+                                                       result.differences[over_threshold].tolist()):
+        differences.append({
+            'frame_idx': rec_frame_idx,
+            'reference_frame': ref_frame_idx,
+            'difference': pose_diff,
+            'timestamp': rec_frame_idx * 0.2  # 假设5帧间隔，每帧0.2秒
+        })
 
     return differences
 
@@ -1433,9 +1612,25 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'message': 'Dance pose comparison service is running'
+        'message': 'Dance pose comparison service is running',
+        'pose_workers': pose_worker_pool.stats(),
+        'capabilities': get_capabilities()
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """运行指标（Prometheus 文本格式）：骨骼提取各阶段耗时、任务队列、worker 推理速度、ffmpeg 耗时、接口耗时
+    
+    nginx 不转发 /metrics，由 Prometheus 直接抓取后端端口（见 metrics.py）
+    """
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def collect_queue_depth():
+    for status in ('pending', 'processing'):
+        TASK_QUEUE_DEPTH.set(db.count_tasks(status), status=status)
+
+metrics_registry.add_collector(collect_queue_depth, local=True)
+
 # ========== 认证相关接口 ==========
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -1488,9 +1683,13 @@ def register():
         # 生成Token
         token = generate_auth_token(user['id'], user['username'], user.get('role', 'user'))
         
-        # 保存会话
+        # 保存会话（没有会话记录的 Token 无法通过验证，保存失败时不能把 Token 交给客户端）
         expires_at = (datetime.utcnow() + timedelta(days=TOKEN_EXPIRY_DAYS)).isoformat()
-        db.save_session(user['id'], token, expires_at)
+        if not db.save_session(user['id'], token, expires_at):
+            return jsonify({
+                'success': False,
+                'error': '注册失败，请稍后重试'
+            }), 500
         
         # 更新最后登录时间
         db.update_last_login(user['id'])
@@ -1547,9 +1746,13 @@ def login():
         # 生成Token
         token = generate_auth_token(user['id'], user['username'], user.get('role', 'user'))
         
-        # 保存会话
+        # 保存会话（没有会话记录的 Token 无法通过验证，保存失败时不能把 Token 交给客户端）
         expires_at = (datetime.utcnow() + timedelta(days=TOKEN_EXPIRY_DAYS)).isoformat()
-        db.save_session(user['id'], token, expires_at)
+        if not db.save_session(user['id'], token, expires_at):
+            return jsonify({
+                'success': False,
+                'error': '登录失败，请稍后重试'
+            }), 500
         
         # 更新最后登录时间
         db.update_last_login(user['id'])
@@ -1635,11 +1838,11 @@ def get_current_user():
 def upload_user_video():
     """上传用户视频并提取骨骼数据（临时缓存）- 需要登录"""
     try:
-        print(f"[上传用户视频] 收到请求")
+        logger.debug("[上传用户视频] 收到请求")
         
         # 检查是否有用户视频上传
         if 'user_video' not in request.files:
-            print(f"[上传用户视频] 错误：缺少用户视频文件")
+            logger.warning("[上传用户视频] 错误：缺少用户视频文件")
             return jsonify({
                 'success': False,
                 'error': '缺少用户视频文件'
@@ -1649,7 +1852,7 @@ def upload_user_video():
 
         # 检查文件名
         if user_file.filename == '':
-            print(f"[上传用户视频] 错误：未选择用户视频文件")
+            logger.warning("[上传用户视频] 错误：未选择用户视频文件")
             return jsonify({
                 'success': False,
                 'error': '未选择用户视频文件'
@@ -1657,7 +1860,7 @@ def upload_user_video():
 
         # 检查文件类型
         if not allowed_file(user_file.filename):
-            print(f"[上传用户视频] 错误：不支持的文件格式 {user_file.filename}")
+            logger.warning("[上传用户视频] 错误：不支持的文件格式 %s", user_file.filename)
             return jsonify({
                 'success': False,
                 'error': '不支持的用户视频文件格式'
@@ -1665,10 +1868,10 @@ def upload_user_video():
 
         # 获取参考视频ID
         reference_video_id = request.form.get('reference_video_id')
-        print(f"[上传用户视频] 参考视频ID: {reference_video_id}")
+        logger.debug("[上传用户视频] 参考视频ID: %s", reference_video_id)
         
         if not reference_video_id:
-            print(f"[上传用户视频] 错误：缺少参考视频ID")
+            logger.warning("[上传用户视频] 错误：缺少参考视频ID")
             return jsonify({
                 'success': False,
                 'error': '缺少参考视频ID'
@@ -1677,7 +1880,7 @@ def upload_user_video():
         # 验证参考视频是否存在
         reference_video = db.get_video_by_id(reference_video_id, 'reference')
         if not reference_video:
-            print(f"[上传用户视频] 错误：参考视频 {reference_video_id} 不存在")
+            logger.warning("[上传用户视频] 错误：参考视频 %s 不存在", reference_video_id)
             return jsonify({
                 'success': False,
                 'error': f'指定的参考视频 {reference_video_id} 不存在'
@@ -1700,133 +1903,51 @@ def upload_user_video():
                 user_duration = get_video_duration(original_user_path)
                 user_fps = get_video_fps(original_user_path)
             except Exception as video_info_error:
-                print(f"[上传用户视频] 警告：无法获取视频信息: {video_info_error}")
+                logger.warning("[上传用户视频] 警告：无法获取视频信息: %s", video_info_error)
                 # 设置默认值
                 user_duration = 0
                 user_fps = 30.0
             
             # 处理异常的duration值（webm格式可能返回极大的负数）
             if user_duration < 0 or user_duration > 86400:  # 超过24小时视为异常
-                print(f"[上传用户视频] 警告：检测到异常的duration值 {user_duration}，重置为0")
+                logger.warning("[上传用户视频] 警告：检测到异常的duration值 %s，重置为0", user_duration)
                 user_duration = 0
 
             # 保存用户视频信息到数据库（保存原始视频路径，用于播放）
-            db_result = db.add_user_video(user_video_id, user_file.filename, original_user_path, user_duration, user_fps)
+            db_result = db.add_user_video(user_video_id, user_file.filename, original_user_path, user_duration, user_fps,
+                                          media_info=probe_media(original_user_path))
             
             if not db_result:
-                print(f"[上传用户视频] 错误：数据库插入失败")
+                logger.error("[上传用户视频] 错误：数据库插入失败")
                 return jsonify({
                     'success': False,
                     'error': '保存视频信息到数据库失败'
                 }), 500
 
             # 立即返回响应，骨骼提取在后台异步进行
-            print(f"用户视频 {user_video_id} 上传成功，准备异步提取骨骼数据...")
+            logger.info("用户视频 %s 上传成功，准备异步提取骨骼数据...", user_video_id)
             
-            # 启动后台线程提取骨骼数据
-            import threading
-            def extract_poses_async():
-                extraction_error = None
-                converted_video_path = None  # 转换后的临时文件路径
-                try:
-                    print(f"[后台任务] 开始提取用户视频 {user_video_id} 的骨骼数据...")
-                    
-                    # 更新进度：开始处理
-                    db.update_pose_extraction_progress(user_video_id, 10)
-                    
-                    # 转换为标准格式（临时文件，仅用于骨骼提取）
-                    print(f"[后台任务] 转换视频格式用于骨骼提取...")
-                    converted_video_path = convert_video_to_standard_format(original_user_path)
-                    if converted_video_path is None:
-                        print(f"[后台任务] 警告：格式转换失败，使用原始文件")
-                        converted_video_path = original_user_path
-                    elif converted_video_path != original_user_path:
-                        print(f"[后台任务] 格式转换成功: {converted_video_path}")
-                    
-                    # 提取骨骼数据（使用转换后的临时视频）
-                    user_poses = extract_poses_from_video(converted_video_path, n=5, early_stop_threshold=50)
-                    
-                    # 更新进度：提取完成
-                    db.update_pose_extraction_progress(user_video_id, 60)
-                    
-                    # 检查是否提取到有效的骨骼数据
-                    valid_poses = sum(1 for pose in user_poses.values() if pose is not None)
-                    total_frames = len(user_poses)
-                    
-                    print(f"[后台任务] 提取结果：total_frames={total_frames}, valid_poses={valid_poses}")
-                    
-                    if total_frames == 0:
-                        extraction_error = "视频处理失败：无法读取视频帧"
-                        print(f"[后台任务] 错误：{extraction_error}")
-                    elif valid_poses == 0:
-                        extraction_error = "视频中未检测到任何人像骨骼数据，请确保视频中有清晰的人物动作"
-                        print(f"[后台任务] 警告：{extraction_error}")
-                    else:
-                        print(f"[后台任务] 提取到 {valid_poses}/{total_frames} 帧有效骨骼数据")
-                    
-                    # 更新进度：保存数据
-                    db.update_pose_extraction_progress(user_video_id, 80)
-                    
-                    # 保存用户视频骨骼数据到数据库（使用批量保存优化性能）
-                    try:
-                        if total_frames > 0:
-                            # 使用批量保存方法（跳过None值）
-                            save_result = db.save_pose_data_batch(user_video_id, 'user', user_poses)
-                            if save_result:
-                                print(f"[后台任务] 批量保存骨骼数据成功")
-                            else:
-                                print(f"[后台任务] 警告：批量保存骨骼数据失败，但继续处理")
-                    except Exception as save_error:
-                        print(f"[后台任务] 保存数据异常: {save_error}")
-                        # 不设置extraction_error，允许继续标记完成
-                    
-                    # 更新进度：完成
-                    db.update_pose_extraction_progress(user_video_id, 100)
-                    
-                    # 标记骨骼数据已提取（记录错误信息）
-                    db.update_pose_extraction_status(user_video_id, True, 'user', extraction_error)
-                    
-                    if extraction_error:
-                        print(f"[后台任务] 用户视频 {user_video_id} 处理完成但有警告: {extraction_error}")
-                    else:
-                        print(f"[后台任务] 用户视频 {user_video_id} 骨骼数据提取完成")
-                    
-                    # 删除转换后的临时文件（如果存在且不是原始文件）
-                    if converted_video_path and converted_video_path != original_user_path and os.path.exists(converted_video_path):
-                        try:
-                            os.remove(converted_video_path)
-                            print(f"[后台任务] 已删除临时转换文件: {converted_video_path}")
-                        except Exception as delete_error:
-                            print(f"[后台任务] 警告：删除临时转换文件失败: {delete_error}")
-                        
-                except Exception as e:
-                    extraction_error = f"处理失败: {str(e)}"
-                    print(f"[后台任务] 提取骨骼数据失败: {extraction_error}")
-                    import traceback
-                    traceback.print_exc()
-                    
-                    # 标记为已提取（失败状态），记录错误信息
-                    try:
-                        db.update_pose_extraction_status(user_video_id, True, 'user', extraction_error)
-                        db.update_pose_extraction_progress(user_video_id, 100)
-                        print(f"[后台任务] 已标记视频 {user_video_id} 为提取完成（失败）")
-                    except Exception as update_error:
-                        print(f"[后台任务] 更新状态失败: {str(update_error)}")
-                finally:
-                    # 确保删除转换后的临时文件（如果存在且不是原始文件）
-                    if 'converted_video_path' in locals() and converted_video_path and converted_video_path != original_user_path and os.path.exists(converted_video_path):
-                        try:
-                            os.remove(converted_video_path)
-                            print(f"[后台任务] 已删除临时转换文件: {converted_video_path}")
-                        except Exception as delete_error:
-                            print(f"[后台任务] 警告：删除临时转换文件失败: {delete_error}")
+            # 提交骨骼提取任务到任务队列（用户正在等待结果，优先执行）
+            task_id = str(uuid.uuid4())
+            if not task_queue.submit(task_id, user_video_id, 'user', 'pose_extraction',
+                                     PRIORITY_HIGH, {'file_path': original_user_path}):
+                error_msg = '提交骨骼提取任务失败'
+                logger.error("[上传用户视频] 错误：视频 %s %s", user_video_id, error_msg)
+                db.update_pose_extraction_status(user_video_id, True, 'user', error_msg)
+                return jsonify({
+                    'success': False,
+                    'error': error_msg
+                }), 500
+            # 浏览器兼容的播放文件在骨骼提取之后慢慢生成（提交失败时仍可直接播放原始文件）
+            if not task_queue.submit(str(uuid.uuid4()), user_video_id, 'user', 'playback_transcode',
+                                     PRIORITY_LOW, {'file_path': original_user_path}):
+                logger.warning("[上传用户视频] 警告：视频 %s 提交播放转码任务失败", user_video_id)
             
-            thread = threading.Thread(target=extract_poses_async, daemon=True)
-            thread.start()
 
             return jsonify({
                 'success': True,
                 'user_video_id': user_video_id,
+                'task_id': task_id,
                 'filename': user_file.filename,
                 'filepath': original_user_path,
                 'duration': user_duration,
@@ -1904,15 +2025,15 @@ def compare_uploaded_videos():
                 'error': f'参考视频 {reference_video_id} 不存在'
             }), 400
 
-        # 获取骨骼数据
+        # 获取骨骼数据（数据库中只取检测到骨骼的帧）
         user_poses = {}
-        user_pose_data = db.get_pose_data(user_video_id)
-        if user_pose_data:
-            for pose_item in user_pose_data:
-                user_poses[pose_item['frame_index']] = pose_item['pose_data']
+        user_pose_arrays = db.get_pose_arrays(user_video_id)
+        if user_pose_arrays is not None and user_pose_arrays.valid_count > 0:
+            user_pose_arrays = user_pose_arrays.present()
+            user_poses = pose_arrays_to_dict(user_pose_arrays)
         else:
             # 尝试重新提取骨骼数据
-            print(f"用户视频 {user_video_id} 骨骼数据不存在，尝试重新提取...")
+            logger.info("用户视频 %s 骨骼数据不存在，尝试重新提取...", user_video_id)
             try:
                 if os.path.exists(user_video['file_path']):
                     # 重新提取骨骼数据
@@ -1924,34 +2045,35 @@ def compare_uploaded_videos():
                         n=5
                     )
                     
+                    user_pose_arrays = pack_poses(user_poses)
+                    
                     # 保存骨骼数据到数据库
-                    for frame_idx, pose_data in user_poses.items():
-                        db.save_pose_data(user_video_id, 'user', frame_idx, pose_data, frame_idx * 0.2)
+                    db.save_pose_data_batch(user_video_id, 'user', user_poses)
                     
                     # 更新骨骼数据状态
                     db.update_pose_extraction_status(user_video_id, True)
                     
-                    print(f"用户视频 {user_video_id} 骨骼数据重新提取成功，共 {len(user_poses)} 帧")
+                    logger.info("用户视频 %s 骨骼数据重新提取成功，共 %s 帧", user_video_id, len(user_poses))
                 else:
                     return jsonify({
                         'success': False,
                         'error': f'用户视频文件不存在: {user_video["file_path"]}'
                     }), 400
             except Exception as e:
-                print(f"重新提取用户视频骨骼数据失败: {e}")
+                logger.error("重新提取用户视频骨骼数据失败: %s", e)
                 return jsonify({
                     'success': False,
                     'error': f'用户视频骨骼数据不存在且重新提取失败: {str(e)}'
                 }), 400
 
         reference_poses = {}
-        reference_pose_data = db.get_pose_data(reference_video_id)
-        if reference_pose_data:
-            for pose_item in reference_pose_data:
-                reference_poses[pose_item['frame_index']] = pose_item['pose_data']
+        reference_pose_arrays = db.get_reference_pose_arrays(reference_video_id)
+        if reference_pose_arrays is not None and reference_pose_arrays.valid_count > 0:
+            reference_pose_arrays = reference_pose_arrays.present()
+            reference_poses = pose_arrays_to_dict(reference_pose_arrays)
         else:
             # 尝试重新提取参考视频骨骼数据
-            print(f"参考视频 {reference_video_id} 骨骼数据不存在，尝试重新提取...")
+            logger.info("参考视频 %s 骨骼数据不存在，尝试重新提取...", reference_video_id)
             try:
                 if os.path.exists(reference_video['file_path']):
                     # 重新提取骨骼数据
@@ -1963,29 +2085,30 @@ def compare_uploaded_videos():
                         n=5
                     )
                     
+                    reference_pose_arrays = pack_poses(reference_poses)
+                    
                     # 保存骨骼数据到数据库
-                    for frame_idx, pose_data in reference_poses.items():
-                        db.save_pose_data(reference_video_id, 'reference', frame_idx, pose_data, frame_idx * 0.2)
+                    db.save_pose_data_batch(reference_video_id, 'reference', reference_poses)
                     
                     # 更新骨骼数据状态
                     db.update_pose_extraction_status(reference_video_id, True, 'reference')
                     
-                    print(f"参考视频 {reference_video_id} 骨骼数据重新提取成功，共 {len(reference_poses)} 帧")
+                    logger.info("参考视频 %s 骨骼数据重新提取成功，共 %s 帧", reference_video_id, len(reference_poses))
                 else:
                     return jsonify({
                         'success': False,
                         'error': f'参考视频文件不存在: {reference_video["file_path"]}'
                     }), 400
             except Exception as e:
-                print(f"重新提取参考视频骨骼数据失败: {e}")
+                logger.error("重新提取参考视频骨骼数据失败: %s", e)
                 return jsonify({
                     'success': False,
                     'error': f'参考视频骨骼数据不存在且重新提取失败: {str(e)}'
                 }), 400
 
         # 比较姿势差异
-        print("正在比较姿势差异...")
-        differences = compare_poses(reference_poses, user_poses, threshold)
+        logger.debug("正在比较姿势差异...")
+        differences = compare_poses(reference_pose_arrays, user_pose_arrays, threshold)
 
         # 生成唯一的工作ID
         work_id = str(uuid.uuid4())
@@ -1995,7 +2118,7 @@ def compare_uploaded_videos():
         os.makedirs(report_dir, exist_ok=True)
 
         # 处理标记骨骼的视频
-        print("正在处理标记骨骼的视频...")
+        logger.debug("正在处理标记骨骼的视频...")
         reference_pose_video = os.path.join(report_dir, "reference_pose_video.mp4")
         user_pose_video = os.path.join(report_dir, "user_pose_video.mp4")
         reference_pose_thumbnail = os.path.join(report_dir, "reference_pose_thumbnail.jpg")
@@ -2003,7 +2126,7 @@ def compare_uploaded_videos():
         
         # 检查参考视频是否已有缓存的标记骨骼视频
         if reference_video.get('pose_video_path') and os.path.exists(reference_video['pose_video_path']):
-            print("使用缓存的参考视频标记骨骼视频...")
+            logger.debug("使用缓存的参考视频标记骨骼视频...")
             import shutil
             shutil.copy2(reference_video['pose_video_path'], reference_pose_video)
             # 验证复制的文件
@@ -2012,9 +2135,9 @@ def compare_uploaded_videos():
             file_size = os.path.getsize(reference_pose_video)
             if file_size == 0:
                 raise Exception(f"复制的参考视频标记骨骼视频为空: {reference_pose_video}")
-            print(f"参考视频标记骨骼视频复制成功，大小: {file_size} 字节")
+            logger.debug("参考视频标记骨骼视频复制成功，大小: %s 字节", file_size)
         else:
-            print("生成参考视频标记骨骼视频...")
+            logger.debug("生成参考视频标记骨骼视频...")
             if not os.path.exists(reference_video['file_path']):
                 raise Exception(f"参考视频文件不存在: {reference_video['file_path']}")
             generate_pose_video(reference_video['file_path'], reference_pose_video, n=5, poses_data=reference_poses)
@@ -2024,7 +2147,10 @@ def compare_uploaded_videos():
             file_size = os.path.getsize(reference_pose_video)
             if file_size == 0:
                 raise Exception(f"生成的参考视频标记骨骼视频为空: {reference_pose_video}")
-            print(f"参考视频标记骨骼视频生成成功，大小: {file_size} 字节")
+            logger.debug("参考视频标记骨骼视频生成成功，大小: %s 字节", file_size)
+        
+        # 验证结论写入报告清单，播放时不再重复验证
+        record_pose_video(report_dir, 'reference', reference_pose_video)
         
         # 为参考视频生成缩略图
         try:
@@ -2036,31 +2162,35 @@ def compare_uploaded_videos():
                     if os.path.exists(reference_pose_thumbnail):
                         os.remove(reference_pose_thumbnail)
                     shutil.move(thumbnail_path, reference_pose_thumbnail)
-                print(f"参考视频骨骼视频缩略图生成成功: {reference_pose_thumbnail}")
+                logger.debug("参考视频骨骼视频缩略图生成成功: %s", reference_pose_thumbnail)
             else:
-                print("警告: 参考视频骨骼视频缩略图生成失败")
+                logger.warning("警告: 参考视频骨骼视频缩略图生成失败")
         except Exception as e:
-            print(f"警告: 生成参考视频骨骼视频缩略图时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("警告: 生成参考视频骨骼视频缩略图时出错: %s", e)
         
         # 生成用户视频的标记骨骼视频
-        print(f"生成用户视频标记骨骼视频...")
-        print(f"用户视频路径: {user_video['file_path']}")
-        print(f"用户视频是否存在: {os.path.exists(user_video['file_path'])}")
+        logger.debug("生成用户视频标记骨骼视频...")
+        logger.debug("用户视频路径: %s", user_video['file_path'])
+        logger.debug("用户视频是否存在: %s", os.path.exists(user_video['file_path']))
         
         if not os.path.exists(user_video['file_path']):
             raise Exception(f"用户视频文件不存在: {user_video['file_path']}")
         
         try:
-            # 先转换为标准格式（与参考视频保持一致，确保帧率准确）
-            print(f"[生成用户骨骼视频] 转换视频格式以确保帧率准确...")
-            converted_user_video = convert_video_to_standard_format(user_video['file_path'])
-            video_for_pose = converted_user_video if converted_user_video else user_video['file_path']
-            if converted_user_video and converted_user_video != user_video['file_path']:
-                print(f"[生成用户骨骼视频] 格式转换成功: {converted_user_video}")
+            # 先转换为标准格式（与参考视频保持一致，确保帧率准确）；后台已生成播放文件时直接复用
+            playback_path = user_video.get('playback_path')
+            if playback_path and os.path.exists(playback_path):
+                logger.debug("[生成用户骨骼视频] 使用已转码的播放文件: %s", playback_path)
+                converted_user_video = None
+                video_for_pose = playback_path
             else:
-                print(f"[生成用户骨骼视频] 使用原始视频文件")
+                logger.debug("[生成用户骨骼视频] 转换视频格式以确保帧率准确...")
+                converted_user_video = convert_video_to_standard_format(user_video['file_path'])
+                video_for_pose = converted_user_video if converted_user_video else user_video['file_path']
+                if converted_user_video and converted_user_video != user_video['file_path']:
+                    logger.debug("[生成用户骨骼视频] 格式转换成功: %s", converted_user_video)
+                else:
+                    logger.debug("[生成用户骨骼视频] 使用原始视频文件")
             
             # 生成视频（内部会验证），复用已提取的用户姿势数据
             generate_pose_video(video_for_pose, user_pose_video, n=5, poses_data=user_poses)
@@ -2069,10 +2199,10 @@ def compare_uploaded_videos():
             if converted_user_video and converted_user_video != user_video['file_path'] and os.path.exists(converted_user_video):
                 try:
                     os.remove(converted_user_video)
-                    print(f"[生成用户骨骼视频] 已删除临时转换文件: {converted_user_video}")
+                    logger.debug("[生成用户骨骼视频] 已删除临时转换文件: %s", converted_user_video)
                 except Exception as delete_error:
-                    print(f"[生成用户骨骼视频] 警告：删除临时转换文件失败: {delete_error}")
-            print(f"用户视频标记骨骼视频生成成功: {user_pose_video}")
+                    logger.warning("[生成用户骨骼视频] 警告：删除临时转换文件失败: %s", delete_error)
+            logger.info("用户视频标记骨骼视频生成成功: %s", user_pose_video)
             
             # 再次验证生成的文件（双重保险）
             if not os.path.exists(user_pose_video):
@@ -2082,7 +2212,8 @@ def compare_uploaded_videos():
             if file_size == 0:
                 raise Exception(f"生成的视频文件为空: {user_pose_video}")
             
-            print(f"生成的视频文件验证通过: {user_pose_video}, 大小: {file_size} 字节")
+            logger.debug("生成的视频文件验证通过: %s, 大小: %s 字节", user_pose_video, file_size)
+            record_pose_video(report_dir, 'user', user_pose_video)
             
             # 为用户视频生成缩略图
             try:
@@ -2094,23 +2225,19 @@ def compare_uploaded_videos():
                         if os.path.exists(user_pose_thumbnail):
                             os.remove(user_pose_thumbnail)
                         shutil.move(thumbnail_path, user_pose_thumbnail)
-                    print(f"用户视频骨骼视频缩略图生成成功: {user_pose_thumbnail}")
+                    logger.debug("用户视频骨骼视频缩略图生成成功: %s", user_pose_thumbnail)
                 else:
-                    print("警告: 用户视频骨骼视频缩略图生成失败")
+                    logger.warning("警告: 用户视频骨骼视频缩略图生成失败")
             except Exception as thumb_error:
-                print(f"警告: 生成用户视频骨骼视频缩略图时出错: {thumb_error}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("警告: 生成用户视频骨骼视频缩略图时出错: %s", thumb_error)
             
         except Exception as e:
-            print(f"生成用户视频标记骨骼视频失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("生成用户视频标记骨骼视频失败: %s", e)
             # 清理可能生成的不完整文件
             if os.path.exists(user_pose_video):
                 try:
                     os.remove(user_pose_video)
-                    print(f"已清理不完整的视频文件: {user_pose_video}")
+                    logger.info("已清理不完整的视频文件: %s", user_pose_video)
                 except:
                     pass
             raise Exception(f"生成用户视频标记骨骼视频失败: {str(e)}")
@@ -2134,6 +2261,12 @@ def compare_uploaded_videos():
         db.add_comparison_record(work_id, reference_video_id, user_video_id, threshold)
         db.update_comparison_result(work_id, len(differences), report_path)
 
+        # 预先计算并缓存逐帧对比数据，播放时 GET /api/frame-comparison 直接返回
+        try:
+            build_frame_comparison(work_id, reference_video, user_video, threshold)
+        except Exception as e:
+            logger.warning("警告: 缓存逐帧对比数据失败: %s", e)
+
         # 清理 differences 中的 Infinity 值，确保 JSON 可以正常序列化
         cleaned_differences = []
         for diff in differences:
@@ -2210,10 +2343,10 @@ def delete_user_video(user_video_id):
                 # 删除整个工作目录
                 if os.path.exists(work_dir):
                     shutil.rmtree(work_dir, ignore_errors=True)
-                    print(f"已删除用户视频工作目录: {work_dir}")
+                    logger.info("已删除用户视频工作目录: %s", work_dir)
                 
             except Exception as e:
-                print(f"删除文件时出错: {e}")
+                logger.error("删除文件时出错: %s", e)
                 # 即使文件删除失败，数据库记录已删除，仍然返回成功
 
             return jsonify({
@@ -2321,58 +2454,56 @@ def compare_videos():
                 user_duration = get_video_duration(user_path)
                 user_fps = get_video_fps(user_path)
             except Exception as video_info_error:
-                print(f"[上传用户视频] 警告：无法获取视频信息: {video_info_error}")
+                logger.warning("[上传用户视频] 警告：无法获取视频信息: %s", video_info_error)
                 # 设置默认值
                 user_duration = 0
                 user_fps = 30.0
             
             # 处理异常的duration值（webm格式可能返回极大的负数）
             if user_duration < 0 or user_duration > 86400:  # 超过24小时视为异常
-                print(f"[上传用户视频] 警告：检测到异常的duration值 {user_duration}，重置为0")
+                logger.warning("[上传用户视频] 警告：检测到异常的duration值 %s，重置为0", user_duration)
                 user_duration = 0
 
             # 保存用户视频信息到数据库
-            db_result = db.add_user_video(user_video_id, user_file.filename, user_path, user_duration, user_fps)
+            db_result = db.add_user_video(user_video_id, user_file.filename, user_path, user_duration, user_fps,
+                                          media_info=probe_media(user_path))
             
             if not db_result:
-                print(f"[上传用户视频] 错误：数据库插入失败")
+                logger.error("[上传用户视频] 错误：数据库插入失败")
                 return jsonify({
                     'success': False,
                     'error': '保存视频信息到数据库失败'
                 }), 500
 
             # 检查参考视频是否已有姿势数据
-            reference_poses = {}
-            if db.get_pose_data(reference_video_id):
-                print("使用数据库中已有的参考视频姿势数据...")
-                pose_data_list = db.get_pose_data(reference_video_id)
-                for pose_item in pose_data_list:
-                    reference_poses[pose_item['frame_index']] = pose_item['pose_data']
+            reference_pose_arrays = db.get_reference_pose_arrays(reference_video_id)
+            if reference_pose_arrays is not None and reference_pose_arrays.valid_count > 0:
+                logger.debug("使用数据库中已有的参考视频姿势数据...")
+                reference_pose_arrays = reference_pose_arrays.present()
             else:
-                print("正在提取参考视频的姿势...")
+                logger.debug("正在提取参考视频的姿势...")
                 reference_poses = extract_poses_from_video(
                     reference_path, 
                     n=5
                 )
+                reference_pose_arrays = pack_poses(reference_poses)
                 # 保存参考视频姿势数据到数据库
-                for frame_idx, pose_data in reference_poses.items():
-                    db.save_pose_data(reference_video_id, 'reference', frame_idx, pose_data, frame_idx * 0.2)
+                db.save_pose_data_batch(reference_video_id, 'reference', reference_poses)
 
-            print("正在提取用户视频的姿势...")
+            logger.debug("正在提取用户视频的姿势...")
             recorded_poses = extract_poses_from_video(
                 user_path, 
                 n=5
             )
 
             # 保存用户视频姿势数据到数据库
-            for frame_idx, pose_data in recorded_poses.items():
-                db.save_pose_data(user_video_id, 'user', frame_idx, pose_data, frame_idx * 0.2)
+            db.save_pose_data_batch(user_video_id, 'user', recorded_poses)
 
 
             # 比较姿势差异
-            print("正在比较姿势差异...")
+            logger.debug("正在比较姿势差异...")
             threshold = float(request.form.get('threshold', 0.4))
-            differences = compare_poses(reference_poses, recorded_poses, threshold)
+            differences = compare_poses(reference_pose_arrays, recorded_poses, threshold)
 
             # 生成报告
             report_path = os.path.join(work_dir, "pose_differences_report.txt")
@@ -2415,7 +2546,7 @@ def compare_videos():
                         'filename': ref_filename,
                         'duration': ref_duration,
                         'fps': ref_fps,
-                        'pose_frames': len(reference_poses)
+                        'pose_frames': reference_pose_arrays.frame_count
                     },
                     'user': {
                         'filename': user_file.filename,
@@ -2495,6 +2626,36 @@ def get_database_stats():
             'error': str(e)
         }), 500
 
+@app.route('/api/database/query-stats', methods=['GET', 'DELETE'])
+@require_admin
+def get_database_query_stats():
+    """数据库方法和 SQL 语句的耗时统计（需要 DB_INSTRUMENTATION=1；DELETE 清空统计）
+    
+    查询参数: sort（count / total_ms / avg_ms / p95_ms / p99_ms / max_ms / rows，默认 total_ms），limit（默认 50）
+    """
+    try:
+        if not DB_INSTRUMENTATION:
+            return jsonify({
+                'success': True,
+                'stats': {'enabled': False, 'message': '查询统计未开启，设置环境变量 DB_INSTRUMENTATION=1 后重启服务'}
+            })
+        
+        if request.method == 'DELETE':
+            query_stats.reset()
+            return jsonify({'success': True, 'message': '查询统计已清空'})
+        
+        sort = request.args.get('sort', 'total_ms')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        return jsonify({
+            'success': True,
+            'stats': query_stats.snapshot(sort=sort, limit=limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/videos/<video_id>/pose-data', methods=['GET'])
 def get_video_pose_data(video_id):
     """获取视频的姿势数据"""
@@ -2539,25 +2700,30 @@ def admin_delete_video(video_id):
                     # 删除视频文件
                     if os.path.exists(file_path):
                         os.remove(file_path)
-                        print(f"[管理员] 已删除视频文件: {file_path}")
+                        logger.debug("[管理员] 已删除视频文件: %s", file_path)
                     
                     # 删除工作目录（如果存在）
                     work_dir = os.path.dirname(file_path)
                     if os.path.exists(work_dir) and work_dir != UPLOAD_FOLDER:
                         shutil.rmtree(work_dir, ignore_errors=True)
-                        print(f"[管理员] 已删除视频工作目录: {work_dir}")
+                        logger.debug("[管理员] 已删除视频工作目录: %s", work_dir)
+                
+                # 删除播放转码文件
+                playback_path = video.get('playback_path')
+                if playback_path and os.path.exists(playback_path):
+                    os.remove(playback_path)
                 
                 # 删除缩略图
                 thumbnail_path = video.get('thumbnail_path', '')
                 if thumbnail_path and os.path.exists(thumbnail_path):
                     os.remove(thumbnail_path)
-                    print(f"[管理员] 已删除缩略图: {thumbnail_path}")
+                    logger.debug("[管理员] 已删除缩略图: %s", thumbnail_path)
                     
             except Exception as e:
-                print(f"[管理员] 删除文件时出错: {e}")
+                logger.error("[管理员] 删除文件时出错: %s", e)
             
             admin_username = request.current_user['username']
-            print(f"[管理员] 用户 {admin_username} 删除了{('教学' if video_type == 'reference' else '用户')}视频: {video_id}")
+            logger.info("[管理员] 用户 %s 删除了%s视频: %s", admin_username, '教学' if video_type == 'reference' else '用户', video_id)
             
             return jsonify({
                 'success': True,
@@ -2604,6 +2770,7 @@ def list_user_videos():
 
     Query 参数：
       visibility = public | private  可选，按可见性过滤；不传则返回当前用户的全部视频。
+      fields / limit / cursor        分页和字段选择，见 parse_list_params。
 
     隐私边界：本接口始终限定 user_id=current_user，永远不会把别人的 private 暴露出来。
     """
@@ -2616,50 +2783,25 @@ def list_user_videos():
         if visibility not in ('public', 'private'):
             visibility = None
 
-        # 只获取当前用户的永久视频（有user_id且file_path在uploads/user目录下）
-        all_videos = db.get_user_videos(current_user_id, visibility=visibility)
-        
-        print(f"[用户视频列表] 查询用户ID {current_user_id} visibility={visibility}，找到 {len(all_videos)} 个视频")
-        
-        # 过滤出永久存储的视频（排除临时文件路径）
-        permanent_videos = []
-        user_upload_folder = os.path.join(UPLOAD_FOLDER, 'user')
-        user_upload_folder_abs = os.path.abspath(user_upload_folder)
-        temp_folder_abs = os.path.abspath(TEMP_FOLDER)
-        
-        for video in all_videos:
-            file_path = video.get('file_path', '')
-            video_id = video.get('video_id', 'unknown')
-            
-            if not file_path:
-                print(f"[用户视频列表] 跳过无路径的视频: {video_id}")
-                continue
-                
-            file_path_lower = file_path.lower()
-            
-            # 排除临时文件路径（temp目录下的文件）
-            if 'temp' in file_path_lower or temp_folder_abs in os.path.abspath(file_path):
-                print(f"[用户视频列表] 跳过临时文件: {file_path} (video_id: {video_id})")
-                continue
-            
-            # 检查文件路径是否在永久存储目录下
-            file_path_abs = os.path.abspath(file_path)
-            if (user_upload_folder_abs in file_path_abs or 
-                file_path.startswith('uploads/user') or 
-                'uploads/user' in file_path or
-                'uploads\\user' in file_path):
-                # 添加作者信息（当前登录用户的用户名）
-                video['author'] = current_username
-                permanent_videos.append(video)
-                print(f"[用户视频列表] 包含永久文件: {file_path} (video_id: {video_id})")
-            else:
-                print(f"[用户视频列表] 跳过非永久存储文件: {file_path} (video_id: {video_id})")
+        try:
+            fields, limit, after = parse_list_params()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # 只获取当前用户的永久视频（file_path 在 uploads/user 目录下，过滤在查询中完成）
+        videos = db.get_user_videos(current_user_id, visibility=visibility, fields=fields,
+                                    limit=limit + 1 if limit else None, after=after)
+        videos, next_cursor = paginate_video_list(videos, limit, fields, {
+            'author': lambda video: current_username,
+        })
         
-        print(f"[用户视频列表] 最终返回 {len(permanent_videos)} 个永久视频")
+        logger.debug("[用户视频列表] 查询用户ID %s visibility=%s，返回 %s 个视频", current_user_id, visibility, len(videos))
         
         return jsonify({
             'success': True,
-            'videos': permanent_videos
+            'videos': videos,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
     except Exception as e:
         return jsonify({
@@ -2669,24 +2811,36 @@ def list_user_videos():
 
 @app.route('/api/comments/<video_id>', methods=['GET'], endpoint='get_comments')
 def get_comments(video_id):
-    """获取视频的评论列表"""
+    """获取视频的评论列表（按发表时间倒序分页）
+    
+    Query 参数：
+      video_type = reference / user，默认 user
+      limit      = 每页条数，默认且最多 COMMENTS_MAX_LIMIT
+      before_id  = 上一页返回的 next_before_id
+    
+    total 为视频的评论总数（video_engagement.comment_count），不受分页影响
+    """
     try:
         video_type = request.args.get('video_type', 'user')  # 默认为 user
+        limit = request.args.get('limit', COMMENTS_MAX_LIMIT, type=int)
+        limit = max(1, min(limit, COMMENTS_MAX_LIMIT))
+        before_id = request.args.get('before_id', type=int)
         
-        print(f"[获取评论] video_id: {video_id}, video_type: {video_type}")
-        
-        comments = db.get_comments(video_id, video_type)
-        
-        print(f"[获取评论] 找到 {len(comments)} 条评论")
+        # 多查一条用于判断是否还有下一页
+        comments = db.get_comments(video_id, video_type, before_id=before_id, limit=limit + 1)
+        has_more = len(comments) > limit
+        comments = comments[:limit]
+        total = db.get_engagement([video_id], video_type)[video_id]['comment_count']
         
         return jsonify({
             'success': True,
-            'comments': comments
+            'comments': comments,
+            'total': total,
+            'next_before_id': comments[-1]['id'] if has_more else None,
+            'has_more': has_more
         })
     except Exception as e:
-        print(f"[获取评论] 错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[获取评论] 错误: %s", str(e))
         return jsonify({
             'success': False,
             'error': str(e)
@@ -2697,15 +2851,10 @@ def get_comments(video_id):
 def add_comment():
     """添加评论 - 需要登录"""
     try:
-        print(f"[添加评论] 收到请求，请求方法: {request.method}")
-        print(f"[添加评论] 请求头 Content-Type: {request.headers.get('Content-Type')}")
-        print(f"[添加评论] 请求数据: {request.get_data(as_text=True)}")
-        
         data = request.get_json()
-        print(f"[添加评论] 解析后的JSON数据: {data}")
         
         if not data:
-            print("[添加评论] 错误: 请求数据为空或不是有效的JSON")
+            logger.warning("[添加评论] 错误: 请求数据为空或不是有效的JSON")
             return jsonify({
                 'success': False,
                 'error': '请求数据格式错误'
@@ -2715,25 +2864,25 @@ def add_comment():
         video_type = data.get('video_type', 'user').strip()
         content = data.get('content', '').strip()
         
-        print(f"[添加评论] video_id: {video_id}, video_type: {video_type}, content长度: {len(content)}")
+        logger.debug("[添加评论] video_id: %s, video_type: %s, content长度: %s", video_id, video_type, len(content))
         
         # 验证输入
         if not video_id:
-            print("[添加评论] 错误: 视频ID为空")
+            logger.warning("[添加评论] 错误: 视频ID为空")
             return jsonify({
                 'success': False,
                 'error': '视频ID不能为空'
             }), 400
         
         if not content:
-            print("[添加评论] 错误: 评论内容为空")
+            logger.warning("[添加评论] 错误: 评论内容为空")
             return jsonify({
                 'success': False,
                 'error': '评论内容不能为空'
             }), 400
         
         if video_type not in ['reference', 'user']:
-            print(f"[添加评论] 错误: 无效的视频类型: {video_type}")
+            logger.warning("[添加评论] 错误: 无效的视频类型: %s", video_type)
             return jsonify({
                 'success': False,
                 'error': '无效的视频类型'
@@ -2741,25 +2890,19 @@ def add_comment():
         
         # 获取当前用户ID
         user_id = request.current_user['user_id']
-        print(f"[添加评论] 当前用户ID: {user_id}")
+        logger.debug("[添加评论] 当前用户ID: %s", user_id)
         
         # 添加评论
-        print(f"[添加评论] 准备调用数据库添加评论...")
-        result = db.add_comment(video_id, video_type, user_id, content)
-        print(f"[添加评论] 数据库操作结果: {result}")
+        new_comment = db.add_comment(video_id, video_type, user_id, content)
         
-        if not result:
-            print("[添加评论] 错误: 数据库添加评论失败")
+        if not new_comment:
+            logger.error("[添加评论] 错误: 数据库添加评论失败")
             return jsonify({
                 'success': False,
                 'error': '添加评论失败'
             }), 500
         
-        # 获取最新添加的评论（包含用户名）
-        print(f"[添加评论] 获取评论列表...")
-        comments = db.get_comments(video_id, video_type)
-        new_comment = comments[0] if comments else None
-        print(f"[添加评论] 成功添加评论，评论ID: {new_comment.get('id') if new_comment else 'None'}")
+        logger.info("[添加评论] 成功添加评论，评论ID: %s", new_comment['id'])
         
         return jsonify({
             'success': True,
@@ -2768,9 +2911,7 @@ def add_comment():
         })
         
     except Exception as e:
-        print(f"[添加评论] 异常: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[添加评论] 异常: %s", str(e))
         return jsonify({
             'success': False,
             'error': str(e)
@@ -2793,12 +2934,10 @@ def toggle_like():
         
         user_id = request.current_user['user_id']
         
-        # 切换点赞状态
-        success, is_liked = db.toggle_like(video_id, video_type, user_id)
+        # 切换点赞状态（同一事务中更新点赞数并返回）
+        success, is_liked, like_count = db.toggle_like(video_id, video_type, user_id)
         
         if success:
-            # 获取更新后的点赞数量
-            like_count = db.get_like_count(video_id, video_type)
             return jsonify({
                 'success': True,
                 'is_liked': is_liked,
@@ -2816,36 +2955,71 @@ def toggle_like():
             'error': str(e)
         }), 500
 
+def optional_current_user_id():
+    """已登录时返回当前用户ID，未登录或 Token 无效时返回 None（用于不强制登录的接口）"""
+    try:
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else ''
+        if token:
+            result = authenticate_token(token)
+            if result and result.get('valid'):
+                return result['user_id']
+    except Exception as e:
+        # 未登录或获取用户信息失败，按未登录处理
+        logger.warning("获取当前用户失败: %s", e)
+    return None
+
 @app.route('/api/likes/<video_id>', methods=['GET'], endpoint='get_like_info')
 def get_like_info(video_id):
     """获取视频的点赞信息（点赞数量和当前用户是否已点赞）"""
     try:
         video_type = request.args.get('video_type', 'user').strip()
         
-        # 获取点赞数量
-        like_count = db.get_like_count(video_id, video_type)
+        # 点赞数量和当前用户是否已点赞（如果已登录）一次查询
+        engagement = db.get_engagement([video_id], video_type, optional_current_user_id())[video_id]
         
-        # 检查当前用户是否已点赞（如果已登录）
-        is_liked = False
-        try:
-            auth_header = request.headers.get('Authorization', '')
-            token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else ''
+        return jsonify({
+            'success': True,
+            'like_count': engagement['like_count'],
+            'is_liked': engagement['is_liked']
+        })
             
-            if token:
-                result = verify_auth_token(token)
-                if result and result.get('valid'):
-                    user_id = result['user_id']
-                    is_liked = db.is_liked(video_id, video_type, user_id)
-        except Exception as e:
-            # 未登录或获取用户信息失败，默认为未点赞
-            print(f"获取用户点赞状态失败: {e}")
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/engagement', methods=['GET'], endpoint='get_engagement')
+def get_engagement():
+    """批量获取视频的点赞数、评论数和当前用户是否已点赞（视频列表一页一次请求）
+    
+    Query 参数：
+      video_ids  = 逗号分隔的视频ID，最多 ENGAGEMENT_MAX_VIDEOS 个
+      video_type = user | reference，默认 user
+    """
+    try:
+        video_type = request.args.get('video_type', 'user').strip()
+        video_ids = [v.strip() for v in request.args.get('video_ids', '').split(',') if v.strip()]
+        
+        if not video_ids:
+            return jsonify({
+                'success': False,
+                'error': '视频ID不能为空'
+            }), 400
+        if len(video_ids) > ENGAGEMENT_MAX_VIDEOS:
+            return jsonify({
+                'success': False,
+                'error': f'一次最多查询 {ENGAGEMENT_MAX_VIDEOS} 个视频'
+            }), 400
+        
+        engagement = db.get_engagement(video_ids, video_type, optional_current_user_id())
         
         return jsonify({
             'success': True,
-            'like_count': like_count,
-            'is_liked': is_liked
+            'engagement': engagement
         })
-            
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -2923,24 +3097,28 @@ def upload_reference_video():
                 }), 403
 
         # 保存到数据库（保存原始视频路径，用于播放）
-        if not db.add_reference_video(video_id, filename, original_filepath, duration, fps, description, tags, author, title, thumbnail_path, category):
+        if not db.add_reference_video(video_id, filename, original_filepath, duration, fps, description, tags, author, title, thumbnail_path, category,
+                                      media_info=probe_media(original_filepath)):
             return jsonify({
                 'success': False,
                 'error': '保存到数据库失败'
             }), 500
 
-        # 创建异步任务
-        db.create_async_task(task_id, video_id, 'reference', 'pose_extraction')
-        
-        # 启动后台线程处理骨骼提取（传入原始文件路径，函数内部会转换）
-        thread = threading.Thread(
-            target=async_extract_poses_and_generate_video,
-            args=(task_id, video_id, original_filepath, 'reference')
-        )
-        thread.daemon = True
-        thread.start()
+        # 提交骨骼提取任务到任务队列（直接读取原始文件）
+        if not task_queue.submit(task_id, video_id, 'reference', 'pose_extraction',
+                                 PRIORITY_NORMAL, {'file_path': original_filepath}):
+            error_msg = '提交骨骼提取任务失败'
+            logger.error("[上传参考视频] 错误：视频 %s %s", video_id, error_msg)
+            db.update_pose_extraction_status(video_id, True, 'reference', error_msg)
+            return jsonify({
+                'success': False,
+                'error': error_msg
+            }), 500
+        if not task_queue.submit(str(uuid.uuid4()), video_id, 'reference', 'playback_transcode',
+                                 PRIORITY_LOW, {'file_path': original_filepath}):
+            logger.warning("[上传参考视频] 警告：视频 %s 提交播放转码任务失败", video_id)
         
-        print(f"视频 {filename} 上传成功，已启动后台任务 {task_id} 进行骨骼提取")
+        logger.info("视频 %s 上传成功，已提交后台任务 %s 进行骨骼提取", filename, task_id)
 
         return jsonify({
             'success': True,
@@ -3020,14 +3198,15 @@ def upload_user_video_permanent():
         current_user_id = str(request.current_user['user_id'])
 
         # 保存到数据库（保存原始视频路径，用于播放）
-        if not db.add_user_video(video_id, filename, original_filepath, duration, fps, user_id=current_user_id, title=title):
+        if not db.add_user_video(video_id, filename, original_filepath, duration, fps, user_id=current_user_id, title=title,
+                                 media_info=probe_media(original_filepath)):
             return jsonify({
                 'success': False,
                 'error': '保存到数据库失败'
             }), 500
 
         # 用户视频不需要处理骨骼数据，直接返回成功
-        print(f"用户视频 {filename} 上传成功（永久存储）")
+        logger.info("用户视频 %s 上传成功（永久存储）", filename)
 
         return jsonify({
             'success': True,
@@ -3138,7 +3317,7 @@ def upload_user_video_from_work():
             }), 500
 
         # 用户视频不需要处理骨骼数据，直接返回成功
-        print(f"用户视频 {filename} 从workId {work_id} 上传成功（永久存储, visibility={visibility}）")
+        logger.info("用户视频 %s 从workId %s 上传成功（永久存储, visibility=%s）", filename, work_id, visibility)
 
         return jsonify({
             'success': True,
@@ -3154,8 +3333,7 @@ def upload_user_video_from_work():
         })
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("[从作品上传] 上传失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -3163,22 +3341,31 @@ def upload_user_video_from_work():
 
 @app.route('/api/reference-videos', methods=['GET'])
 def list_reference_videos():
-    """列出参考视频，可通过 ?category=beginner|normal 过滤"""
+    """列出参考视频，可通过 ?category=beginner|normal 过滤；支持 fields / limit / cursor 分页（见 parse_list_params）"""
     try:
         category = request.args.get('category')
         if category and category not in ('normal', 'beginner'):
             category = None
-
-        videos = db.get_reference_videos(category=category)
         
-        # 为每个视频添加是否已提取姿势数据和标记骨骼视频的标记
-        for video in videos:
-            video['has_pose_data'] = bool(db.get_pose_data(video['video_id']))
-            video['has_pose_video'] = bool(video.get('pose_video_generated', 0))
+        try:
+            fields, limit, after = parse_list_params()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # 是否已提取姿势数据和标记骨骼视频的标记由这两个字段计算
+        query_fields = fields + ['pose_frame_count', 'pose_video_generated'] if fields else None
+        videos = db.get_reference_videos(category=category, fields=query_fields,
+                                         limit=limit + 1 if limit else None, after=after)
+        videos, next_cursor = paginate_video_list(videos, limit, fields, {
+            'has_pose_data': lambda video: bool(video.get('pose_frame_count')),
+            'has_pose_video': lambda video: bool(video.get('pose_video_generated', 0)),
+        })
         
         return jsonify({
             'success': True,
-            'videos': videos
+            'videos': videos,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
 
     except Exception as e:
@@ -3221,6 +3408,10 @@ def get_task_status(task_id):
                 'error': '任务不存在'
             }), 404
         
+        # 排队中的任务返回队列位置（1 表示下一个执行）
+        task.pop('payload', None)
+        task['queue_position'] = db.get_task_queue_position(task_id) if task['status'] == 'pending' else None
+        
         # 如果任务已完成，检查视频的实际状态
         if task['status'] == 'completed':
             video_id = task['video_id']
@@ -3230,7 +3421,7 @@ def get_task_status(task_id):
             if video_info:
                 task['pose_data_extracted'] = bool(video_info.get('pose_data_extracted', 0))
                 task['pose_video_generated'] = bool(video_info.get('pose_video_generated', 0))
-                task['pose_frames'] = len(db.get_pose_data(video_id))
+                task['pose_frames'] = video_info.get('pose_frame_count') or 0
         
         return jsonify({
             'success': True,
@@ -3283,7 +3474,7 @@ def get_default_reference_video():
             default_video = videos[0]  # 如果没有test_video，选择第一个
         
         # 添加是否已提取姿势数据的标记
-        default_video['has_pose_data'] = bool(db.get_pose_data(default_video['video_id']))
+        default_video['has_pose_data'] = bool(default_video.get('pose_frame_count'))
         
         return jsonify({
             'success': True,
@@ -3328,53 +3519,16 @@ def stream_video(video_id):
         if not video_info:
             return jsonify({'error': '视频不存在'}), 404
         
-        file_path = video_info['file_path']
+        # 原始文件浏览器无法播放时，优先使用后台转码生成的播放文件
+        file_path = video_info.get('playback_path') or video_info['file_path']
+        if not os.path.exists(file_path):
+            file_path = video_info['file_path']
         
         if not os.path.exists(file_path):
             return jsonify({'error': '视频文件不存在'}), 404
         
-        # 根据文件扩展名获取正确的MIME类型
-        mimetype = get_video_mimetype(file_path)
-        
-        # 支持范围请求（Range requests）
-        range_header = request.headers.get('Range', None)
-        
-        if range_header:
-            # 处理范围请求
-            import re
-            size = os.path.getsize(file_path)
-            byte1, byte2 = 0, None
-            
-            m = re.search(r'(\d+)-(\d*)', range_header)
-            g = m.groups()
-            
-            if g[0]: byte1 = int(g[0])
-            if g[1]: byte2 = int(g[1])
-            
-            if byte2 is None:
-                byte2 = size - 1
-            
-            length = byte2 - byte1 + 1
-            
-            with open(file_path, 'rb') as f:
-                f.seek(byte1)
-                data = f.read(length)
-            
-            from flask import Response
-            rv = Response(data, 
-                         206,
-                         mimetype=mimetype,
-                         direct_passthrough=True)
-            rv.headers['Content-Range'] = f'bytes {byte1}-{byte2}/{size}'
-            rv.headers['Accept-Ranges'] = 'bytes'
-            rv.headers['Content-Length'] = str(length)
-            return rv
-        else:
-            # 完整文件请求
-            from flask import send_file
-            response = send_file(file_path, mimetype=mimetype)
-            response.headers['Accept-Ranges'] = 'bytes'
-            return response
+        # 根据文件扩展名获取正确的MIME类型；范围请求按块读取，不会把整段文件读入内存
+        return serve_file(file_path, get_video_mimetype(file_path))
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -3446,12 +3600,10 @@ def get_thumbnail(video_id):
             }), 404
         
         # 返回缩略图文件
-        from flask import send_file
-        return send_file(thumbnail_path, mimetype='image/jpeg')
+        return serve_file(thumbnail_path, 'image/jpeg')
         
     except Exception as e:
-        print(f"获取缩略图错误: {str(e)}")
-        traceback.print_exc()
+        logger.exception("获取缩略图错误: %s", str(e))
         return jsonify({
             'success': False,
             'error': str(e)
@@ -3471,133 +3623,30 @@ def get_pose_video(work_id, video_type):
         else:
             video_file = os.path.join(report_dir, "user_pose_video.mp4")
         
-        print(f"[获取标记骨骼视频] work_id={work_id}, video_type={video_type}")
-        print(f"[获取标记骨骼视频] 视频文件路径: {video_file}")
-        print(f"[获取标记骨骼视频] 报告目录是否存在: {os.path.exists(report_dir)}")
-        print(f"[获取标记骨骼视频] 视频文件是否存在: {os.path.exists(video_file)}")
-        
-        if not os.path.exists(report_dir):
-            print(f"[获取标记骨骼视频] 错误: 报告目录不存在: {report_dir}")
-            return jsonify({'error': f'报告目录不存在: {report_dir}'}), 404
-        
         if not os.path.exists(video_file):
-            print(f"[获取标记骨骼视频] 错误: 视频文件不存在: {video_file}")
+            logger.error("[获取标记骨骼视频] 错误: 视频文件不存在: %s", video_file)
+            if not os.path.exists(report_dir):
+                return jsonify({'error': f'报告目录不存在: {report_dir}'}), 404
             # 列出目录内容以便调试
-            if os.path.exists(report_dir):
-                files = os.listdir(report_dir)
-                print(f"[获取标记骨骼视频] 报告目录中的文件: {files}")
+            logger.debug("[获取标记骨骼视频] 报告目录中的文件: %s", os.listdir(report_dir))
             return jsonify({'error': f'视频文件不存在: {video_file}'}), 404
         
-        # 检查文件大小
-        file_size = os.path.getsize(video_file)
-        print(f"[获取标记骨骼视频] 视频文件大小: {file_size} 字节")
-        if file_size == 0:
-            print(f"[获取标记骨骼视频] 警告: 视频文件大小为0")
-            return jsonify({'error': '视频文件为空'}), 500
-        
-        # 验证视频文件格式（使用ffprobe检查）
-        video_valid = False
-        try:
-            import subprocess
-            cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=format_name,duration', '-of', 'json', video_file]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                import json
-                data = json.loads(result.stdout)
-                format_name = data.get('format', {}).get('format_name', 'unknown')
-                duration = data.get('format', {}).get('duration', '0')
-                print(f"[获取标记骨骼视频] 视频格式: {format_name}, 时长: {duration}秒")
-                # 检查格式是否包含 mp4 或 mov（浏览器兼容格式）
-                if 'mp4' in format_name.lower() or 'mov' in format_name.lower() or 'quicktime' in format_name.lower():
-                    video_valid = True
-                else:
-                    print(f"[获取标记骨骼视频] 警告: 视频格式可能不兼容: {format_name}")
-            else:
-                print(f"[获取标记骨骼视频] 警告: 无法验证视频格式: {result.stderr}")
-                # 如果 ffprobe 失败，尝试使用 OpenCV 验证
-                try:
-                    import cv2
-                    cap = cv2.VideoCapture(video_file)
-                    if cap.isOpened():
-                        ret, frame = cap.read()
-                        cap.release()
-                        if ret and frame is not None:
-                            video_valid = True
-                            print(f"[获取标记骨骼视频] 使用 OpenCV 验证成功")
-                        else:
-                            print(f"[获取标记骨骼视频] 错误: OpenCV 无法读取视频帧")
-                    else:
-                        print(f"[获取标记骨骼视频] 错误: OpenCV 无法打开视频文件")
-                except Exception as cv_error:
-                    print(f"[获取标记骨骼视频] OpenCV 验证失败: {cv_error}")
-        except FileNotFoundError:
-            print(f"[获取标记骨骼视频] 警告: ffprobe 未找到，跳过格式验证")
-            # 如果 ffprobe 不可用，尝试使用 OpenCV 验证
-            try:
-                import cv2
-                cap = cv2.VideoCapture(video_file)
-                if cap.isOpened():
-                    ret, frame = cap.read()
-                    cap.release()
-                    if ret and frame is not None:
-                        video_valid = True
-                        print(f"[获取标记骨骼视频] 使用 OpenCV 验证成功")
-                    else:
-                        print(f"[获取标记骨骼视频] 错误: OpenCV 无法读取视频帧")
-                else:
-                    print(f"[获取标记骨骼视频] 错误: OpenCV 无法打开视频文件")
-            except Exception as cv_error:
-                print(f"[获取标记骨骼视频] OpenCV 验证失败: {cv_error}")
-        except Exception as e:
-            print(f"[获取标记骨骼视频] 警告: 验证视频格式时出错: {e}")
+        # 视频写入时已验证并记录在报告清单中；旧报告没有清单（或文件被替换过）时补做一次验证
+        verdict = lookup_pose_video(report_dir, video_type, video_file)
+        if verdict is None:
+            logger.info("[获取标记骨骼视频] 报告清单中没有 %s 视频的验证记录，验证并记录: %s", video_type, video_file)
+            verdict = record_pose_video(report_dir, video_type, video_file)
         
         # 如果视频无效，返回错误
-        if not video_valid:
-            print(f"[获取标记骨骼视频] 错误: 视频文件无效或格式不兼容")
+        if not verdict['valid']:
+            logger.error("[获取标记骨骼视频] 错误: 视频文件无效或格式不兼容: %s", verdict['error'])
             return jsonify({
                 'error': '视频文件无效或格式不兼容，无法播放',
-                'details': '请重新生成视频或检查视频文件'
+                'details': verdict['error'] or '请重新生成视频或检查视频文件'
             }), 500
         
-        # 支持范围请求
-        range_header = request.headers.get('Range', None)
-        
-        if range_header:
-            # 处理范围请求
-            import re
-            size = os.path.getsize(video_file)
-            byte1, byte2 = 0, None
-            
-            m = re.search(r'(\d+)-(\d*)', range_header)
-            g = m.groups()
-            
-            if g[0]: byte1 = int(g[0])
-            if g[1]: byte2 = int(g[1])
-            
-            if byte2 is None:
-                byte2 = size - 1
-            
-            length = byte2 - byte1 + 1
-            
-            with open(video_file, 'rb') as f:
-                f.seek(byte1)
-                data = f.read(length)
-            
-            from flask import Response
-            rv = Response(data, 
-                         206,
-                         mimetype='video/mp4',
-                         direct_passthrough=True)
-            rv.headers['Content-Range'] = f'bytes {byte1}-{byte2}/{size}'
-            rv.headers['Accept-Ranges'] = 'bytes'
-            rv.headers['Content-Length'] = str(length)
-            return rv
-        else:
-            # 完整文件请求
-            from flask import send_file
-            response = send_file(video_file, mimetype='video/mp4')
-            response.headers['Accept-Ranges'] = 'bytes'
-            return response
+        # 支持范围请求（纯文件读取，不再做任何验证）
+        return serve_file(video_file, 'video/mp4')
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -3616,15 +3665,15 @@ def get_pose_video_thumbnail(work_id, video_type):
         else:
             thumbnail_file = os.path.join(report_dir, "user_pose_thumbnail.jpg")
         
-        print(f"[获取骨骼视频缩略图] work_id={work_id}, video_type={video_type}")
-        print(f"[获取骨骼视频缩略图] 缩略图文件路径: {thumbnail_file}")
+        logger.debug("[获取骨骼视频缩略图] work_id=%s, video_type=%s", work_id, video_type)
+        logger.debug("[获取骨骼视频缩略图] 缩略图文件路径: %s", thumbnail_file)
         
         if not os.path.exists(report_dir):
-            print(f"[获取骨骼视频缩略图] 错误: 报告目录不存在: {report_dir}")
+            logger.error("[获取骨骼视频缩略图] 错误: 报告目录不存在: %s", report_dir)
             return jsonify({'error': '报告目录不存在'}), 404
         
         if not os.path.exists(thumbnail_file):
-            print(f"[获取骨骼视频缩略图] 警告: 缩略图文件不存在: {thumbnail_file}")
+            logger.warning("[获取骨骼视频缩略图] 警告: 缩略图文件不存在: %s", thumbnail_file)
             # 如果缩略图不存在，尝试从视频生成
             if video_type == 'reference':
                 video_file = os.path.join(report_dir, "reference_pose_video.mp4")
@@ -3632,7 +3681,7 @@ def get_pose_video_thumbnail(work_id, video_type):
                 video_file = os.path.join(report_dir, "user_pose_video.mp4")
             
             if os.path.exists(video_file):
-                print(f"[获取骨骼视频缩略图] 尝试从视频生成缩略图: {video_file}")
+                logger.info("[获取骨骼视频缩略图] 尝试从视频生成缩略图: %s", video_file)
                 try:
                     thumbnail_path = generate_video_thumbnail(video_file, report_dir)
                     if thumbnail_path:
@@ -3642,13 +3691,11 @@ def get_pose_video_thumbnail(work_id, video_type):
                             if os.path.exists(thumbnail_file):
                                 os.remove(thumbnail_file)
                             shutil.move(thumbnail_path, thumbnail_file)
-                        print(f"[获取骨骼视频缩略图] 成功生成缩略图: {thumbnail_file}")
+                        logger.info("[获取骨骼视频缩略图] 成功生成缩略图: %s", thumbnail_file)
                     else:
                         return jsonify({'error': '无法生成缩略图'}), 500
                 except Exception as e:
-                    print(f"[获取骨骼视频缩略图] 生成缩略图失败: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception("[获取骨骼视频缩略图] 生成缩略图失败: %s", e)
                     return jsonify({'error': f'生成缩略图失败: {str(e)}'}), 500
             else:
                 return jsonify({'error': '视频文件不存在，无法生成缩略图'}), 404
@@ -3656,22 +3703,95 @@ def get_pose_video_thumbnail(work_id, video_type):
         # 检查文件大小
         file_size = os.path.getsize(thumbnail_file)
         if file_size == 0:
-            print(f"[获取骨骼视频缩略图] 警告: 缩略图文件大小为0")
+            logger.warning("[获取骨骼视频缩略图] 警告: 缩略图文件大小为0")
             return jsonify({'error': '缩略图文件为空'}), 500
         
-        print(f"[获取骨骼视频缩略图] 成功返回缩略图，大小: {file_size} 字节")
+        logger.debug("[获取骨骼视频缩略图] 成功返回缩略图，大小: %s 字节", file_size)
         from flask import send_file
         return send_file(thumbnail_file, mimetype='image/jpeg', as_attachment=False)
         
     except Exception as e:
-        print(f"[获取骨骼视频缩略图] 错误: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[获取骨骼视频缩略图] 错误: %s", e)
         return jsonify({'error': str(e)}), 500
 
+def build_frame_comparison(work_id, reference_video, user_video, threshold):
+    """计算逐帧对比数据并写入 frame_comparison_cache
+
+    Returns:
+        (payload, etag)：payload 为完整响应的 JSON 字符串
+    """
+    reference_video_id = reference_video['video_id']
+    user_video_id = user_video['video_id']
+    
+    # 获取骨骼数据（只取检测到骨骼的帧，按顺序一一配对）
+    reference_pose_arrays = db.get_reference_pose_arrays(reference_video_id)
+    user_pose_arrays = db.get_pose_arrays(user_video_id)
+    reference_pose_arrays = reference_pose_arrays.present() if reference_pose_arrays is not None else pack_poses({})
+    user_pose_arrays = user_pose_arrays.present() if user_pose_arrays is not None else pack_poses({})
+    
+    # 批量计算逐帧差异
+    result = compare_pose_arrays(reference_pose_arrays, user_pose_arrays, threshold)
+    
+    # 获取两个视频的FPS信息，用于准确计算时间戳
+    ref_fps = reference_video.get('fps', 5)  # 默认5fps
+    
+    # 使用参考视频的FPS来计算时间戳，因为时间轴以参考视频为准
+    timestamps = result.reference_frames / ref_fps
+    
+    frame_comparisons = []
+    for i, (ref_frame_idx, user_frame_idx, timestamp, difference, has_difference, has_pose_data, pose_quality_issue) in enumerate(zip(
+            result.reference_frames.tolist(),
+            result.user_frames.tolist(),
+            timestamps.tolist(),
+            clean_differences(result.differences).tolist(),
+            result.has_difference.tolist(),
+            result.has_pose_data.tolist(),
+            result.pose_quality_issue.tolist())):
+        frame_comparisons.append({
+            'frame_index': i,
+            'reference_frame': ref_frame_idx,
+            'user_frame': user_frame_idx,
+            'timestamp': timestamp,
+            'difference': difference,
+            'has_difference': has_difference,
+            'has_pose_data': has_pose_data,
+            'pose_quality_issue': pose_quality_issue
+        })
+    
+    payload = app.json.dumps({
+        'success': True,
+        'work_id': work_id,
+        'video_info': {
+            'reference': {
+                'video_id': reference_video_id,
+                'filename': reference_video['filename'],
+                'duration': reference_video['duration'],
+                'fps': reference_video['fps']
+            },
+            'user': {
+                'video_id': user_video_id,
+                'filename': user_video['filename'],
+                'duration': user_video['duration'],
+                'fps': user_video['fps']
+            }
+        },
+        'frame_comparisons': frame_comparisons,
+        'threshold': threshold
+    })
+    etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    # 缓存结果（记录两边姿势数据的版本号，重新提取后自动失效）
+    db.save_frame_comparison_cache(
+        work_id, threshold, reference_video_id, user_video_id,
+        reference_pose_arrays.version, user_pose_arrays.version,
+        payload, etag
+    )
+    
+    return payload, etag
+
 @app.route('/api/frame-comparison/<work_id>', methods=['GET'])
 def get_frame_comparison(work_id):
-    """获取逐帧对比数据"""
+    """获取逐帧对比数据（优先返回缓存，支持 ETag / If-None-Match）"""
     try:
         # 从数据库获取比较记录
         comparison_record = db.get_comparison_record(work_id)
@@ -3681,116 +3801,28 @@ def get_frame_comparison(work_id):
                 'error': '比较记录不存在'
             }), 404
         
-        reference_video_id = comparison_record['reference_video_id']
-        user_video_id = comparison_record['user_video_id']
-        
-        # 获取视频信息
-        reference_video = db.get_video_by_id(reference_video_id, 'reference')
-        user_video = db.get_video_by_id(user_video_id, 'user')
+        threshold = comparison_record['threshold']
         
-        if not reference_video or not user_video:
-            return jsonify({
-                'success': False,
-                'error': '视频信息不存在'
-            }), 404
-        
-        # 获取骨骼数据
-        reference_poses = {}
-        reference_pose_data = db.get_pose_data(reference_video_id)
-        if reference_pose_data:
-            for pose_item in reference_pose_data:
-                reference_poses[pose_item['frame_index']] = pose_item['pose_data']
-        
-        user_poses = {}
-        user_pose_data = db.get_pose_data(user_video_id)
-        if user_pose_data:
-            for pose_item in user_pose_data:
-                user_poses[pose_item['frame_index']] = pose_item['pose_data']
-        
-        # 计算逐帧差异
-        frame_comparisons = []
-        ref_frames = sorted(reference_poses.keys())
-        user_frames = sorted(user_poses.keys())
-        
-        min_frames = min(len(ref_frames), len(user_frames))
-        
-        # 获取两个视频的FPS信息，用于准确计算时间戳
-        ref_fps = reference_video.get('fps', 5)  # 默认5fps
-        user_fps = user_video.get('fps', 5)      # 默认5fps
-        
-        for i in range(min_frames):
-            ref_frame_idx = ref_frames[i]
-            user_frame_idx = user_frames[i]
-            
-            ref_pose = reference_poses[ref_frame_idx]
-            user_pose = user_poses[user_frame_idx]
-            
-            # 计算姿势差异
-            pose_diff = calculate_pose_difference(ref_pose, user_pose)
-            
-            # 使用实际帧索引计算时间戳，确保时间戳基于实际对比的帧数
-            # 使用参考视频的FPS来计算时间戳，因为时间轴以参考视频为准
-            timestamp = ref_frame_idx / ref_fps
-            
-            # 判断骨骼数据状态
-            has_pose_data = ref_pose is not None and user_pose is not None
-            has_difference = False
-            pose_quality_issue = False
-            
-            if has_pose_data:
-                # 有骨骼数据时，检查质量
-                # 使用很大的数字（999999.0）表示质量差，而不是 Infinity
-                if pose_diff >= 999999.0:
-                    # 骨骼提取质量差（有效点太少）
-                    pose_quality_issue = True
-                    has_difference = True  # 标记为有差异
-                elif pose_diff > comparison_record['threshold']:
-                    # 差异过大
-                    has_difference = True
-                else:
-                    # 正常差异
-                    has_difference = False
-            else:
-                # 无骨骼数据时，标记为无法比较
-                pose_diff = -1
-                has_difference = True  # 标记为有差异（因为无法比较）
+        cached = db.get_frame_comparison_cache(work_id, threshold)
+        if cached:
+            payload, etag = cached['payload'], cached['etag']
+        else:
+            # 获取视频信息
+            reference_video = db.get_video_by_id(comparison_record['reference_video_id'], 'reference')
+            user_video = db.get_video_by_id(comparison_record['user_video_id'], 'user')
             
-            # 清理 Infinity 值，确保 JSON 可以正常序列化
-            cleaned_diff = float(pose_diff)
-            if isinstance(cleaned_diff, float) and (cleaned_diff == float('inf') or cleaned_diff != cleaned_diff):  # 检查 inf 和 NaN
-                cleaned_diff = 999999.0
+            if not reference_video or not user_video:
+                return jsonify({
+                    'success': False,
+                    'error': '视频信息不存在'
+                }), 404
             
-            frame_comparisons.append({
-                'frame_index': i,
-                'reference_frame': ref_frame_idx,
-                'user_frame': user_frame_idx,
-                'timestamp': timestamp,
-                'difference': cleaned_diff,
-                'has_difference': has_difference,
-                'has_pose_data': has_pose_data,
-                'pose_quality_issue': pose_quality_issue
-            })
+            payload, etag = build_frame_comparison(work_id, reference_video, user_video, threshold)
         
-        return jsonify({
-            'success': True,
-            'work_id': work_id,
-            'video_info': {
-                'reference': {
-                    'video_id': reference_video_id,
-                    'filename': reference_video['filename'],
-                    'duration': reference_video['duration'],
-                    'fps': reference_video['fps']
-                },
-                'user': {
-                    'video_id': user_video_id,
-                    'filename': user_video['filename'],
-                    'duration': user_video['duration'],
-                    'fps': user_video['fps']
-                }
-            },
-            'frame_comparisons': frame_comparisons,
-            'threshold': comparison_record['threshold']
-        })
+        response = app.response_class(payload, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'  # 允许浏览器缓存，但每次用 ETag 校验
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({
@@ -3798,21 +3830,73 @@ def get_frame_comparison(work_id):
             'error': str(e)
         }), 500
 
+def warm_reference_pose_cache():
+    """后台预加载教学视频的姿势数据到进程内缓存，不阻塞服务启动"""
+    def warm():
+        try:
+            loaded = db.warm_reference_pose_cache()
+            stats = db.reference_pose_cache.stats()
+            logger.info("[姿势缓存] 已预加载 %s 个教学视频的姿势数据，占用 %.1fMB / %.0fMB", loaded, stats['bytes'] / 1024 / 1024, stats['max_bytes'] / 1024 / 1024)
+        except Exception as e:
+            logger.error("[姿势缓存] 预加载失败: %s", e)
+    
+    threading.Thread(target=warm, daemon=True).start()
+
+def init_request_worker():
+    """生产模式下每个 gunicorn 请求 worker 进程 fork 之后调用（见 gunicorn.conf.py）
+    
+    只打开本进程的数据库连接并预加载教学视频姿势缓存；骨骼提取进程池和任务队列不在请求 worker 中启动，
+    由单独的任务进程（start_server.py --jobs）负责。
+    """
+    conn = db.get_connection()
+    try:
+        conn.execute('SELECT 1')
+    finally:
+        conn.close()
+    warm_reference_pose_cache()
+    metrics_registry.start_exporter()
+    logger.info("[服务启动] 请求 worker %s 已就绪", os.getpid())
+
+def start_background_services():
+    """启动后台服务：环境检测、姿势缓存预加载、骨骼提取进程池和任务队列
+    
+    开发服务器在同一进程中调用；生产模式下只在任务进程（start_server.py --jobs）中调用。
+    """
+    detect_capabilities()
+    warm_reference_pose_cache()
+    metrics_registry.start_exporter()
+    pose_worker_pool.start()
+    task_queue.start()
+
+def stop_background_services():
+    """停止任务队列（正在执行的任务先执行完），关闭骨骼提取进程池和数据库连接"""
+    task_queue.stop()
+    pose_worker_pool.shutdown()
+    db.connections.close_all()
+
 if __name__ == '__main__':
-    print("启动舞蹈姿势对比服务...")
-    print("服务地址: http://localhost:8128")
-    print("API文档:")
-    print("  - 健康检查: GET /api/health")
-    print("  - 上传参考视频: POST /api/upload-reference")
-    print("  - 列出参考视频: GET /api/reference-videos")
-    print("  - 获取默认参考视频: GET /api/reference-videos/default")
-    print("  - 上传用户视频并提取骨骼: POST /api/upload-user-video")
-    print("  - 比较已上传的视频: POST /api/compare-uploaded-videos")
-    print("  - 删除用户视频: DELETE /api/delete-user-video/<user_video_id>")
-    print("  - 比较视频: POST /api/compare-videos (只需上传用户视频)")
-    print("  - 获取报告: GET /api/get-report/<work_id>")
-    print("  - 数据库统计: GET /api/database/stats")
-    print("  - 视频播放: GET /video/<video_id>")
-    print("  - 视频统计: GET /api/video-stats")
-    
-    app.run(host='0.0.0.0', port=8128, debug=True)
+    logger.info("启动舞蹈姿势对比服务...")
+    logger.info("服务地址: http://localhost:8128")
+    logger.info("API文档:")
+    logger.info("  - 健康检查: GET /api/health")
+    logger.info("  - 上传参考视频: POST /api/upload-reference")
+    logger.info("  - 列出参考视频: GET /api/reference-videos")
+    logger.info("  - 获取默认参考视频: GET /api/reference-videos/default")
+    logger.info("  - 上传用户视频并提取骨骼: POST /api/upload-user-video")
+    logger.info("  - 比较已上传的视频: POST /api/compare-uploaded-videos")
+    logger.info("  - 删除用户视频: DELETE /api/delete-user-video/<user_video_id>")
+    logger.info("  - 比较视频: POST /api/compare-videos (只需上传用户视频)")
+    logger.info("  - 获取报告: GET /api/get-report/<work_id>")
+    logger.info("  - 数据库统计: GET /api/database/stats")
+    logger.info("  - 查询耗时统计: GET /api/database/query-stats (需要 DB_INSTRUMENTATION=1)")
+    logger.info("  - 运行指标: GET /metrics (Prometheus 文本格式)")
+    logger.info("  - 视频播放: GET /video/<video_id>")
+    logger.info("  - 视频统计: GET /api/video-stats")
+    
+    debug_mode = True
+    
+    # debug 模式下 Werkzeug 会先启动一个只负责监控代码变化的父进程，后台服务只在真正处理请求的子进程中启动
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    
+    app.run(host='0.0.0.0', port=8128, debug=debug_mode)
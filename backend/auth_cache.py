@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+登录状态缓存
+
+    - 已验证的 Token：按 Token 的 SHA-256 缓存验证结果（签名、过期时间、会话是否存在），
+      有效期内的重复请求只需一次字典查询，不再执行 jwt.decode 和会话查询
+    - 用户角色：require_admin 不再每次都查询 users 表
+
+注销（删除会话）和修改角色时主动清除本进程的缓存，并更新数据库旁边的 epoch 文件；
+其他进程（gunicorn 的其他 worker、set_admin.py）最多每 AUTH_EPOCH_CHECK_INTERVAL 秒检查一次
+epoch 文件，发现变化时清空自己的缓存。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 已验证 Token 的缓存时间（秒）
+AUTH_TOKEN_CACHE_TTL = float(os.environ.get('AUTH_TOKEN_CACHE_TTL', '60'))
+# 用户角色的缓存时间（秒）
+AUTH_ROLE_CACHE_TTL = float(os.environ.get('AUTH_ROLE_CACHE_TTL', '300'))
+# 最多缓存的 Token 数，超出时淘汰最久未使用的
+AUTH_CACHE_MAX_TOKENS = 10000
+# 检查 epoch 文件的间隔（秒），即跨进程失效的最大延迟
+AUTH_EPOCH_CHECK_INTERVAL = 1.0
+
+
+def token_key(token: str) -> str:
+    """缓存键：Token 的 SHA-256（内存中不保存 Token 原文）"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class AuthEpoch:
+    """跨进程的失效标记：文件被替换后 (inode, 修改时间) 会变化（教学视频姿势缓存也使用）"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def current(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return (0, 0)
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def bump(self) -> Optional[Tuple[int, int]]:
+        """替换 epoch 文件，返回新文件的 (inode, 修改时间)；失败时返回 None
+
+        调用方应记下返回值，而不是事后再调用 current()：两次调用之间其他进程也可能更新了文件，
+        再读一次会把其他进程的失效通知当成自己的，漏掉一次清空缓存。
+        """
+        temp_file = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(str(time.time_ns()))
+            stat = os.stat(temp_file)
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logger.error("[缓存] 更新 epoch 文件 %s 失败: %s", self.path, e)
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+
+class AuthCache:
+    """已验证 Token 和用户角色的进程内缓存（线程安全）"""
+
+    def __init__(self, epoch: AuthEpoch, token_ttl: float = AUTH_TOKEN_CACHE_TTL,
+                 role_ttl: float = AUTH_ROLE_CACHE_TTL, max_tokens: int = AUTH_CACHE_MAX_TOKENS):
+        self.epoch = epoch
+        self.token_ttl = token_ttl
+        self.role_ttl = role_ttl
+        self.max_tokens = max_tokens
+        self._tokens: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self._roles: Dict[int, Tuple[float, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._epoch = epoch.current()
+        self._epoch_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_epoch(self, now: float):
+        """其他进程更新了 epoch 文件时清空缓存（调用方持有锁）"""
+        if now - self._epoch_checked_at < AUTH_EPOCH_CHECK_INTERVAL:
+            return
+        self._epoch_checked_at = now
+        epoch = self.epoch.current()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._tokens.clear()
+            self._roles.clear()
+
+    def get_token(self, token: str) -> Optional[Dict]:
+        """缓存的验证结果；未缓存或已过期时返回 None"""
+        key = token_key(token)
+        now = time.monotonic()
+        with self._lock:
+            self._check_epoch(now)
+            entry = self._tokens.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._tokens[key]
+                self.misses += 1
+                return None
+            self._tokens.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put_token(self, token: str, result: Dict, expires_at: float = None):
+        """缓存验证通过的结果；expires_at 为 Token 本身的过期时间（Unix 时间戳），缓存不会超过它"""
+        ttl = self.token_ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._tokens[token_key(token)] = (time.monotonic() + ttl, result)
+            self._tokens.move_to_end(token_key(token))
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+
+    def invalidate_token(self, token: str):
+        """Token 被注销：清除本进程的缓存并通知其他进程"""
+        with self._lock:
+            self._tokens.pop(token_key(token), None)
+            # 先处理其他进程已发出的失效通知，之后记下的 epoch 才只包含自己这一次更新
+            self._epoch_checked_at = float('-inf')
+            self._check_epoch(time.monotonic())
+        epoch = self.epoch.bump()
+        if epoch is not None:
+            with self._lock:
+                self._epoch = epoch
+
+    def get_role(self, user_id: int, loader: Callable[[int], Optional[str]]) -> Optional[str]:
+        """用户角色；未缓存时调用 loader 从数据库读取（用户不存在时 loader 返回 None）"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_epoch(now)
+            entry = self._roles.get(user_id)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        role = loader(user_id)
+        with self._lock:
+            self._roles[user_id] = (now + self.role_ttl, role)
+        return role
+
+    def invalidate_user(self, user_id: int):
+        """用户角色变化：清除本进程中该用户的角色和 Token 缓存（Token 中也带有角色），并通知其他进程"""
+        with self._lock:
+            self._roles.pop(user_id, None)
+            stale = [key for key, (_, result) in self._tokens.items() if result.get('user_id') == user_id]
+            for key in stale:
+                del self._tokens[key]
+            # 先处理其他进程已发出的失效通知，之后记下的 epoch 才只包含自己这一次更新
+            self._epoch_checked_at = float('-inf')
+            self._check_epoch(time.monotonic())
+        epoch = self.epoch.bump()
+        if epoch is not None:
+            with self._lock:
+                self._epoch = epoch
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'tokens': len(self._tokens),
+                'roles': len(self._roles),
+                'hits': self.hits,
+                'misses': self.misses,
+                'token_ttl': self.token_ttl,
+                'role_ttl': self.role_ttl,
+            }
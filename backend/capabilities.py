@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+运行环境能力检测
+
+ffmpeg / ffprobe 的路径和版本、ffmpeg 可用的编码器、OpenCV VideoWriter 能打开的 fourcc
+在进程启动时检测一次并缓存，各处直接查询，不再每次处理视频都执行 `ffmpeg -version` 之类的命令。
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 关心的 ffmpeg 编码器（H.264 / AAC 用于生成浏览器兼容的视频）
+FFMPEG_ENCODERS = ('libx264', 'libopenh264', 'aac', 'mpeg4')
+# 生成骨骼视频时按顺序尝试的 OpenCV fourcc
+OPENCV_FOURCCS = ('mp4v', 'XVID', 'avc1', 'H264')
+
+_capabilities: Optional[Dict] = None
+_lock = threading.Lock()
+
+
+def _run(cmd: List[str], timeout: int = 10) -> Optional[str]:
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _parse_version(output: Optional[str]) -> Optional[str]:
+    """'ffmpeg version 7.0.2-static https://...' -> '7.0.2-static'"""
+    if not output:
+        return None
+    match = re.match(r'\S+ version (\S+)', output)
+    return match.group(1) if match else None
+
+
+def _detect_tool(name: str) -> Dict:
+    path = shutil.which(name)
+    version = _parse_version(_run([path, '-version'])) if path else None
+    return {'available': bool(path and version), 'path': path, 'version': version}
+
+
+def _detect_ffmpeg_encoders(ffmpeg_path: str) -> List[str]:
+    output = _run([ffmpeg_path, '-hide_banner', '-encoders']) or ''
+    names = set()
+    for line in output.splitlines():
+        # 编码器列表的每一行形如 " V....D libx264   libx264 H.264 / AVC ..."
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6:
+            names.add(parts[1])
+    return [name for name in FFMPEG_ENCODERS if name in names]
+
+
+def _supports_fps_mode(version: Optional[str]) -> bool:
+    """-fps_mode 从 ffmpeg 5.1 开始提供（之前只有 -vsync）；无法解析版本号的开发版视为支持"""
+    match = re.match(r'(\d+)\.(\d+)', version or '')
+    if not match:
+        return True
+    return (int(match.group(1)), int(match.group(2))) >= (5, 1)
+
+
+def _detect_opencv_fourccs() -> Dict:
+    """实际创建一个小的 VideoWriter，记录哪些 fourcc 能够打开"""
+    try:
+        import cv2
+    except ImportError:
+        return {'version': None, 'fourccs': []}
+
+    fourccs = []
+    fd, probe_file = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        for fourcc in OPENCV_FOURCCS:
+            try:
+                writer = cv2.VideoWriter(probe_file, cv2.VideoWriter_fourcc(*fourcc), 30.0, (64, 64))
+                if writer.isOpened():
+                    fourccs.append(fourcc)
+                writer.release()
+            except Exception:
+                pass
+    finally:
+        try:
+            os.remove(probe_file)
+        except OSError:
+            pass
+    return {'version': cv2.__version__, 'fourccs': fourccs}
+
+
+def detect_capabilities() -> Dict:
+    """检测运行环境能力（启动时调用一次，之后通过 get_capabilities 读取缓存）"""
+    global _capabilities
+    ffmpeg = _detect_tool('ffmpeg')
+    ffprobe = _detect_tool('ffprobe')
+    ffmpeg['encoders'] = _detect_ffmpeg_encoders(ffmpeg['path']) if ffmpeg['available'] else []
+    ffmpeg['fps_mode'] = ffmpeg['available'] and _supports_fps_mode(ffmpeg['version'])
+    capabilities = {
+        'ffmpeg': ffmpeg,
+        'ffprobe': ffprobe,
+        'opencv': _detect_opencv_fourccs(),
+    }
+    with _lock:
+        _capabilities = capabilities
+
+    logger.info("[环境检测] ffmpeg: %s（编码器: %s），ffprobe: %s，OpenCV fourcc: %s",
+                ffmpeg['version'] or '不可用', ', '.join(ffmpeg['encoders']) or '无',
+                ffprobe['version'] or '不可用', ', '.join(capabilities['opencv']['fourccs']) or '无')
+    return capabilities
+
+
+def get_capabilities() -> Dict:
+    """读取缓存的检测结果（尚未检测时先检测）"""
+    with _lock:
+        capabilities = _capabilities
+    return capabilities if capabilities is not None else detect_capabilities()
+
+
+def has_ffmpeg() -> bool:
+    return get_capabilities()['ffmpeg']['available']
+
+
+def has_ffprobe() -> bool:
+    return get_capabilities()['ffprobe']['available']
+
+
+def h264_encoder() -> str:
+    """ffmpeg 的 H.264 编码器名称（优先 libx264）"""
+    encoders = get_capabilities()['ffmpeg']['encoders']
+    return 'libopenh264' if 'libx264' not in encoders and 'libopenh264' in encoders else 'libx264'
+
+
+def ffmpeg_frame_rate_args(mode: str) -> List[str]:
+    """帧率同步参数：mode 为 'cfr'（恒定帧率）或 'passthrough'（不补帧/丢帧）
+
+    新版 ffmpeg 使用 -fps_mode，旧版只支持 -vsync（passthrough 对应 -vsync 0）。
+    """
+    if get_capabilities()['ffmpeg']['fps_mode']:
+        return ['-fps_mode', mode]
+    return ['-vsync', '0' if mode == 'passthrough' else mode]
+
+
+def opencv_fourccs() -> List[str]:
+    """能打开的 OpenCV VideoWriter fourcc（按 OPENCV_FOURCCS 的优先顺序）"""
+    return get_capabilities()['opencv']['fourccs']
@@ -7,9 +7,24 @@
 import sqlite3
 import os
 import json
+import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
+from pose_store import (
+    PoseArrays, pack_poses, encode_pose_arrays, decode_pose_arrays,
+    pose_arrays_to_dict, pose_arrays_to_rows,
+)
+from pose_cache import PoseArrayCache
+from auth_cache import AuthCache, AuthEpoch
+from db_connection import SQLiteConnectionManager
+from db_instrumentation import DB_INSTRUMENTATION, instrument_database
+
+logger = logging.getLogger(__name__)
+
+# 教学视频姿势数据缓存的内存预算（MB）
+REFERENCE_POSE_CACHE_MB = int(os.environ.get('REFERENCE_POSE_CACHE_MB', '64'))
+
 class DanceDatabase:
     def __init__(self, db_path: str = None):
         """初始化数据库连接"""
@@ -18,15 +33,21 @@ class DanceDatabase:
             data_dir = '/app/data' if os.path.exists('/app/data') else '.'
             db_path = os.path.join(data_dir, 'dance_learning.db')
         self.db_path = db_path
+        self.connections = SQLiteConnectionManager(db_path)
+        # 教学视频姿势数据缓存；epoch 文件用于通知同一数据库的其他进程丢弃已失效的数据
+        self.reference_pose_cache = PoseArrayCache(REFERENCE_POSE_CACHE_MB * 1024 * 1024,
+                                                   AuthEpoch(f"{db_path}.pose-epoch"))
+        # 已验证 Token 和用户角色的缓存；epoch 文件放在数据库旁边，同一数据库的所有进程共用
+        self.auth_cache = AuthCache(AuthEpoch(f"{db_path}.auth-epoch"))
         self.init_database()
     
     def get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path, timeout=30)  # 增加超时时间
-        conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
-        conn.execute("PRAGMA journal_mode=WAL")  # 使用WAL模式提高并发性能
-        conn.execute("PRAGMA busy_timeout=30000")  # 30秒超时
-        return conn
+        """获取当前线程的数据库连接（长期复用，close() 只回滚未提交的事务，见 db_connection.py）"""
+        return self.connections.connection()
+    
+    def transaction(self):
+        """写事务上下文：with db.transaction() as conn: ...，正常结束提交，出错回滚"""
+        return self.connections.transaction()
     
     def init_database(self):
         """初始化数据库表"""
@@ -86,25 +107,46 @@ class DanceDatabase:
         # 为已存在的users表添加role字段（如果不存在）
         try:
             cursor.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'user'")
-            print("已添加 role 字段到 users 表")
+            logger.info("已添加 role 字段到 users 表")
         except sqlite3.OperationalError:
             pass
         
         # 为已存在的表添加新字段（如果不存在）
         try:
             cursor.execute("ALTER TABLE reference_videos ADD COLUMN thumbnail_path TEXT")
-            print("已添加 thumbnail_path 字段到 reference_videos 表")
+            logger.info("已添加 thumbnail_path 字段到 reference_videos 表")
         except sqlite3.OperationalError:
             # 字段已存在，忽略错误
             pass
 
         try:
             cursor.execute("ALTER TABLE reference_videos ADD COLUMN category TEXT DEFAULT 'normal'")
-            print("已添加 category 字段到 reference_videos 表")
+            logger.info("已添加 category 字段到 reference_videos 表")
         except sqlite3.OperationalError:
             # 字段已存在，忽略错误
             pass
         
+        try:
+            cursor.execute("ALTER TABLE reference_videos ADD COLUMN playback_path TEXT")
+            logger.info("已添加 playback_path 字段到 reference_videos 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        try:
+            cursor.execute("ALTER TABLE reference_videos ADD COLUMN media_info TEXT")
+            logger.info("已添加 media_info 字段到 reference_videos 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        # 有骨骼的帧数（随姿势数据一起写入），列表接口据此判断是否已有姿势数据，不必读取姿势数据本身
+        backfill_pose_frame_count = []
+        try:
+            cursor.execute("ALTER TABLE reference_videos ADD COLUMN pose_frame_count INTEGER DEFAULT 0")
+            logger.info("已添加 pose_frame_count 字段到 reference_videos 表")
+            backfill_pose_frame_count.append('reference_videos')
+        except sqlite3.OperationalError:
+            pass
+        
         # 创建用户视频表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_videos (
@@ -130,31 +172,50 @@ class DanceDatabase:
         # 为已存在的user_videos表添加新字段（如果不存在）
         try:
             cursor.execute("ALTER TABLE user_videos ADD COLUMN pose_extraction_error TEXT")
-            print("已添加 pose_extraction_error 字段到 user_videos 表")
+            logger.info("已添加 pose_extraction_error 字段到 user_videos 表")
         except sqlite3.OperationalError:
             pass
         
         try:
             cursor.execute("ALTER TABLE user_videos ADD COLUMN pose_extraction_progress INTEGER DEFAULT 0")
-            print("已添加 pose_extraction_progress 字段到 user_videos 表")
+            logger.info("已添加 pose_extraction_progress 字段到 user_videos 表")
         except sqlite3.OperationalError:
             pass
         
         try:
             cursor.execute("ALTER TABLE user_videos ADD COLUMN title TEXT")
-            print("已添加 title 字段到 user_videos 表")
+            logger.info("已添加 title 字段到 user_videos 表")
         except sqlite3.OperationalError:
             pass
 
         try:
             cursor.execute("ALTER TABLE user_videos ADD COLUMN reference_video_id TEXT")
-            print("已添加 reference_video_id 字段到 user_videos 表")
+            logger.info("已添加 reference_video_id 字段到 user_videos 表")
         except sqlite3.OperationalError:
             pass
 
         try:
             cursor.execute("ALTER TABLE user_videos ADD COLUMN visibility TEXT DEFAULT 'public'")
-            print("已添加 visibility 字段到 user_videos 表")
+            logger.info("已添加 visibility 字段到 user_videos 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        try:
+            cursor.execute("ALTER TABLE user_videos ADD COLUMN playback_path TEXT")
+            logger.info("已添加 playback_path 字段到 user_videos 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        try:
+            cursor.execute("ALTER TABLE user_videos ADD COLUMN media_info TEXT")
+            logger.info("已添加 media_info 字段到 user_videos 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        try:
+            cursor.execute("ALTER TABLE user_videos ADD COLUMN pose_frame_count INTEGER DEFAULT 0")
+            logger.info("已添加 pose_frame_count 字段到 user_videos 表")
+            backfill_pose_frame_count.append('user_videos')
         except sqlite3.OperationalError:
             pass
         
@@ -175,6 +236,23 @@ class DanceDatabase:
             )
         ''')
         
+        # 创建逐帧对比结果缓存表（GET /api/frame-comparison 直接返回缓存的 JSON）
+        # 任一边的姿势数据重新写入后版本号变化，缓存自动失效
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS frame_comparison_cache (
+                work_id TEXT NOT NULL,
+                threshold REAL NOT NULL,
+                reference_video_id TEXT NOT NULL,
+                user_video_id TEXT NOT NULL,
+                reference_pose_version INTEGER NOT NULL,  -- pose_blobs.version，无数据时为 0
+                user_pose_version INTEGER NOT NULL,
+                payload TEXT NOT NULL,  -- 完整的响应 JSON
+                etag TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (work_id, threshold)
+            )
+        ''')
+        
         # 创建姿势数据表（存储具体的姿势数据）
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS pose_data (
@@ -188,6 +266,22 @@ class DanceDatabase:
             )
         ''')
         
+        # 创建姿势数据二进制存储表（每个视频一行，替代 pose_data 的逐帧 JSON 行）
+        # 旧的 pose_data 行在首次读取时迁移到这里（见 get_pose_arrays / migrate_legacy_pose_data）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pose_blobs (
+                video_id TEXT PRIMARY KEY,
+                video_type TEXT NOT NULL,  -- 'reference' 或 'user'
+                frame_count INTEGER NOT NULL,  -- 采样帧总数（含无骨骼的帧）
+                valid_count INTEGER NOT NULL,  -- 检测到骨骼的帧数
+                frame_indices BLOB NOT NULL,  -- int32[frame_count]
+                presence BLOB NOT NULL,  -- uint8[frame_count]
+                poses BLOB NOT NULL,  -- float32[frame_count, 13, 4]
+                version INTEGER NOT NULL DEFAULT 1,  -- 每次重新写入 +1
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # 创建异步任务表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS async_tasks (
@@ -201,10 +295,25 @@ class DanceDatabase:
                 error_message TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 started_at TIMESTAMP,
-                completed_at TIMESTAMP
+                completed_at TIMESTAMP,
+                priority INTEGER DEFAULT 0,  -- 数值越大越先执行
+                payload TEXT  -- JSON 格式的任务参数（服务重启后据此重新执行）
             )
         ''')
         
+        # 为已存在的async_tasks表添加任务队列字段（如果不存在）
+        try:
+            cursor.execute("ALTER TABLE async_tasks ADD COLUMN priority INTEGER DEFAULT 0")
+            logger.info("已添加 priority 字段到 async_tasks 表")
+        except sqlite3.OperationalError:
+            pass
+        
+        try:
+            cursor.execute("ALTER TABLE async_tasks ADD COLUMN payload TEXT")
+            logger.info("已添加 payload 字段到 async_tasks 表")
+        except sqlite3.OperationalError:
+            pass
+        
         # 创建评论表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS comments (
@@ -231,6 +340,33 @@ class DanceDatabase:
             )
         ''')
         
+        # 创建视频互动计数表（点赞数、评论数随点赞/评论在同一事务中更新，读取时不再 COUNT(*)）
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'video_engagement'")
+        engagement_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS video_engagement (
+                video_id TEXT NOT NULL,
+                video_type TEXT NOT NULL,  -- 'reference' 或 'user'
+                like_count INTEGER NOT NULL DEFAULT 0,
+                comment_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (video_id, video_type)
+            ) WITHOUT ROWID
+        ''')
+        if not engagement_exists:
+            # 首次创建时用已有的点赞和评论补齐计数
+            cursor.execute('''
+                INSERT INTO video_engagement (video_id, video_type, like_count, comment_count)
+                SELECT video_id, video_type, SUM(likes), SUM(comments) FROM (
+                    SELECT video_id, video_type, COUNT(*) AS likes, 0 AS comments
+                    FROM likes GROUP BY video_id, video_type
+                    UNION ALL
+                    SELECT video_id, video_type, 0, COUNT(*)
+                    FROM comments GROUP BY video_id, video_type
+                )
+                GROUP BY video_id, video_type
+            ''')
+            logger.info("已创建 video_engagement 表（%s 个视频的点赞/评论数）", cursor.rowcount)
+        
         # 创建索引以提高查询性能
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_token ON user_sessions(token)')
@@ -238,46 +374,79 @@ class DanceDatabase:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_reference_videos_video_id ON reference_videos(video_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_videos_video_id ON user_videos(video_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_comparison_records_comparison_id ON comparison_records(comparison_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_frame_comparison_cache_reference ON frame_comparison_cache(reference_video_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_frame_comparison_cache_user ON frame_comparison_cache(user_video_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_pose_data_video_id ON pose_data(video_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_async_tasks_task_id ON async_tasks(task_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_async_tasks_video_id ON async_tasks(video_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_comments_video_id ON comments(video_id, video_type)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_async_tasks_queue ON async_tasks(status, priority DESC, id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_comments_video_id')  # 已被 idx_comments_video_time 覆盖
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_comments_video_time ON comments(video_id, video_type, created_at, id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_comments_user_id ON comments(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_likes_video_id ON likes(video_id, video_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_likes_user_id ON likes(user_id)')
         
+        # 列表接口的分页索引（按上传时间倒序，rowid 作为同一时间的次序）
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reference_videos_category_time ON reference_videos(category, upload_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_videos_owner_time ON user_videos(user_id, visibility, upload_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_videos_visibility_time ON user_videos(visibility, upload_time)')
+        
+        # 旧数据中 category / visibility 可能为 NULL，统一为默认值，查询条件可以直接使用索引
+        cursor.execute("UPDATE reference_videos SET category = 'normal' WHERE category IS NULL")
+        cursor.execute("UPDATE user_videos SET visibility = 'public' WHERE visibility IS NULL")
+        
+        # 新加 pose_frame_count 字段时，用已有的姿势数据（二进制存储或旧版 JSON 行）补齐
+        for table in backfill_pose_frame_count:
+            cursor.execute(f'''
+                UPDATE {table} SET pose_frame_count = COALESCE(
+                    (SELECT valid_count FROM pose_blobs WHERE pose_blobs.video_id = {table}.video_id),
+                    (SELECT COUNT(*) FROM pose_data
+                     WHERE pose_data.video_id = {table}.video_id AND pose_data.pose_data IS NOT NULL),
+                    0
+                )
+            ''')
+            logger.info("已补齐 %s 表的 pose_frame_count（%s 个视频）", table, cursor.rowcount)
+        
+        # 各视频表的字段，列表接口按 fields= 选择字段时用来过滤未知字段
+        self.table_columns = {}
+        for table in ('reference_videos', 'user_videos'):
+            cursor.execute(f'PRAGMA table_info({table})')
+            self.table_columns[table] = {row['name'] for row in cursor.fetchall()}
+        
         conn.commit()
         conn.close()
     
     def add_reference_video(self, video_id: str, filename: str, file_path: str, 
                            duration: float = None, fps: float = None, 
                            description: str = None, tags: str = None, author: str = None, title: str = None,
-                           thumbnail_path: str = None, category: str = 'normal') -> bool:
-        """添加教学视频记录"""
+                           thumbnail_path: str = None, category: str = 'normal',
+                           media_info: Dict = None) -> bool:
+        """添加教学视频记录（media_info 为 media_probe.probe_media 的结果）"""
+        category = category or 'normal'
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO reference_videos 
-                (video_id, filename, file_path, duration, fps, description, tags, author, title, thumbnail_path, category)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (video_id, filename, file_path, duration, fps, description, tags, author, title, thumbnail_path, category))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO reference_videos 
+                    (video_id, filename, file_path, duration, fps, description, tags, author, title, thumbnail_path, category,
+                     media_info)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (video_id, filename, file_path, duration, fps, description, tags, author, title, thumbnail_path, category,
+                      json.dumps(media_info) if media_info else None))
             return True
         except sqlite3.IntegrityError:
-            print(f"视频ID {video_id} 已存在")
+            logger.warning("视频ID %s 已存在", video_id)
             return False
         except Exception as e:
-            print(f"添加教学视频失败: {e}")
+            logger.error("添加教学视频失败: %s", e)
             return False
     
     def add_user_video(self, video_id: str, filename: str, file_path: str,
                       duration: float = None, fps: float = None,
                       user_id: str = None, session_id: str = None, title: str = None,
-                      reference_video_id: str = None, visibility: str = 'public') -> bool:
+                      reference_video_id: str = None, visibility: str = 'public',
+                      media_info: Dict = None) -> bool:
         """添加用户视频记录
 
         Args:
@@ -285,55 +454,50 @@ class DanceDatabase:
                 - 个人页区分跟学作品 / 直传作品
                 - 新手入门完成度判定
             visibility: 'public' 公开 / 'private' 仅作者本人可见
+            media_info: media_probe.probe_media 的结果
         """
         if visibility not in ('public', 'private'):
             visibility = 'public'
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO user_videos 
-                (video_id, filename, file_path, duration, fps, user_id, session_id, title,
-                 reference_video_id, visibility)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (video_id, filename, file_path, duration, fps, user_id, session_id, title,
-                  reference_video_id, visibility))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO user_videos 
+                    (video_id, filename, file_path, duration, fps, user_id, session_id, title,
+                     reference_video_id, visibility, media_info)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (video_id, filename, file_path, duration, fps, user_id, session_id, title,
+                      reference_video_id, visibility, json.dumps(media_info) if media_info else None))
             return True
         except sqlite3.IntegrityError:
-            print(f"视频ID {video_id} 已存在")
+            logger.warning("视频ID %s 已存在", video_id)
             return False
         except Exception as e:
-            print(f"添加用户视频失败: {e}")
+            logger.error("添加用户视频失败: %s", e)
             return False
     
     def update_pose_data_path(self, video_id: str, pose_data_path: str, video_type: str = 'reference') -> bool:
         """更新视频的姿势数据路径"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            if video_type == 'reference':
-                cursor.execute('''
-                    UPDATE reference_videos 
-                    SET pose_data_path = ?, pose_data_extracted = TRUE, pose_extraction_time = CURRENT_TIMESTAMP
-                    WHERE video_id = ?
-                ''', (pose_data_path, video_id))
-            else:
-                cursor.execute('''
-                    UPDATE user_videos 
-                    SET pose_data_path = ?, pose_data_extracted = TRUE, pose_extraction_time = CURRENT_TIMESTAMP
-                    WHERE video_id = ?
-                ''', (pose_data_path, video_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if video_type == 'reference':
+                    cursor.execute('''
+                        UPDATE reference_videos 
+                        SET pose_data_path = ?, pose_data_extracted = TRUE, pose_extraction_time = CURRENT_TIMESTAMP
+                        WHERE video_id = ?
+                    ''', (pose_data_path, video_id))
+                else:
+                    cursor.execute('''
+                        UPDATE user_videos 
+                        SET pose_data_path = ?, pose_data_extracted = TRUE, pose_extraction_time = CURRENT_TIMESTAMP
+                        WHERE video_id = ?
+                    ''', (pose_data_path, video_id))
             return True
         except Exception as e:
-            print(f"更新姿势数据路径失败: {e}")
+            logger.error("更新姿势数据路径失败: %s", e)
             return False
     
     def update_pose_extraction_status(self, video_id: str, extracted: bool, video_type: str = 'user', error: str = None) -> bool:
@@ -346,204 +510,303 @@ class DanceDatabase:
             error: 错误信息（如果提取失败）
         """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if video_type == 'reference':
+                    cursor.execute('''
+                        UPDATE reference_videos 
+                        SET pose_data_extracted = ?, pose_extraction_time = CURRENT_TIMESTAMP
+                        WHERE video_id = ?
+                    ''', (extracted, video_id))
+                else:
+                    cursor.execute('''
+                        UPDATE user_videos 
+                        SET pose_data_extracted = ?, pose_extraction_time = CURRENT_TIMESTAMP, pose_extraction_error = ?
+                        WHERE video_id = ?
+                    ''', (extracted, error, video_id))
             
+            # 姿势数据已重新提取（或提取失败），缓存中的旧数据失效（缓存只保存教学视频）
             if video_type == 'reference':
-                cursor.execute('''
-                    UPDATE reference_videos 
-                    SET pose_data_extracted = ?, pose_extraction_time = CURRENT_TIMESTAMP
-                    WHERE video_id = ?
-                ''', (extracted, video_id))
-            else:
-                cursor.execute('''
-                    UPDATE user_videos 
-                    SET pose_data_extracted = ?, pose_extraction_time = CURRENT_TIMESTAMP, pose_extraction_error = ?
-                    WHERE video_id = ?
-                ''', (extracted, error, video_id))
-            
-            conn.commit()
-            conn.close()
+                self.reference_pose_cache.invalidate(video_id)
             return True
         except Exception as e:
-            print(f"更新姿势提取状态失败: {e}")
+            logger.error("更新姿势提取状态失败: %s", e)
             return False
     
     def update_pose_extraction_progress(self, video_id: str, progress: int) -> bool:
         """更新姿势数据提取进度（0-100）"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE user_videos 
-                SET pose_extraction_progress = ?
-                WHERE video_id = ?
-            ''', (progress, video_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE user_videos 
+                    SET pose_extraction_progress = ?
+                    WHERE video_id = ?
+                ''', (progress, video_id))
             return True
         except Exception as e:
-            print(f"更新提取进度失败: {e}")
+            logger.error("更新提取进度失败: %s", e)
             return False
     
     def update_pose_video_path(self, video_id: str, pose_video_path: str) -> bool:
         """更新参考视频的标记骨骼视频路径"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE reference_videos 
-                SET pose_video_path = ?, pose_video_generated = TRUE, pose_video_generation_time = CURRENT_TIMESTAMP
-                WHERE video_id = ?
-            ''', (pose_video_path, video_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE reference_videos 
+                    SET pose_video_path = ?, pose_video_generated = TRUE, pose_video_generation_time = CURRENT_TIMESTAMP
+                    WHERE video_id = ?
+                ''', (pose_video_path, video_id))
+            return True
+        except Exception as e:
+            logger.error("更新标记骨骼视频路径失败: %s", e)
+            return False
+    
+    def update_playback_path(self, video_id: str, playback_path: str, video_type: str = 'reference') -> bool:
+        """更新视频的播放用转码文件路径（原始文件浏览器无法直接播放时才会生成）"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if video_type == 'reference':
+                    cursor.execute('UPDATE reference_videos SET playback_path = ? WHERE video_id = ?',
+                                   (playback_path, video_id))
+                else:
+                    cursor.execute('UPDATE user_videos SET playback_path = ? WHERE video_id = ?',
+                                   (playback_path, video_id))
+            return True
+        except Exception as e:
+            logger.error("更新播放文件路径失败: %s", e)
+            return False
+    
+    def update_media_info(self, video_id: str, media_info: Dict, video_type: str = 'reference') -> bool:
+        """保存视频的媒体信息（media_probe.probe_media 的结果）"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if video_type == 'reference':
+                    cursor.execute('UPDATE reference_videos SET media_info = ? WHERE video_id = ?',
+                                   (json.dumps(media_info), video_id))
+                else:
+                    cursor.execute('UPDATE user_videos SET media_info = ? WHERE video_id = ?',
+                                   (json.dumps(media_info), video_id))
             return True
         except Exception as e:
-            print(f"更新标记骨骼视频路径失败: {e}")
+            logger.error("更新媒体信息失败: %s", e)
             return False
     
     def save_pose_data(self, video_id: str, video_type: str, frame_index: int, 
                       pose_data: List, timestamp: float = None) -> bool:
-        """保存姿势数据到数据库（支持None值表示无骨骼数据）"""
+        """保存单帧姿势数据（合并进该视频的二进制姿势数据，支持None值表示无骨骼数据）
+
+        逐帧写入需要读-改-写整段数据，批量场景请使用 save_pose_data_batch。
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # 处理None值（无骨骼数据的情况）
-            if pose_data is None:
-                pose_data_json = None
-            else:
-                pose_data_json = json.dumps(pose_data)
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO pose_data 
-                (video_id, video_type, frame_index, pose_data, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (video_id, video_type, frame_index, pose_data_json, timestamp))
-            
-            conn.commit()
-            conn.close()
-            return True
+            existing = self.get_pose_arrays(video_id)
+            poses_data = pose_arrays_to_dict(existing) if existing is not None else {}
+            poses_data[frame_index] = pose_data
+            return self.save_pose_data_batch(video_id, video_type, poses_data)
         except Exception as e:
-            print(f"保存姿势数据失败: {e}")
+            logger.error("保存姿势数据失败: %s", e)
             return False
     
     def save_pose_data_batch(self, video_id: str, video_type: str, poses_data: Dict) -> bool:
-        """批量保存姿势数据到数据库（性能优化版本）"""
-        conn = None
+        """批量保存姿势数据到数据库（整段视频打包为一行二进制数据）
+
+        无骨骼数据的帧（None）也会保留在帧索引中，由 presence 标记区分。
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # 准备批量插入数据
-            batch_data = []
-            skipped_frames = 0
-            for frame_index, pose_data in poses_data.items():
-                # 跳过None值（无骨骼数据的帧）
-                if pose_data is None:
-                    skipped_frames += 1
-                    continue
-                
-                pose_data_json = json.dumps(pose_data)
-                timestamp = frame_index * 0.2  # 假设5fps，每帧0.2秒
-                batch_data.append((video_id, video_type, frame_index, pose_data_json, timestamp))
-            
+            arrays = pack_poses(poses_data)
+            skipped_frames = arrays.frame_count - arrays.valid_count
             if skipped_frames > 0:
-                print(f"[批量保存] 跳过 {skipped_frames} 个无骨骼数据的帧")
-            
-            # 如果没有有效数据，直接返回成功（无需插入）
-            if len(batch_data) == 0:
-                print(f"[批量保存] 没有有效的骨骼数据需要保存")
-                conn.close()
-                return True
-            
-            # 批量插入
-            print(f"[批量保存] 准备保存 {len(batch_data)} 条骨骼数据")
-            cursor.executemany('''
-                INSERT OR REPLACE INTO pose_data 
-                (video_id, video_type, frame_index, pose_data, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', batch_data)
+                logger.debug("[批量保存] %s 个帧无骨骼数据（仅记录为缺失）", skipped_frames)
             
-            conn.commit()
-            conn.close()
-            print(f"[批量保存] 成功保存 {len(batch_data)} 条骨骼数据")
+            with self.transaction() as conn:
+                self._write_pose_blob(conn.cursor(), video_id, video_type, arrays)
+            if video_type == 'reference':
+                self.reference_pose_cache.invalidate(video_id)
+            logger.info("[批量保存] 成功保存 %s/%s 帧骨骼数据", arrays.valid_count, arrays.frame_count)
             return True
         except Exception as e:
-            print(f"[批量保存] 批量保存姿势数据失败: {e}")
-            import traceback
-            traceback.print_exc()
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
+            logger.exception("[批量保存] 批量保存姿势数据失败: %s", e)
             return False
     
-    def get_pose_data(self, video_id: str, frame_index: int = None) -> List[Dict]:
-        """获取姿势数据"""
+    def _write_pose_blob(self, cursor, video_id: str, video_type: str, arrays: PoseArrays):
+        """写入（覆盖）一个视频的二进制姿势数据，清除旧版逐帧 JSON 行，并更新视频表的 pose_frame_count"""
+        encoded = encode_pose_arrays(arrays)
+        cursor.execute('''
+            INSERT INTO pose_blobs
+            (video_id, video_type, frame_count, valid_count, frame_indices, presence, poses, version, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT(video_id) DO UPDATE SET
+                video_type = excluded.video_type,
+                frame_count = excluded.frame_count,
+                valid_count = excluded.valid_count,
+                frame_indices = excluded.frame_indices,
+                presence = excluded.presence,
+                poses = excluded.poses,
+                version = pose_blobs.version + 1,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (video_id, video_type, encoded['frame_count'], encoded['valid_count'],
+              encoded['frame_indices'], encoded['presence'], encoded['poses']))
+        cursor.execute('DELETE FROM pose_data WHERE video_id = ?', (video_id,))
+        
+        # 同一事务中更新视频表的骨骼帧数
+        if video_type == 'reference':
+            cursor.execute('UPDATE reference_videos SET pose_frame_count = ? WHERE video_id = ?',
+                           (encoded['valid_count'], video_id))
+        else:
+            cursor.execute('UPDATE user_videos SET pose_frame_count = ? WHERE video_id = ?',
+                           (encoded['valid_count'], video_id))
+    
+    def _migrate_legacy_rows(self, cursor, video_id: str) -> Optional[PoseArrays]:
+        """把旧版 pose_data 表中的逐帧 JSON 行转换为二进制存储，返回转换后的数据"""
+        cursor.execute('''
+            SELECT video_type, frame_index, pose_data FROM pose_data
+            WHERE video_id = ?
+            ORDER BY frame_index
+        ''', (video_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        
+        poses_data = {}
+        for row in rows:
+            poses_data[row['frame_index']] = json.loads(row['pose_data']) if row['pose_data'] is not None else None
+        
+        arrays = pack_poses(poses_data, version=1)
+        self._write_pose_blob(cursor, video_id, rows[0]['video_type'], arrays)
+        logger.info("[姿势数据迁移] 视频 %s 的 %s 行 JSON 数据已转换为二进制存储", video_id, len(rows))
+        return arrays
+    
+    def get_pose_arrays(self, video_id: str) -> Optional[PoseArrays]:
+        """获取视频的全部姿势数据（NumPy 数组，一次查询 + 零拷贝解码）
+
+        Returns:
+            PoseArrays；视频没有任何姿势数据时返回 None
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            if frame_index is not None:
-                cursor.execute('''
-                    SELECT * FROM pose_data 
-                    WHERE video_id = ? AND frame_index = ?
-                    ORDER BY frame_index
-                ''', (video_id, frame_index))
-            else:
-                cursor.execute('''
-                    SELECT * FROM pose_data 
-                    WHERE video_id = ?
-                    ORDER BY frame_index
-                ''', (video_id,))
+            cursor.execute('''
+                SELECT frame_count, frame_indices, presence, poses, version
+                FROM pose_blobs WHERE video_id = ?
+            ''', (video_id,))
+            row = cursor.fetchone()
             
-            results = []
-            for row in cursor.fetchall():
-                # 处理None值（无骨骼数据的情况）
-                if row['pose_data'] is None:
-                    pose_data = None
-                else:
-                    pose_data = json.loads(row['pose_data'])
-                results.append({
-                    'frame_index': row['frame_index'],
-                    'pose_data': pose_data,
-                    'timestamp': row['timestamp']
-                })
+            if row:
+                arrays = decode_pose_arrays(row['frame_count'], row['frame_indices'],
+                                            row['presence'], row['poses'], row['version'])
+            else:
+                # 兼容旧数据：首次读取时迁移
+                with self.transaction() as conn:
+                    arrays = self._migrate_legacy_rows(conn.cursor(), video_id)
             
             conn.close()
-            return results
+            return arrays
         except Exception as e:
-            print(f"获取姿势数据失败: {e}")
+            logger.error("获取姿势数据失败: %s", e)
+            return None
+    
+    def get_reference_pose_arrays(self, video_id: str) -> Optional[PoseArrays]:
+        """获取教学视频的姿势数据（优先从进程内 LRU 缓存读取）"""
+        return self.reference_pose_cache.get(video_id, self.get_pose_arrays)
+    
+    def warm_reference_pose_cache(self) -> int:
+        """把已提取姿势数据的教学视频预先加载到缓存（按上传时间从新到旧，直到内存预算用完）
+        
+        Returns:
+            加载的视频数
+        """
+        loaded = 0
+        for video in self.get_reference_videos():
+            if not video.get('pose_data_extracted'):
+                continue
+            arrays = self.get_pose_arrays(video['video_id'])
+            if arrays is None:
+                continue
+            if not self.reference_pose_cache.has_room(arrays.nbytes):
+                break
+            self.reference_pose_cache.put(video['video_id'], arrays)
+            loaded += 1
+        return loaded
+    
+    def get_pose_data(self, video_id: str, frame_index: int = None) -> List[Dict]:
+        """获取姿势数据（旧版逐帧格式，只包含检测到骨骼的帧）"""
+        arrays = self.get_pose_arrays(video_id)
+        if arrays is None:
             return []
+        
+        rows = pose_arrays_to_rows(arrays)
+        if frame_index is not None:
+            rows = [row for row in rows if row['frame_index'] == frame_index]
+        return rows
+    
+    def migrate_legacy_pose_data(self) -> int:
+        """把 pose_data 表中所有旧版 JSON 行迁移到二进制存储，返回迁移的视频数"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT DISTINCT video_id FROM pose_data')
+        video_ids = [row['video_id'] for row in cursor.fetchall()]
+        
+        conn.close()
+        
+        migrated = 0
+        for video_id in video_ids:
+            with self.transaction() as conn:
+                if self._migrate_legacy_rows(conn.cursor(), video_id) is not None:
+                    migrated += 1
+        return migrated
     
-    def get_reference_videos(self, category: str = None) -> List[Dict]:
-        """获取教学视频列表
+    def _select_columns(self, table: str, fields: Optional[List[str]]) -> str:
+        """列表查询的 SELECT 字段：fields 为 None 时返回全部；否则只保留表中存在的字段，
+        并总是包含分页游标需要的 id / upload_time 和 video_id"""
+        if not fields:
+            return '*'
+        columns = self.table_columns[table]
+        selected = ['id', 'video_id', 'upload_time']
+        selected += [field for field in fields if field in columns and field not in selected]
+        return ', '.join(selected)
+    
+    def get_reference_videos(self, category: str = None, fields: List[str] = None,
+                             limit: int = None, after: Tuple[str, int] = None) -> List[Dict]:
+        """获取教学视频列表（按上传时间倒序）
 
         Args:
             category: 可选，按分类过滤（'normal' / 'beginner'）。不传则返回全部。
+            fields: 可选，只返回这些字段（未知字段忽略）
+            limit: 可选，最多返回的条数
+            after: 可选，上一页最后一条的 (upload_time, id)，只返回排在它之后的视频
         """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            conditions, params = [], []
             if category:
-                cursor.execute('''
-                    SELECT * FROM reference_videos
-                    WHERE COALESCE(category, 'normal') = ?
-                    ORDER BY upload_time DESC
-                ''', (category,))
-            else:
-                cursor.execute('''
-                    SELECT * FROM reference_videos 
-                    ORDER BY upload_time DESC
-                ''')
+                conditions.append('category = ?')
+                params.append(category)
+            if after:
+                conditions.append('(upload_time, id) < (?, ?)')
+                params.extend(after)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            limit_clause = 'LIMIT ?' if limit else ''
+            if limit:
+                params.append(limit)
+            
+            cursor.execute(f'''
+                SELECT {self._select_columns('reference_videos', fields)} FROM reference_videos
+                {where}
+                ORDER BY upload_time DESC, id DESC
+                {limit_clause}
+            ''', params)
             
             videos = []
             for row in cursor.fetchall():
@@ -552,7 +815,7 @@ class DanceDatabase:
             conn.close()
             return videos
         except Exception as e:
-            print(f"获取教学视频失败: {e}")
+            logger.error("获取教学视频失败: %s", e)
             return []
 
     def get_user_onboarding_status(self, user_id: str) -> Dict:
@@ -578,7 +841,7 @@ class DanceDatabase:
             cursor.execute('''
                 SELECT COUNT(*) AS cnt
                 FROM reference_videos
-                WHERE COALESCE(category, 'normal') = 'beginner'
+                WHERE category = 'beginner'
             ''')
             total_beginner = cursor.fetchone()['cnt']
 
@@ -597,7 +860,7 @@ class DanceDatabase:
                 JOIN reference_videos rv ON rv.video_id = uv.reference_video_id
                 WHERE uv.user_id = ?
                   AND uv.reference_video_id IS NOT NULL
-                  AND COALESCE(rv.category, 'normal') = 'beginner'
+                  AND rv.category = 'beginner'
             ''', (str(user_id),))
             completed_beginner = cursor.fetchone()['cnt']
 
@@ -609,7 +872,7 @@ class DanceDatabase:
                 'has_completed_beginner': completed_beginner >= total_beginner,
             }
         except Exception as e:
-            print(f"获取新手入门完成状态失败: {e}")
+            logger.error("获取新手入门完成状态失败: %s", e)
             # 失败时按"未完成"返回，由前端决定是否展示 bar
             return {
                 'total_beginner': 0,
@@ -617,42 +880,46 @@ class DanceDatabase:
                 'has_completed_beginner': False,
             }
     
-    def get_user_videos(self, user_id: str = None, visibility: str = None) -> List[Dict]:
-        """获取用户视频
+    def get_user_videos(self, user_id: str = None, visibility: str = None, fields: List[str] = None,
+                        limit: int = None, after: Tuple[str, int] = None) -> List[Dict]:
+        """获取永久存储的用户视频（按上传时间倒序，排除临时文件路径）
 
         Args:
             user_id: 指定查询某个用户的视频；不传则只返回永久存储的所有公开内容
             visibility: 'public' / 'private'，可选；不传则不限制
+            fields: 可选，只返回这些字段（未知字段忽略）
+            limit: 可选，最多返回的条数
+            after: 可选，上一页最后一条的 (upload_time, id)，只返回排在它之后的视频
         """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            conditions, params = [], []
             if user_id:
-                # 只查询指定用户的视频，且排除临时文件路径
+                conditions.append('user_id = ?')
+                params.append(user_id)
                 if visibility in ('public', 'private'):
-                    cursor.execute('''
-                        SELECT * FROM user_videos
-                        WHERE user_id = ?
-                          AND COALESCE(visibility, 'public') = ?
-                          AND (file_path LIKE '%uploads/user%' OR file_path LIKE '%uploads\\user%')
-                        ORDER BY upload_time DESC
-                    ''', (user_id, visibility))
-                else:
-                    cursor.execute('''
-                        SELECT * FROM user_videos 
-                        WHERE user_id = ? 
-                          AND (file_path LIKE '%uploads/user%' OR file_path LIKE '%uploads\\user%')
-                        ORDER BY upload_time DESC
-                    ''', (user_id,))
+                    conditions.append('visibility = ?')
+                    params.append(visibility)
             else:
-                # 不指定用户：默认只返回 public + 永久存储（首页用户视频 tab 的语义）
-                cursor.execute('''
-                    SELECT * FROM user_videos 
-                    WHERE COALESCE(visibility, 'public') = 'public'
-                      AND (file_path LIKE '%uploads/user%' OR file_path LIKE '%uploads\\user%')
-                    ORDER BY upload_time DESC
-                ''')
+                # 不指定用户：只返回 public（首页用户视频 tab 的语义）
+                conditions.append("visibility = 'public'")
+            # 永久存储目录下的文件（临时文件不出现在列表中）
+            conditions.append("(file_path LIKE '%uploads/user%' OR file_path LIKE '%uploads\\user%')")
+            if after:
+                conditions.append('(upload_time, id) < (?, ?)')
+                params.extend(after)
+            limit_clause = 'LIMIT ?' if limit else ''
+            if limit:
+                params.append(limit)
+            
+            cursor.execute(f'''
+                SELECT {self._select_columns('user_videos', fields)} FROM user_videos
+                WHERE {' AND '.join(conditions)}
+                ORDER BY upload_time DESC, id DESC
+                {limit_clause}
+            ''', params)
             
             videos = []
             for row in cursor.fetchall():
@@ -661,7 +928,7 @@ class DanceDatabase:
             conn.close()
             return videos
         except Exception as e:
-            print(f"获取用户视频失败: {e}")
+            logger.error("获取用户视频失败: %s", e)
             return []
     
     def get_video_by_id(self, video_id: str, video_type: str = 'reference') -> Optional[Dict]:
@@ -680,50 +947,44 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取视频信息失败: {e}")
+            logger.error("获取视频信息失败: %s", e)
             return None
     
     def add_comparison_record(self, comparison_id: str, reference_video_id: str, 
                             user_video_id: str, threshold: float = 0.4) -> bool:
         """添加视频比较记录"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO comparison_records 
-                (comparison_id, reference_video_id, user_video_id, threshold)
-                VALUES (?, ?, ?, ?)
-            ''', (comparison_id, reference_video_id, user_video_id, threshold))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO comparison_records 
+                    (comparison_id, reference_video_id, user_video_id, threshold)
+                    VALUES (?, ?, ?, ?)
+                ''', (comparison_id, reference_video_id, user_video_id, threshold))
             return True
         except sqlite3.IntegrityError:
-            print(f"比较记录ID {comparison_id} 已存在")
+            logger.warning("比较记录ID %s 已存在", comparison_id)
             return False
         except Exception as e:
-            print(f"添加比较记录失败: {e}")
+            logger.error("添加比较记录失败: %s", e)
             return False
     
     def update_comparison_result(self, comparison_id: str, total_differences: int, 
                                report_path: str, status: str = 'completed') -> bool:
         """更新比较结果"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE comparison_records 
-                SET total_differences = ?, report_path = ?, status = ?
-                WHERE comparison_id = ?
-            ''', (total_differences, report_path, status, comparison_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE comparison_records 
+                    SET total_differences = ?, report_path = ?, status = ?
+                    WHERE comparison_id = ?
+                ''', (total_differences, report_path, status, comparison_id))
             return True
         except Exception as e:
-            print(f"更新比较结果失败: {e}")
+            logger.error("更新比较结果失败: %s", e)
             return False
     
     def get_comparison_record(self, comparison_id: str) -> Optional[Dict]:
@@ -742,50 +1003,103 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取比较记录失败: {e}")
+            logger.error("获取比较记录失败: %s", e)
             return None
     
-    def delete_video(self, video_id: str, video_type: str = 'reference') -> bool:
-        """删除视频记录"""
+    def save_frame_comparison_cache(self, work_id: str, threshold: float,
+                                    reference_video_id: str, user_video_id: str,
+                                    reference_pose_version: int, user_pose_version: int,
+                                    payload: str, etag: str) -> bool:
+        """保存（覆盖）逐帧对比结果缓存"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT OR REPLACE INTO frame_comparison_cache
+                    (work_id, threshold, reference_video_id, user_video_id,
+                     reference_pose_version, user_pose_version, payload, etag, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (work_id, threshold, reference_video_id, user_video_id,
+                      reference_pose_version, user_pose_version, payload, etag))
+            return True
+        except Exception as e:
+            logger.error("保存逐帧对比缓存失败: %s", e)
+            return False
+    
+    def get_frame_comparison_cache(self, work_id: str, threshold: float) -> Optional[Dict]:
+        """获取逐帧对比结果缓存
+        
+        只有缓存时两边的姿势数据版本与 pose_blobs 中当前版本一致时才返回，否则视为过期返回 None。
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # 删除姿势数据
-            cursor.execute('DELETE FROM pose_data WHERE video_id = ?', (video_id,))
+            cursor.execute('''
+                SELECT c.payload, c.etag FROM frame_comparison_cache c
+                LEFT JOIN pose_blobs r ON r.video_id = c.reference_video_id
+                LEFT JOIN pose_blobs u ON u.video_id = c.user_video_id
+                WHERE c.work_id = ? AND c.threshold = ?
+                  AND c.reference_pose_version = COALESCE(r.version, 0)
+                  AND c.user_pose_version = COALESCE(u.version, 0)
+            ''', (work_id, threshold))
             
-            # 删除评论和点赞
-            cursor.execute('DELETE FROM comments WHERE video_id = ?', (video_id,))
-            cursor.execute('DELETE FROM likes WHERE video_id = ?', (video_id,))
+            row = cursor.fetchone()
+            conn.close()
             
-            # 删除比较记录
-            if video_type == 'reference':
-                cursor.execute('DELETE FROM comparison_records WHERE reference_video_id = ?', (video_id,))
-                cursor.execute('DELETE FROM reference_videos WHERE video_id = ?', (video_id,))
-            else:
-                cursor.execute('DELETE FROM comparison_records WHERE user_video_id = ?', (video_id,))
-                cursor.execute('DELETE FROM user_videos WHERE video_id = ?', (video_id,))
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error("获取逐帧对比缓存失败: %s", e)
+            return None
+    
+    def delete_video(self, video_id: str, video_type: str = 'reference') -> bool:
+        """删除视频记录"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # 删除姿势数据
+                cursor.execute('DELETE FROM pose_data WHERE video_id = ?', (video_id,))
+                cursor.execute('DELETE FROM pose_blobs WHERE video_id = ?', (video_id,))
+                
+                # 删除评论和点赞
+                cursor.execute('DELETE FROM comments WHERE video_id = ?', (video_id,))
+                cursor.execute('DELETE FROM likes WHERE video_id = ?', (video_id,))
+                cursor.execute('DELETE FROM video_engagement WHERE video_id = ?', (video_id,))
+                
+                # 删除逐帧对比缓存（任一边被删除都失效）
+                cursor.execute('''
+                    DELETE FROM frame_comparison_cache
+                    WHERE reference_video_id = ? OR user_video_id = ?
+                ''', (video_id, video_id))
+                
+                # 删除比较记录
+                if video_type == 'reference':
+                    cursor.execute('DELETE FROM comparison_records WHERE reference_video_id = ?', (video_id,))
+                    cursor.execute('DELETE FROM reference_videos WHERE video_id = ?', (video_id,))
+                else:
+                    cursor.execute('DELETE FROM comparison_records WHERE user_video_id = ?', (video_id,))
+                    cursor.execute('DELETE FROM user_videos WHERE video_id = ?', (video_id,))
             
-            conn.commit()
-            conn.close()
+            if video_type == 'reference':
+                self.reference_pose_cache.invalidate(video_id)
             return True
         except Exception as e:
-            print(f"删除视频失败: {e}")
+            logger.error("删除视频失败: %s", e)
             return False
     
     def update_user_role(self, user_id: int, role: str) -> bool:
         """更新用户角色"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('UPDATE users SET role = ? WHERE id = ?', (role, user_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('UPDATE users SET role = ? WHERE id = ?', (role, user_id))
+            self.auth_cache.invalidate_user(user_id)
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"更新用户角色失败: {e}")
+            logger.error("更新用户角色失败: %s", e)
             return False
     
     def get_database_stats(self) -> Dict:
@@ -808,9 +1122,11 @@ class DanceDatabase:
             cursor.execute('SELECT COUNT(*) FROM comparison_records')
             stats['comparison_records_count'] = cursor.fetchone()[0]
             
-            # 姿势数据数量
+            # 姿势数据数量（有骨骼的帧数：二进制存储 + 尚未迁移的旧版 JSON 行）
+            cursor.execute('SELECT COALESCE(SUM(valid_count), 0) FROM pose_blobs')
+            blob_frames = cursor.fetchone()[0]
             cursor.execute('SELECT COUNT(*) FROM pose_data')
-            stats['pose_data_count'] = cursor.fetchone()[0]
+            stats['pose_data_count'] = blob_frames + cursor.fetchone()[0]
             
             # 已提取姿势数据的视频数量
             cursor.execute('SELECT COUNT(*) FROM reference_videos WHERE pose_data_extracted = TRUE')
@@ -819,10 +1135,19 @@ class DanceDatabase:
             cursor.execute('SELECT COUNT(*) FROM user_videos WHERE pose_data_extracted = TRUE')
             stats['user_videos_with_pose'] = cursor.fetchone()[0]
             
+            # 教学视频姿势数据缓存（命中率等）
+            stats['reference_pose_cache'] = self.reference_pose_cache.stats()
+            
+            # 本进程的数据库连接
+            stats['connections'] = self.connections.stats()
+            
+            # 登录状态缓存
+            stats['auth_cache'] = self.auth_cache.stats()
+            
             conn.close()
             return stats
         except Exception as e:
-            print(f"获取数据库统计信息失败: {e}")
+            logger.error("获取数据库统计信息失败: %s", e)
             return {}
 
     # ========== 用户认证相关方法 ==========
@@ -830,22 +1155,19 @@ class DanceDatabase:
     def create_user(self, username: str, password_hash: str, email: str = None) -> bool:
         """创建新用户"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO users (username, password_hash, email)
-                VALUES (?, ?, ?)
-            ''', (username, password_hash, email))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO users (username, password_hash, email)
+                    VALUES (?, ?, ?)
+                ''', (username, password_hash, email))
             return True
         except sqlite3.IntegrityError:
-            print(f"用户名 {username} 已存在")
+            logger.warning("用户名 %s 已存在", username)
             return False
         except Exception as e:
-            print(f"创建用户失败: {e}")
+            logger.error("创建用户失败: %s", e)
             return False
     
     def get_user_by_username(self, username: str) -> Optional[Dict]:
@@ -860,7 +1182,7 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取用户信息失败: {e}")
+            logger.error("获取用户信息失败: %s", e)
             return None
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
@@ -875,44 +1197,38 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取用户信息失败: {e}")
+            logger.error("获取用户信息失败: %s", e)
             return None
     
     def update_last_login(self, user_id: int) -> bool:
         """更新用户最后登录时间"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE users 
-                SET last_login = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (user_id,))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE users 
+                    SET last_login = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (user_id,))
             return True
         except Exception as e:
-            print(f"更新最后登录时间失败: {e}")
+            logger.error("更新最后登录时间失败: %s", e)
             return False
     
     def save_session(self, user_id: int, token: str, expires_at: str) -> bool:
         """保存用户会话"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO user_sessions (user_id, token, expires_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, token, expires_at))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO user_sessions (user_id, token, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (user_id, token, expires_at))
             return True
         except Exception as e:
-            print(f"保存会话失败: {e}")
+            logger.error("保存会话失败: %s", e)
             return False
     
     def get_session_by_token(self, token: str) -> Optional[Dict]:
@@ -927,81 +1243,94 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取会话信息失败: {e}")
+            logger.error("获取会话信息失败: %s", e)
             return None
     
-    def delete_session(self, token: str) -> bool:
-        """删除会话（注销）"""
+    def session_exists(self, token: str) -> Optional[bool]:
+        """会话是否存在（未注销）
+        
+        Returns:
+            True/False；查询失败（数据库忙、I/O 错误）时返回 None，调用方不能把它当作会话已注销
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
-            
-            conn.commit()
+            cursor.execute('SELECT 1 FROM user_sessions WHERE token = ?', (token,))
+            row = cursor.fetchone()
             conn.close()
+            
+            return row is not None
+        except Exception as e:
+            logger.error("查询会话失败: %s", e)
+            return None
+    
+    def delete_session(self, token: str) -> bool:
+        """删除会话（注销）"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
+            self.auth_cache.invalidate_token(token)
             return True
         except Exception as e:
-            print(f"删除会话失败: {e}")
+            logger.error("删除会话失败: %s", e)
             return False
     
     # ========== 异步任务管理方法 ==========
     
-    def create_async_task(self, task_id: str, video_id: str, video_type: str, task_type: str) -> bool:
-        """创建异步任务"""
+    def create_async_task(self, task_id: str, video_id: str, video_type: str, task_type: str,
+                          priority: int = 0, payload: Dict = None) -> bool:
+        """创建异步任务（pending 状态，等待任务队列领取）"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO async_tasks (task_id, video_id, video_type, task_type, status)
-                VALUES (?, ?, ?, ?, 'pending')
-            ''', (task_id, video_id, video_type, task_type))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO async_tasks (task_id, video_id, video_type, task_type, status, priority, payload)
+                    VALUES (?, ?, ?, ?, 'pending', ?, ?)
+                ''', (task_id, video_id, video_type, task_type, priority,
+                      json.dumps(payload) if payload is not None else None))
             return True
         except Exception as e:
-            print(f"创建异步任务失败: {e}")
+            logger.error("创建异步任务失败: %s", e)
             return False
     
     def update_task_status(self, task_id: str, status: str, progress: int = None, 
                           error_message: str = None) -> bool:
         """更新任务状态"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            if status == 'processing' and progress is None:
-                cursor.execute('''
-                    UPDATE async_tasks 
-                    SET status = ?, started_at = CURRENT_TIMESTAMP
-                    WHERE task_id = ?
-                ''', (status, task_id))
-            elif status == 'completed':
-                cursor.execute('''
-                    UPDATE async_tasks 
-                    SET status = ?, progress = 100, completed_at = CURRENT_TIMESTAMP
-                    WHERE task_id = ?
-                ''', (status, task_id))
-            elif status == 'failed':
-                cursor.execute('''
-                    UPDATE async_tasks 
-                    SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP
-                    WHERE task_id = ?
-                ''', (status, error_message, task_id))
-            else:
-                cursor.execute('''
-                    UPDATE async_tasks 
-                    SET status = ?, progress = ?
-                    WHERE task_id = ?
-                ''', (status, progress or 0, task_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if status == 'processing' and progress is None:
+                    cursor.execute('''
+                        UPDATE async_tasks 
+                        SET status = ?, started_at = CURRENT_TIMESTAMP
+                        WHERE task_id = ?
+                    ''', (status, task_id))
+                elif status == 'completed':
+                    cursor.execute('''
+                        UPDATE async_tasks 
+                        SET status = ?, progress = 100, completed_at = CURRENT_TIMESTAMP
+                        WHERE task_id = ?
+                    ''', (status, task_id))
+                elif status == 'failed':
+                    cursor.execute('''
+                        UPDATE async_tasks 
+                        SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP
+                        WHERE task_id = ?
+                    ''', (status, error_message, task_id))
+                else:
+                    cursor.execute('''
+                        UPDATE async_tasks 
+                        SET status = ?, progress = ?
+                        WHERE task_id = ?
+                    ''', (status, progress or 0, task_id))
             return True
         except Exception as e:
-            print(f"更新任务状态失败: {e}")
+            logger.error("更新任务状态失败: %s", e)
             return False
     
     def get_task_status(self, task_id: str) -> Optional[Dict]:
@@ -1016,9 +1345,138 @@ class DanceDatabase:
             
             return dict(row) if row else None
         except Exception as e:
-            print(f"获取任务状态失败: {e}")
+            logger.error("获取任务状态失败: %s", e)
+            return None
+    
+    def claim_next_task(self, task_types: List[str]) -> Optional[Dict]:
+        """领取下一个待执行的任务（优先级高的先执行，同优先级按提交顺序）
+        
+        领取是一条原子 UPDATE，多个线程/进程同时领取也不会拿到同一个任务。
+        
+        Returns:
+            任务信息（payload 已解析为 dict）；没有待执行的任务时返回 None
+        """
+        if not task_types:
+            return None
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                placeholders = ','.join('?' * len(task_types))
+                cursor.execute(f'''
+                    UPDATE async_tasks
+                    SET status = 'processing', progress = 0, started_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM async_tasks
+                        WHERE status = 'pending' AND task_type IN ({placeholders})
+                        ORDER BY priority DESC, id ASC
+                        LIMIT 1
+                    ) AND status = 'pending'
+                    RETURNING *
+                ''', task_types)
+                row = cursor.fetchone()
+            
+            if not row:
+                return None
+            task = dict(row)
+            task['payload'] = json.loads(task['payload']) if task['payload'] else {}
+            return task
+        except Exception as e:
+            logger.error("领取任务失败: %s", e)
+            return None
+    
+    def finish_task(self, task_id: str, status: str, error_message: str = None) -> bool:
+        """结束任务（只更新仍在 processing 的任务，任务函数已自行标记结果时不覆盖）"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                if status == 'completed':
+                    cursor.execute('''
+                        UPDATE async_tasks
+                        SET status = 'completed', progress = 100, completed_at = CURRENT_TIMESTAMP
+                        WHERE task_id = ? AND status = 'processing'
+                    ''', (task_id,))
+                else:
+                    cursor.execute('''
+                        UPDATE async_tasks
+                        SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP
+                        WHERE task_id = ? AND status = 'processing'
+                    ''', (status, error_message, task_id))
+            return True
+        except Exception as e:
+            logger.error("结束任务失败: %s", e)
+            return False
+    
+    def requeue_interrupted_tasks(self) -> int:
+        """服务启动时恢复上次中断的任务
+        
+        processing 状态的任务放回队列重新执行；没有 payload 的旧任务无法重新执行，标记为失败。
+        
+        Returns:
+            放回队列的任务数
+        """
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE async_tasks
+                    SET status = 'failed', error_message = '服务重启，任务中断', completed_at = CURRENT_TIMESTAMP
+                    WHERE status IN ('pending', 'processing') AND payload IS NULL
+                ''')
+                cursor.execute('''
+                    UPDATE async_tasks
+                    SET status = 'pending', progress = 0, started_at = NULL
+                    WHERE status = 'processing'
+                ''')
+                requeued = cursor.rowcount
+            return requeued
+        except Exception as e:
+            logger.error("恢复中断任务失败: %s", e)
+            return 0
+    
+    def get_task_queue_position(self, task_id: str) -> Optional[int]:
+        """获取任务在队列中的位置（1 表示下一个执行）；任务不在排队时返回 None"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT id, status, priority FROM async_tasks WHERE task_id = ?', (task_id,))
+            task = cursor.fetchone()
+            if not task or task['status'] != 'pending':
+                conn.close()
+                return None
+            
+            # 排在前面的任务：优先级更高，或优先级相同但提交更早
+            cursor.execute('''
+                SELECT COUNT(*) FROM async_tasks
+                WHERE status = 'pending'
+                  AND (priority > ? OR (priority = ? AND id < ?))
+            ''', (task['priority'], task['priority'], task['id']))
+            position = cursor.fetchone()[0] + 1
+            
+            conn.close()
+            return position
+        except Exception as e:
+            logger.error("获取任务队列位置失败: %s", e)
             return None
     
+    def count_tasks(self, status: str) -> int:
+        """统计某个状态的任务数"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT COUNT(*) FROM async_tasks WHERE status = ?', (status,))
+            count = cursor.fetchone()[0]
+            
+            conn.close()
+            return count
+        except Exception as e:
+            logger.error("统计任务数失败: %s", e)
+            return 0
+    
     def get_tasks_by_video(self, video_id: str) -> List[Dict]:
         """获取视频相关的所有任务"""
         try:
@@ -1038,143 +1496,176 @@ class DanceDatabase:
             conn.close()
             return tasks
         except Exception as e:
-            print(f"获取视频任务列表失败: {e}")
+            logger.error("获取视频任务列表失败: %s", e)
             return []
     
     # ========== 评论相关方法 ==========
     
-    def add_comment(self, video_id: str, video_type: str, user_id: int, content: str) -> bool:
-        """添加评论"""
+    def add_comment(self, video_id: str, video_type: str, user_id: int, content: str) -> Optional[Dict]:
+        """添加评论
+        
+        Returns:
+            新评论（INSERT ... RETURNING 取回，包含用户名），失败时返回 None
+        """
         try:
-            print(f"[数据库] 添加评论 - video_id: {video_id}, video_type: {video_type}, user_id: {user_id}, content: {content[:50]}...")
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO comments (video_id, video_type, user_id, content)
-                VALUES (?, ?, ?, ?)
-            ''', (video_id, video_type, user_id, content))
-            
-            print(f"[数据库] INSERT执行成功，影响行数: {cursor.rowcount}")
-            conn.commit()
-            print(f"[数据库] 事务提交成功")
-            conn.close()
-            return True
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO comments (video_id, video_type, user_id, content)
+                    VALUES (?, ?, ?, ?)
+                    RETURNING id, video_id, video_type, user_id, content, created_at,
+                              (SELECT username FROM users WHERE users.id = comments.user_id) AS username
+                ''', (video_id, video_type, user_id, content))
+                comment = self._comment_to_dict(cursor.fetchone())
+                
+                self._add_engagement(cursor, video_id, video_type, comments=1)
+            logger.debug("[数据库] 添加评论 %s - video_id: %s, video_type: %s, user_id: %s", comment['id'], video_id, video_type, user_id)
+            return comment
         except Exception as e:
-            print(f"[数据库] 添加评论失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+            logger.exception("[数据库] 添加评论失败: %s", e)
+            return None
     
-    def get_comments(self, video_id: str, video_type: str = None) -> List[Dict]:
-        """获取视频的评论列表"""
+    def _comment_to_dict(self, row) -> Dict:
+        return {
+            'id': row['id'],
+            'video_id': row['video_id'],
+            'video_type': row['video_type'],
+            'user_id': row['user_id'],
+            'content': row['content'],
+            'created_at': row['created_at'],
+            'username': row['username'] or '未知用户'  # 如果用户不存在，使用默认值
+        }
+    
+    def get_comments(self, video_id: str, video_type: str = None, before_id: int = None,
+                     limit: int = None) -> List[Dict]:
+        """获取视频的评论列表（按发表时间倒序）
+        
+        Args:
+            before_id: 只返回排在这条评论之后（更早）的评论，用于翻页
+            limit: 最多返回的条数，None 表示不限
+        """
         try:
-            print(f"[数据库] 获取评论 - video_id: {video_id}, video_type: {video_type}")
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            conditions = ['c.video_id = ?']
+            params: List = [video_id]
             if video_type:
-                cursor.execute('''
-                    SELECT c.id, c.video_id, c.video_type, c.user_id, c.content, c.created_at, u.username
-                    FROM comments c
-                    LEFT JOIN users u ON c.user_id = u.id
-                    WHERE c.video_id = ? AND c.video_type = ?
-                    ORDER BY c.created_at DESC
-                ''', (video_id, video_type))
-            else:
-                cursor.execute('''
-                    SELECT c.id, c.video_id, c.video_type, c.user_id, c.content, c.created_at, u.username
-                    FROM comments c
-                    LEFT JOIN users u ON c.user_id = u.id
-                    WHERE c.video_id = ?
-                    ORDER BY c.created_at DESC
-                ''', (video_id,))
-            
-            rows = cursor.fetchall()
-            comments = []
-            for row in rows:
-                # sqlite3.Row对象转换为字典
-                comment_dict = {
-                    'id': row['id'],
-                    'video_id': row['video_id'],
-                    'video_type': row['video_type'],
-                    'user_id': row['user_id'],
-                    'content': row['content'],
-                    'created_at': row['created_at'],
-                    'username': row['username'] or '未知用户'  # 如果用户不存在，使用默认值
-                }
-                comments.append(comment_dict)
-            
-            print(f"[数据库] 查询到 {len(comments)} 条评论")
-            if comments:
-                print(f"[数据库] 第一条评论示例: {comments[0]}")
+                conditions.append('c.video_type = ?')
+                params.append(video_type)
+            if before_id is not None:
+                # (created_at, id) 与索引 idx_comments_video_time 的顺序一致，翻页时直接从索引定位
+                conditions.append('(c.created_at, c.id) < (SELECT created_at, id FROM comments WHERE id = ?)')
+                params.append(before_id)
+            limit_clause = ''
+            if limit is not None:
+                limit_clause = 'LIMIT ?'
+                params.append(limit)
+            
+            cursor.execute(f'''
+                SELECT c.id, c.video_id, c.video_type, c.user_id, c.content, c.created_at, u.username
+                FROM comments c
+                LEFT JOIN users u ON c.user_id = u.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY c.created_at DESC, c.id DESC
+                {limit_clause}
+            ''', params)
+            
+            comments = [self._comment_to_dict(row) for row in cursor.fetchall()]
             
             conn.close()
             return comments
         except Exception as e:
-            print(f"[数据库] 获取评论列表失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("[数据库] 获取评论列表失败: %s", e)
             return []
     
-    def toggle_like(self, video_id: str, video_type: str, user_id: int) -> Tuple[bool, bool]:
+    def _add_engagement(self, cursor, video_id: str, video_type: str, likes: int = 0, comments: int = 0) -> Dict:
+        """在调用方的事务中调整视频的点赞数 / 评论数（一条 UPSERT），返回调整后的计数"""
+        cursor.execute('''
+            INSERT INTO video_engagement (video_id, video_type, like_count, comment_count)
+            VALUES (?, ?, MAX(?, 0), MAX(?, 0))
+            ON CONFLICT(video_id, video_type) DO UPDATE SET
+                like_count = MAX(like_count + ?, 0),
+                comment_count = MAX(comment_count + ?, 0)
+            RETURNING like_count, comment_count
+        ''', (video_id, video_type, likes, comments, likes, comments))
+        return dict(cursor.fetchone())
+    
+    def toggle_like(self, video_id: str, video_type: str, user_id: int) -> Tuple[bool, bool, int]:
         """
         切换点赞状态（如果已点赞则取消，未点赞则点赞）
-        返回: (是否成功, 当前是否已点赞)
+        返回: (是否成功, 当前是否已点赞, 切换后的点赞数)
         """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # 检查是否已点赞
-            cursor.execute('''
-                SELECT id FROM likes 
-                WHERE video_id = ? AND video_type = ? AND user_id = ?
-            ''', (video_id, video_type, user_id))
-            
-            existing_like = cursor.fetchone()
-            
-            if existing_like:
-                # 取消点赞
-                cursor.execute('''
-                    DELETE FROM likes 
-                    WHERE video_id = ? AND video_type = ? AND user_id = ?
-                ''', (video_id, video_type, user_id))
-                conn.commit()
-                conn.close()
-                return True, False
-            else:
-                # 添加点赞
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # 尝试点赞；已点赞时（唯一约束冲突）不插入，改为取消点赞
                 cursor.execute('''
                     INSERT INTO likes (video_id, video_type, user_id)
                     VALUES (?, ?, ?)
+                    ON CONFLICT(video_id, video_type, user_id) DO NOTHING
                 ''', (video_id, video_type, user_id))
-                conn.commit()
-                conn.close()
-                return True, True
+                is_liked = cursor.rowcount > 0
+                
+                if not is_liked:
+                    cursor.execute('''
+                        DELETE FROM likes 
+                        WHERE video_id = ? AND video_type = ? AND user_id = ?
+                    ''', (video_id, video_type, user_id))
+                
+                engagement = self._add_engagement(cursor, video_id, video_type, likes=1 if is_liked else -1)
+                return True, is_liked, engagement['like_count']
         except Exception as e:
-            print(f"切换点赞状态失败: {e}")
-            return False, False
+            logger.error("切换点赞状态失败: %s", e)
+            return False, False, 0
     
     def get_like_count(self, video_id: str, video_type: str) -> int:
         """获取视频的点赞数量"""
+        return self.get_engagement([video_id], video_type)[video_id]['like_count']
+    
+    def get_engagement(self, video_ids: List[str], video_type: str, user_id: int = None) -> Dict[str, Dict]:
+        """批量获取视频的点赞数、评论数和指定用户是否已点赞（一次查询）
+        
+        Returns:
+            {video_id: {'like_count', 'comment_count', 'is_liked'}}；查询失败时计数为 0
+        """
+        video_ids = list(dict.fromkeys(video_ids))
+        result = {video_id: {'like_count': 0, 'comment_count': 0, 'is_liked': False} for video_id in video_ids}
+        if not video_ids:
+            return result
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM likes 
-                WHERE video_id = ? AND video_type = ?
-            ''', (video_id, video_type))
+            values = ', '.join(['(?)'] * len(video_ids))
+            cursor.execute(f'''
+                WITH requested(video_id) AS (VALUES {values})
+                SELECT requested.video_id,
+                       COALESCE(e.like_count, 0) AS like_count,
+                       COALESCE(e.comment_count, 0) AS comment_count,
+                       EXISTS(
+                           SELECT 1 FROM likes l
+                           WHERE l.video_id = requested.video_id AND l.video_type = ? AND l.user_id = ?
+                       ) AS is_liked
+                FROM requested
+                LEFT JOIN video_engagement e
+                    ON e.video_id = requested.video_id AND e.video_type = ?
+            ''', (*video_ids, video_type, user_id, video_type))
             
-            result = cursor.fetchone()
-            count = result['count'] if result else 0
+            for row in cursor.fetchall():
+                result[row['video_id']] = {
+                    'like_count': row['like_count'],
+                    'comment_count': row['comment_count'],
+                    'is_liked': bool(row['is_liked']),
+                }
             
             conn.close()
-            return count
+            return result
         except Exception as e:
-            print(f"获取点赞数量失败: {e}")
-            return 0
+            logger.error("批量获取互动计数失败: %s", e)
+            return result
     
     def is_liked(self, video_id: str, video_type: str, user_id: int) -> bool:
         """检查用户是否已点赞该视频"""
@@ -1191,8 +1682,12 @@ class DanceDatabase:
             conn.close()
             return result is not None
         except Exception as e:
-            print(f"检查点赞状态失败: {e}")
+            logger.error("检查点赞状态失败: %s", e)
             return False
 
 # 全局数据库实例
 db = DanceDatabase()
+
+# 按需开启查询耗时统计（见 db_instrumentation.py），未开启时不做任何包装
+if DB_INSTRUMENTATION:
+    instrument_database(db)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+SQLite 连接管理
+
+每个线程持有一个长期使用的连接，PRAGMA 只在连接创建时设置一次，之后各个数据库方法直接复用，
+不再每次查询都重新打开连接、重新设置 WAL 和超时。
+
+    - DanceDatabase 的读方法仍按原来的写法 get_connection() ... conn.close()：close() 不会真正关闭连接，
+      只回滚未提交的事务，把连接留给同一线程的下一次调用；写方法使用 transaction()，出错时一定回滚
+    - 连接长期属于一个线程，出错时残留的事务会一直占着写锁：请求和后台任务结束时调用 release()
+      回滚残留的事务，不让空闲的线程挡住其他写入
+    - 连接按进程 id 区分，gunicorn fork 出的 worker 不会沿用主进程的连接
+    - transaction() 以 BEGIN IMMEDIATE 开始写事务：一开始就取得写锁（等待时受 busy_timeout 控制），
+      避免两个先读后写的事务同时升级写锁时直接报 database is locked
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# 每个连接的页缓存大小（MB）和内存映射大小（MB，0 表示不使用 mmap）
+SQLITE_CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB', '16'))
+SQLITE_MMAP_MB = int(os.environ.get('SQLITE_MMAP_MB', '128'))
+# 等待其他连接释放锁的最长时间（毫秒）
+SQLITE_BUSY_TIMEOUT_MS = 30000
+# 每个连接缓存的预编译语句数（连接长期复用后，同一条 SQL 只在第一次执行时编译）
+SQLITE_STATEMENT_CACHE = 256
+
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',  # 读写可以并发
+    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+    'PRAGMA synchronous=NORMAL',  # WAL 模式下只在检查点时 fsync，断电最多丢失最后几个事务，不会损坏数据库
+    f'PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}',  # 负数表示 KB
+    f'PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+class PooledConnection:
+    """线程持有的连接：其余属性和方法都转发给 sqlite3.Connection，close() 只回滚未提交的事务"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self.pid = os.getpid()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+    def really_close(self):
+        self._conn.close()
+
+
+class SQLiteConnectionManager:
+    """按线程分配 SQLite 连接"""
+
+    # 新建连接的包装类（开启查询统计时替换为 db_instrumentation.InstrumentedConnection）
+    connection_class = PooledConnection
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()  # 本进程所有线程的连接（线程结束后自动移除）
+        self._inherited = []  # fork 前父进程的连接：保留引用，避免被垃圾回收时关闭
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.abandoned_transactions = 0
+
+    def _open(self) -> PooledConnection:
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        pooled = self.connection_class(conn)
+        with self._lock:
+            self._connections.add(pooled)
+            self.opened += 1
+        return pooled
+
+    def connection(self) -> PooledConnection:
+        """当前线程的连接（不存在或属于 fork 前的父进程时新建）"""
+        pooled: Optional[PooledConnection] = getattr(self._local, 'conn', None)
+        if pooled is None or pooled.pid != os.getpid():
+            # fork 继承来的连接不能在子进程中使用，也不能关闭（关闭会影响父进程持有的锁），只保留引用
+            if pooled is not None:
+                self._inherited.append(pooled)
+            pooled = self._local.conn = self._open()
+        else:
+            self._rollback_abandoned(pooled)
+        return pooled
+
+    def _rollback_abandoned(self, pooled: PooledConnection):
+        """不在 transaction() 中却有未提交的事务：上一次调用出错时没有提交也没有 close()，
+        回滚掉残留的事务，避免一直占着写锁"""
+        if pooled.in_transaction and not getattr(self._local, 'depth', 0):
+            pooled.rollback()
+            with self._lock:
+                self.abandoned_transactions += 1
+
+    def release(self):
+        """请求或后台任务结束时调用：回滚当前线程连接上残留的事务（连接本身留给下一次使用）"""
+        pooled: Optional[PooledConnection] = getattr(self._local, 'conn', None)
+        if pooled is None or pooled.pid != os.getpid():
+            return
+        try:
+            self._rollback_abandoned(pooled)
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def transaction(self) -> Iterator[PooledConnection]:
+        """写事务：正常结束时提交，抛出异常时回滚并继续抛出
+
+        嵌套调用时使用 SAVEPOINT，内层回滚不影响外层事务。
+        """
+        conn = self.connection()
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            if depth:
+                savepoint = f'nested_{depth}'
+                conn.execute(f'SAVEPOINT {savepoint}')
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute(f'ROLLBACK TO {savepoint}')
+                    conn.execute(f'RELEASE {savepoint}')
+                    raise
+                conn.execute(f'RELEASE {savepoint}')
+                return
+
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        finally:
+            self._local.depth = depth
+
+    def close_all(self):
+        """关闭本进程创建的所有连接（进程退出前调用）"""
+        pid = os.getpid()
+        with self._lock:
+            connections = [c for c in self._connections if c.pid == pid]
+            self._connections = weakref.WeakSet()
+        for pooled in connections:
+            try:
+                pooled.really_close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> Dict:
+        pid = os.getpid()
+        with self._lock:
+            open_connections = sum(1 for c in self._connections if c.pid == pid)
+        return {
+            'open_connections': open_connections,
+            'opened_total': self.opened,
+            'abandoned_transactions': self.abandoned_transactions,
+            'cache_mb': SQLITE_CACHE_MB,
+            'mmap_mb': SQLITE_MMAP_MB,
+        }
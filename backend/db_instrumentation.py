@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+数据库查询耗时统计（按需开启）
+
+设置 DB_INSTRUMENTATION=1 后，DanceDatabase 的每个公开方法和每条 SQL 语句都会记录：
+调用次数、总耗时、p50 / p95 / p99、最大耗时和返回的行数；超过 DB_SLOW_QUERY_MS 的调用打印慢查询日志。
+统计结果通过 GET /api/database/query-stats（管理员）查看。
+
+未开启时不包装任何方法和连接，没有额外开销。统计数据保存在进程内，
+生产模式下每个 gunicorn worker 各自统计，接口返回的是处理该请求的 worker 的数据。
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Dict, List, Optional
+
+from db_connection import PooledConnection
+
+logger = logging.getLogger(__name__)
+
+DB_INSTRUMENTATION = os.environ.get('DB_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+# 慢查询阈值（毫秒）
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '100'))
+# 每个方法 / 语句保留最近多少次耗时用于计算分位数
+SAMPLE_SIZE = 1024
+# 保留最近多少条慢查询
+SLOW_QUERY_LOG_SIZE = 100
+
+# 不统计的方法：连接管理本身，以及只在启动时执行一次的建表
+EXCLUDED_METHODS = ('get_connection', 'transaction', 'init_database')
+
+_whitespace_re = re.compile(r'\s+')
+_placeholders_re = re.compile(r'\?(\s*,\s*\?)+')
+
+
+def normalize_sql(sql: str) -> str:
+    """合并空白，并把 IN (?, ?, ?) 这类长度可变的占位符列表归为一条语句"""
+    return _placeholders_re.sub('?, ...', _whitespace_re.sub(' ', sql).strip())
+
+
+class _Timings:
+    """一个方法或一条语句的统计"""
+
+    __slots__ = ('count', 'errors', 'total', 'max', 'rows', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, seconds: float, rows: int, error: bool):
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict:
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000 if samples else 0.0
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total * 1000, 2),
+            'avg_ms': round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(percentile(0.50), 3),
+            'p95_ms': round(percentile(0.95), 3),
+            'p99_ms': round(percentile(0.99), 3),
+            'max_ms': round(self.max * 1000, 3),
+            'rows': self.rows,
+        }
+
+
+class QueryStats:
+    """按方法和 SQL 语句汇总的耗时统计（线程安全）"""
+
+    def __init__(self, slow_query_ms: float = DB_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._methods: Dict[str, _Timings] = {}
+        self._statements: Dict[str, _Timings] = {}
+        self._statement_methods: Dict[str, str] = {}
+        self._slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = time.time()
+
+    def current_method(self) -> Optional[str]:
+        return getattr(self._local, 'method', None)
+
+    def record_method(self, method: str, seconds: float, rows: int, error: bool):
+        with self._lock:
+            timings = self._methods.get(method)
+            if timings is None:
+                timings = self._methods[method] = _Timings()
+            timings.add(seconds, rows, error)
+        if seconds * 1000 >= self.slow_query_ms:
+            self._log_slow('method', method, seconds, rows)
+
+    def record_statement(self, sql: str, seconds: float, rows: int, error: bool):
+        method = self.current_method()
+        with self._lock:
+            timings = self._statements.get(sql)
+            if timings is None:
+                timings = self._statements[sql] = _Timings()
+                self._statement_methods[sql] = method
+            timings.add(seconds, rows, error)
+        if seconds * 1000 >= self.slow_query_ms:
+            self._log_slow('sql', sql, seconds, rows, method)
+
+    def _log_slow(self, kind: str, name: str, seconds: float, rows: int, method: str = None):
+        entry = {
+            'type': kind,
+            'name': name,
+            'method': method,
+            'duration_ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'at': time.time(),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        source = f"（{method}）" if method else ''
+        logger.warning("[慢查询] %s %.1fms rows=%s%s: %s", kind, seconds * 1000, rows, source, name[:200])
+
+    def snapshot(self, sort: str = 'total_ms', limit: int = 50) -> Dict:
+        with self._lock:
+            methods = [dict(name=name, **t.summary()) for name, t in self._methods.items()]
+            statements = [dict(sql=sql, method=self._statement_methods.get(sql), **t.summary())
+                          for sql, t in self._statements.items()]
+            slow_queries = list(self._slow_queries)
+        if sort not in ('count', 'total_ms', 'avg_ms', 'p95_ms', 'p99_ms', 'max_ms', 'rows'):
+            sort = 'total_ms'
+        methods.sort(key=lambda item: item[sort], reverse=True)
+        statements.sort(key=lambda item: item[sort], reverse=True)
+        return {
+            'enabled': True,
+            'pid': os.getpid(),
+            'since': self.started_at,
+            'slow_query_ms': self.slow_query_ms,
+            'methods': methods[:limit],
+            'statements': statements[:limit],
+            'slow_queries': slow_queries[-limit:][::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._statements.clear()
+            self._statement_methods.clear()
+            self._slow_queries.clear()
+            self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+
+def _count_rows(result) -> int:
+    """方法返回的行数：列表按长度计，单条记录（dict）计 1，其他返回值（bool、计数等）计 0"""
+    if isinstance(result, list):
+        return len(result)
+    return 1 if isinstance(result, dict) and result else 0
+
+
+class InstrumentedCursor:
+    """记录每条语句耗时的游标：execute 和之后的 fetch 合计为一次执行，下次 execute 或游标释放时提交统计"""
+
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+        self._pending = None  # [sql, 耗时, 行数, 是否出错]
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _flush(self):
+        if self._pending is not None:
+            self._stats.record_statement(*self._pending)
+            self._pending = None
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception:
+            if self._pending is not None:
+                self._pending[3] = True
+            raise
+        finally:
+            if self._pending is not None:
+                self._pending[1] += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._flush()
+        self._pending = [normalize_sql(sql), 0.0, 0, False]
+        self._timed(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush()
+        self._pending = [normalize_sql(sql), 0.0, 0, False]
+        self._timed(self._cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None and self._pending is not None:
+            self._pending[2] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, *(() if size is None else (size,)))
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+        self._flush()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._flush()
+        self._cursor.close()
+
+    def __del__(self):
+        try:
+            self._flush()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(PooledConnection):
+    """游标和 conn.execute 都经过 InstrumentedCursor"""
+
+    stats = query_stats
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self.stats)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _instrument_method(name: str, method, stats: QueryStats):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        outer = stats.current_method()
+        if outer is None:
+            stats._local.method = name
+        started = time.perf_counter()
+        error = False
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            if outer is None:
+                stats._local.method = None
+            stats.record_method(name, time.perf_counter() - started, _count_rows(result), error)
+    return wrapper
+
+
+def instrument_database(db, stats: QueryStats = query_stats) -> List[str]:
+    """给 DanceDatabase 实例的公开方法和数据库连接加上统计（只影响这个实例）
+
+    Returns:
+        被统计的方法名
+    """
+    names = []
+    for name in dir(type(db)):
+        if name.startswith('_') or name in EXCLUDED_METHODS:
+            continue
+        method = getattr(db, name)
+        if callable(method):
+            setattr(db, name, _instrument_method(name, method, stats))
+            names.append(name)
+
+    # 之后新建的连接使用 InstrumentedConnection；已经打开的连接（启动时建表用的）关闭后按需重建
+    db.connections.connection_class = InstrumentedConnection
+    db.connections.close_all()
+    logger.info("[查询统计] 已开启，统计 %s 个数据库方法，慢查询阈值 %.0fms", len(names), stats.slow_query_ms)
+    return names
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+gunicorn 配置（生产模式，由 start_server.py --prod 使用）
+
+    gunicorn -c gunicorn.conf.py app:app
+
+请求 worker 只处理 HTTP 请求：骨骼提取进程池和任务队列由单独的任务进程（start_server.py --jobs）运行，
+上传接口把任务写入 async_tasks 表，任务进程轮询认领。
+"""
+
+import os
+
+# 监听地址
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8128')
+# 请求 worker 进程数和每个进程的线程数（视频播放、范围请求大多在等待 I/O，用线程比多开进程省内存）
+workers = int(os.environ.get('GUNICORN_WORKERS', str(min(4, (os.cpu_count() or 1) + 1))))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+# 同步对比接口可能要提取骨骼、生成视频，超时时间要足够长
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+# 处理一定数量的请求后重建 worker，避免长时间运行后内存持续增长
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# 在主进程中导入应用（数据库建表、迁移只执行一次），worker fork 后共享已加载的代码
+preload_app = True
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# 少数同步接口（如 /api/compare-videos）仍会在请求中提取骨骼，请求 worker 里的进程池只保留 1 个进程，
+# 避免每个 worker 各自创建完整大小的进程池；POSE_WORKER_PROCESSES 仍用于任务进程
+os.environ['POSE_WORKER_PROCESSES'] = os.environ.get('REQUEST_POSE_WORKER_PROCESSES', '1')
+
+
+def when_ready(server):
+    """主进程加载应用后检测一次运行环境，fork 出的 worker 直接继承检测结果"""
+    from capabilities import detect_capabilities
+    detect_capabilities()
+
+
+def post_fork(server, worker):
+    """每个 worker fork 之后打开自己的数据库连接并预加载姿势缓存（线程不会跨 fork 保留）"""
+    from app import init_request_worker
+    init_request_worker()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+日志配置
+
+    - 级别由 LOG_LEVEL 控制（默认 INFO），单个模块可用 LOG_LEVELS 覆盖，
+      如 LOG_LEVELS=database=DEBUG,pose_pipeline=WARNING
+    - 每个模块使用自己的 logger：logger = logging.getLogger(__name__)
+    - 请求线程只把日志记录放进队列，由后台线程写 stdout：Docker 日志驱动变慢时不阻塞请求，
+      多个线程也不再争抢 stdout 的锁；队列满时丢弃新的记录并计数
+    - 逐行、逐帧的日志加上 extra=sampled(N)，同一调用位置每 N 条只输出 1 条
+    - LOG_FORMAT=json 时每条日志输出为一行 JSON，便于日志系统按字段检索
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 按模块覆盖日志级别，格式：模块名=级别,模块名=级别
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+# text（默认）或 json
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+# 等待写出的日志记录上限，超出时丢弃
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'
+
+_lock = threading.Lock()
+_handler: Optional['DroppingQueueHandler'] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def sampled(every: int) -> Dict:
+    """logger.debug(..., extra=sampled(100))：同一调用位置每 100 条只输出第 1 条"""
+    return {'sample_every': every}
+
+
+class SamplingFilter(logging.Filter):
+    """按调用位置（文件、行号）抽样带 sample_every 的记录，其他记录原样通过"""
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, 'sample_every', None)
+        if not every or every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % every:
+            return False
+        if count:
+            record.msg = f"{record.msg}（每 {every} 条输出 1 条，已输出第 {count + 1} 条）"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时不阻塞调用方，丢弃记录并计数"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一条 JSON（异常堆栈已由 QueueHandler 在放入队列前合并到 message 中）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }, ensure_ascii=False)
+
+
+def _parse_module_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener():
+    """新建队列和写 stdout 的后台线程（调用方持有 _lock）"""
+    global _listener
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _after_fork_in_child():
+    """fork 出的子进程（gunicorn worker、进程池）里没有父进程的写日志线程，队列也可能处于加锁状态，重新创建"""
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _start_listener()
+
+
+def setup_logging():
+    """配置根 logger（重复调用无副作用），各入口在导入 database 之前调用"""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _handler = DroppingQueueHandler(None)
+        _handler.addFilter(SamplingFilter())
+        _start_listener()
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        for name, level in _parse_module_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写出队列中剩余的日志（进程退出时自动调用）"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+        if _handler is not None and _handler.dropped:
+            print(f"[日志] 队列已满，共丢弃 {_handler.dropped} 条日志", file=sys.stderr)
+
+
+def dropped_records() -> int:
+    """因队列满被丢弃的日志条数"""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+视频容器信息探测（基于 ffprobe）
+
+probe_media 一次 ffprobe 调用读取容器和所有流的信息，结果在进程内缓存并保存到视频记录的 media_info 字段，
+时长、帧率、编码格式、分辨率等都从这里读取，不再各自调用 ffprobe。
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from capabilities import has_ffprobe
+from metrics import SUBPROCESS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# probe_media 结果的进程内缓存条数（按 路径 + 文件大小 + 修改时间 缓存，文件被替换后自动失效）
+MEDIA_INFO_CACHE_SIZE = 256
+
+_media_info_cache: 'OrderedDict[tuple, Dict]' = OrderedDict()
+_media_info_lock = threading.Lock()
+
+
+def probe_keyframes(video_file: str, timeout: int = 60) -> Optional[List[int]]:
+    """读取视频流的关键帧位置（按显示顺序的帧序号，与 OpenCV 的帧编号一致）
+
+    只读取容器中的数据包信息（pts 和关键帧标记），不解码画面，长视频也很快。
+
+    Returns:
+        升序的关键帧帧序号列表；ffprobe 不可用或时间戳不完整时返回 None
+    """
+    if not has_ffprobe():
+        return None
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_file
+    ]
+    try:
+        with SUBPROCESS_SECONDS.time(tool='ffprobe', purpose='keyframes'):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error("[关键帧索引] ffprobe 执行失败: %s", e)
+        return None
+    if result.returncode != 0:
+        logger.error("[关键帧索引] ffprobe 返回错误: %s", result.stderr.strip()[:200])
+        return None
+
+    packets = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2:
+            continue
+        try:
+            pts = float(parts[0])
+        except ValueError:
+            # 缺少时间戳时无法确定显示顺序
+            return None
+        packets.append((pts, 'K' in parts[1]))
+
+    if not packets:
+        return None
+
+    # 数据包按解码顺序排列（有 B 帧时与显示顺序不同），按 pts 排序后的下标即帧序号
+    packets.sort(key=lambda packet: packet[0])
+    keyframes = [index for index, (_, is_key) in enumerate(packets) if is_key]
+    return keyframes or None
+
+
+def _file_key(video_file: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(video_file)
+    except OSError:
+        return None
+    return os.path.abspath(video_file), stat.st_size, stat.st_mtime_ns
+
+
+def _parse_frame_rate(value: str) -> float:
+    """'30000/1001' -> 29.97；无法解析时返回 0"""
+    try:
+        if '/' in value:
+            num, den = value.split('/', 1)
+            return float(num) / float(den) if float(den) > 0 else 0.0
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parse_ffprobe_output(data: Dict, key: tuple) -> Dict:
+    """把 ffprobe -show_streams -show_format 的 JSON 整理成各处需要的字段"""
+    fmt = data.get('format') or {}
+    streams = data.get('streams') or []
+    video_stream = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    
+    def to_float(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    info = {
+        'size': key[1],
+        'mtime_ns': key[2],
+        'format_name': fmt.get('format_name') or '',
+        'duration': to_float(fmt.get('duration')),
+        'bit_rate': int(to_float(fmt.get('bit_rate'))),
+        'video': None,
+        'audio': None,
+    }
+    
+    if video_stream:
+        width, height = int(video_stream.get('width') or 0), int(video_stream.get('height') or 0)
+        # 旋转信息可能在 tags.rotate（旧版 ffmpeg）或 side_data_list 的 displaymatrix 中
+        rotation = (video_stream.get('tags') or {}).get('rotate')
+        for side_data in video_stream.get('side_data_list') or []:
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+        rotation = int(to_float(rotation)) % 360
+        # ffmpeg 解码时默认自动旋转，90/270 度时宽高互换
+        if rotation in (90, 270):
+            width, height = height, width
+        info['video'] = {
+            'codec_name': video_stream.get('codec_name') or '',
+            'pix_fmt': video_stream.get('pix_fmt') or '',
+            'width': width,
+            'height': height,
+            'rotation': rotation,
+            'fps': _parse_frame_rate(video_stream.get('r_frame_rate') or ''),
+            'nb_frames': int(to_float(video_stream.get('nb_frames'))),
+        }
+        # 部分容器（如 webm）的 format 中没有时长，改用视频流时长
+        if info['duration'] <= 0:
+            info['duration'] = to_float(video_stream.get('duration'))
+    
+    if audio_stream:
+        info['audio'] = {
+            'codec_name': audio_stream.get('codec_name') or '',
+            'channels': int(audio_stream.get('channels') or 0),
+            'sample_rate': int(to_float(audio_stream.get('sample_rate'))),
+        }
+    return info
+
+
+def probe_media(video_file: str, timeout: int = 30) -> Optional[Dict]:
+    """读取视频的容器和流信息（一次 ffprobe 调用），结果按 (路径, 文件大小, 修改时间) 缓存
+
+    Returns:
+        {'size', 'mtime_ns', 'format_name', 'duration', 'bit_rate',
+         'video': {'codec_name', 'pix_fmt', 'width', 'height', 'rotation', 'fps', 'nb_frames'} 或 None,
+         'audio': {'codec_name', 'channels', 'sample_rate'} 或 None}；
+        width/height 为按旋转角度修正后的显示尺寸。文件不存在或 ffprobe 不可用时返回 None
+    """
+    key = _file_key(video_file)
+    if key is None:
+        return None
+    with _media_info_lock:
+        info = _media_info_cache.get(key)
+        if info is not None:
+            _media_info_cache.move_to_end(key)
+            return info
+    if not has_ffprobe():
+        return None
+    
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_streams', '-show_format',
+        '-of', 'json',
+        video_file
+    ]
+    try:
+        with SUBPROCESS_SECONDS.time(tool='ffprobe', purpose='media_info'):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            logger.error("[媒体信息] ffprobe 返回错误: %s", result.stderr.strip()[:200])
+            return None
+        info = _parse_ffprobe_output(json.loads(result.stdout), key)
+    except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+        logger.error("[媒体信息] ffprobe 执行失败: %s", e)
+        return None
+
+    _remember(key, info)
+    return info
+
+
+def remember_media_info(video_file: str, info: Optional[Dict]) -> bool:
+    """把之前保存的 probe_media 结果（如数据库中的 media_info）放回缓存
+    
+    只有文件大小和修改时间与保存时一致才会采用，返回是否采用。
+    """
+    key = _file_key(video_file)
+    if key is None or not info or (info.get('size'), info.get('mtime_ns')) != key[1:]:
+        return False
+    _remember(key, info)
+    return True
+
+
+def _remember(key: tuple, info: Dict):
+    with _media_info_lock:
+        _media_info_cache[key] = info
+        _media_info_cache.move_to_end(key)
+        while len(_media_info_cache) > MEDIA_INFO_CACHE_SIZE:
+            _media_info_cache.popitem(last=False)
+
+
+def probe_video_stream(video_file: str) -> Optional[Dict]:
+    """读取第一个视频流的分辨率、旋转角度和编码格式（来自 probe_media）
+    
+    Returns:
+        {'width', 'height', 'rotation', 'codec_name', 'pix_fmt'}，
+        width/height 为按旋转角度修正后的显示尺寸；失败时返回 None
+    """
+    info = probe_media(video_file)
+    stream = info and info['video']
+    if not stream or stream['width'] <= 0 or stream['height'] <= 0:
+        return None
+    return {key: stream[key] for key in ('width', 'height', 'rotation', 'codec_name', 'pix_fmt')}
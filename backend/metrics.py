@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+运行指标（Prometheus 文本格式，GET /metrics）
+
+不依赖任何外部服务或第三方库：计数器、直方图、瞬时值都保存在进程内，记录一次只是加锁后更新几个数字。
+
+    - 骨骼提取各阶段耗时：probe / transcode / decode / inference / db_save
+    - 任务队列：排队等待时间、任务执行时间、待执行任务数、正在执行的任务数
+    - 骨骼提取 worker 进程的推理速度（帧/秒）和利用率
+    - ffmpeg / ffprobe 子进程耗时
+    - 每个 Flask 接口的请求耗时
+
+生产模式下请求由多个 gunicorn worker 处理，骨骼提取在单独的任务进程中执行：
+设置了 METRICS_DIR 时每个进程每 METRICS_FLUSH_INTERVAL 秒把自己的数据写入该目录下的一个快照文件，
+/metrics 合并所有进程的快照后输出（计数器和直方图相加；瞬时值只计入仍在运行的进程）。
+已退出进程（如 gunicorn 按 max_requests 重建的 worker）的快照在读取时合并到 retired.json 中，计数不会减少。
+start_server.py --prod 未指定 METRICS_DIR 时自动创建临时目录，退出时删除。
+"""
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各进程快照文件所在目录（留空时只输出当前进程的数据）
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# 写快照文件的间隔（秒），即其他进程的数据在 /metrics 中的最大延迟
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# 接口耗时的分桶（秒）
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 视频处理阶段 / 子进程耗时的分桶（秒）
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+RETIRED_FILE = 'retired.json'
+LOCK_FILE = '.lock'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """一个指标名下按标签值区分的若干条时间序列（线程安全）"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> List:
+        """[[标签值列表, 值], ...]，用于写快照文件和合并"""
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def render(self, samples: List) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(samples, key=lambda sample: sample[0]):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, tuple(labels))} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """瞬时值
+
+    local=True 时只在输出 /metrics 的进程中计算、不写入快照（如直接查询数据库得到的队列长度，
+    每个进程算出的都是同一个值，相加就错了）。
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), local: bool = False):
+        super().__init__(name, documentation, labelnames)
+        self.local = local
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def replace(self, values: Dict[Tuple[str, ...], float]):
+        """整体替换所有序列（已经不存在的对象，如退出的 worker 进程，随之消失）"""
+        with self._lock:
+            self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+
+
+class Histogram(_Metric):
+    """分桶统计；每条序列保存 [各桶计数（不累计）..., +Inf 桶计数, 总和, 次数]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """with HISTOGRAM.time(stage='probe'): ...  记录代码块的耗时（抛出异常时也记录）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    def render(self, samples: List) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, series in sorted(samples, key=lambda sample: sample[0]):
+            labels = tuple(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+def _merge_samples(merged: Dict[Tuple[str, ...], object], samples: List):
+    for labels, value in samples:
+        key = tuple(labels)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            merged[key] = [a + b for a, b in zip(current, value)]
+        else:
+            merged[key] = current + value
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """本进程的所有指标，以及多进程快照的写入与合并"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[Callable[[], None], bool]] = []
+        self._directory = ''
+        self._snapshot_path = ''
+        self._exporter: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None], local: bool = False):
+        """写快照和输出 /metrics 之前调用，用于刷新由其他对象维护的瞬时值（如进程池状态）
+
+        local=True 的只在输出 /metrics 时调用（用于刷新 local 瞬时值）。
+        """
+        self._collectors.append((collector, local))
+
+    def _collect(self, include_local: bool):
+        for collector, local in self._collectors:
+            if local and not include_local:
+                continue
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("[运行指标] 采集失败: %s", e)
+
+    def _local_snapshot(self) -> Dict[str, List]:
+        self._collect(include_local=False)
+        return {
+            name: metric.snapshot()
+            for name, metric in self._metrics.items()
+            if not getattr(metric, 'local', False)
+        }
+
+    # ---------- 多进程快照 ----------
+
+    def start_exporter(self, directory: str = METRICS_DIR):
+        """每隔 METRICS_FLUSH_INTERVAL 秒把本进程的数据写入 directory（未设置目录时不写，重复调用无副作用）"""
+        with self._lock:
+            if not directory or self._exporter is not None:
+                return
+            os.makedirs(directory, exist_ok=True)
+            self._directory = directory
+            self._snapshot_path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+            self._stop.clear()
+            self._exporter = threading.Thread(target=self._export_loop, name='metrics-exporter', daemon=True)
+            self._exporter.start()
+        atexit.register(self.flush)
+
+    def _export_loop(self):
+        while not self._stop.wait(METRICS_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """立即写入本进程的快照（临时文件 + 改名，读取方不会读到写了一半的文件）"""
+        path = self._snapshot_path
+        if not path:
+            return
+        data = {'pid': os.getpid(), 'metrics': self._local_snapshot()}
+        temp_file = f'{path}.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_file, path)
+        except OSError as e:
+            logger.warning("[运行指标] 写入快照失败: %s", e)
+
+    def _after_fork_in_child(self):
+        """fork 出的子进程（gunicorn worker）从零开始统计，写快照的线程由 start_exporter 重新启动"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._exporter = None
+        self._snapshot_path = ''
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric.reset()
+
+    @contextmanager
+    def _directory_lock(self, exclusive: bool):
+        with open(os.path.join(self._directory, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _retire_dead_snapshots(self):
+        """把已退出进程的计数器和直方图合并进 retired.json 并删除其快照（持有排他锁）"""
+        retired_path = os.path.join(self._directory, RETIRED_FILE)
+        dead = []
+        for path in glob.glob(os.path.join(self._directory, '*-*.json')):
+            data = self._read(path)
+            if data is not None and not _pid_alive(data.get('pid', 0)):
+                dead.append((path, data))
+        if not dead:
+            return
+
+        retired = (self._read(retired_path) or {}).get('metrics', {})
+        for _, data in dead:
+            for name, samples in data['metrics'].items():
+                metric = self._metrics.get(name)
+                if metric is None or isinstance(metric, Gauge):
+                    continue
+                merged = {tuple(labels): value for labels, value in retired.get(name, [])}
+                _merge_samples(merged, samples)
+                retired[name] = [[list(key), value] for key, value in merged.items()]
+
+        temp_file = f'{retired_path}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'pid': 0, 'metrics': retired}, f)
+        os.replace(temp_file, retired_path)
+        for path, _ in dead:
+            os.remove(path)
+
+    def _other_snapshots(self) -> List[Dict]:
+        """其他进程（以及已退出进程合并后）的快照"""
+        if not self._directory:
+            return []
+        try:
+            with self._directory_lock(exclusive=True):
+                self._retire_dead_snapshots()
+            with self._directory_lock(exclusive=False):
+                snapshots = []
+                for path in glob.glob(os.path.join(self._directory, '*.json')):
+                    if path == self._snapshot_path:
+                        continue
+                    data = self._read(path)
+                    if data is not None:
+                        snapshots.append(data)
+                return snapshots
+        except OSError as e:
+            logger.warning("[运行指标] 读取其他进程的快照失败: %s", e)
+            return []
+
+    # ---------- 输出 ----------
+
+    def render(self) -> str:
+        """合并本进程和其他进程的数据，输出 Prometheus 文本格式"""
+        self._collect(include_local=True)
+        merged: Dict[str, Dict] = {name: {} for name in self._metrics}
+        for name, metric in self._metrics.items():
+            _merge_samples(merged[name], metric.snapshot())
+
+        for data in self._other_snapshots():
+            # 已退出的进程（retired.json 的 pid 为 0）只计入计数器和直方图
+            alive = data.get('pid', 0) and _pid_alive(data['pid'])
+            for name, samples in data.get('metrics', {}).items():
+                metric = self._metrics.get(name)
+                if metric is None or getattr(metric, 'local', False):
+                    continue
+                if isinstance(metric, Gauge) and not alive:
+                    continue
+                _merge_samples(merged[name], samples)
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.render([[list(key), value] for key, value in merged[name].items()]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry._after_fork_in_child)
+
+
+# ---------- 指标定义 ----------
+
+POSE_STAGE_SECONDS = registry.register(Histogram(
+    'pose_stage_seconds',
+    '每个视频在骨骼提取各阶段的耗时（decode / inference 为各解码线程、worker 进程耗时之和）',
+    ('stage',),
+))
+POSE_FRAMES = registry.register(Counter(
+    'pose_frames_total',
+    '骨骼提取推理的采样帧数',
+))
+POSE_WORKER_FRAMES_PER_SECOND = registry.register(Gauge(
+    'pose_worker_frames_per_second',
+    '每个骨骼提取 worker 进程忙碌时的推理速度（帧/秒）',
+    ('worker',),
+))
+POSE_WORKER_UTILIZATION = registry.register(Gauge(
+    'pose_worker_utilization',
+    '每个骨骼提取 worker 进程的利用率（忙碌时间 / 自第一个任务起经过的时间）',
+    ('worker',),
+))
+TASK_WAIT_SECONDS = registry.register(Histogram(
+    'task_queue_wait_seconds',
+    '任务从提交到开始执行的排队时间（精度为秒）',
+    ('task_type',),
+))
+TASK_SECONDS = registry.register(Histogram(
+    'task_duration_seconds',
+    '任务执行时间',
+    ('task_type', 'status'),
+))
+TASK_QUEUE_DEPTH = registry.register(Gauge(
+    'task_queue_depth',
+    '各状态的任务数（查询 async_tasks 表）',
+    ('status',),
+    local=True,
+))
+TASK_ACTIVE = registry.register(Gauge(
+    'task_queue_active_tasks',
+    '正在执行任务的工作线程数',
+    ('task_type',),
+))
+SUBPROCESS_SECONDS = registry.register(Histogram(
+    'ffmpeg_subprocess_seconds',
+    'ffmpeg / ffprobe 子进程耗时',
+    ('tool', 'purpose'),
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds',
+    '接口处理耗时（流式响应只计到开始发送）',
+    ('endpoint', 'method', 'status'),
+    buckets=REQUEST_BUCKETS,
+))
+LOG_DROPPED = registry.register(Gauge(
+    'log_records_dropped',
+    '日志队列满时丢弃的日志条数（进程启动以来）',
+))
+
+
+def _collect_log_dropped():
+    from log_config import dropped_records
+    LOG_DROPPED.set(dropped_records())
+
+
+registry.add_collector(_collect_log_dropped)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+把 pose_data 表中旧版逐帧 JSON 姿势数据迁移到 pose_blobs 二进制存储
+
+服务运行时读取到未迁移的视频也会自动迁移，本脚本用于一次性批量迁移并回收空间。
+"""
+from log_config import setup_logging
+setup_logging()  # 迁移进度由 database 模块的日志输出
+from database import db
+
+def main():
+    """主函数"""
+    print("开始迁移旧版姿势数据...")
+
+    migrated = db.migrate_legacy_pose_data()
+    print(f"\n已迁移 {migrated} 个视频的姿势数据")
+
+    # 旧数据删除后执行 VACUUM 回收磁盘空间
+    conn = db.get_connection()
+    conn.execute('VACUUM')
+    conn.close()
+    print("数据库空间已回收")
+
+if __name__ == '__main__':
+    main()
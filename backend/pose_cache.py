@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+进程内姿势数据缓存
+
+教学视频数量少、被对比的次数多，把解码后的 PoseArrays 保存在内存里，
+避免每次对比都从 SQLite 读取整段骨骼数据。缓存按字节数限制大小，超出时淘汰最久未使用的视频。
+
+姿势数据重新提取或视频被删除时，主动清除本进程的缓存，并更新数据库旁边的 epoch 文件；
+其他进程（gunicorn 的其他 worker、后台任务进程）最多每 POSE_EPOCH_CHECK_INTERVAL 秒检查一次
+epoch 文件，发现变化时清空自己的缓存。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from pose_store import PoseArrays
+
+# 检查 epoch 文件的间隔（秒），即跨进程失效的最大延迟
+POSE_EPOCH_CHECK_INTERVAL = 1.0
+
+
+class PoseArrayCache:
+    """按内存预算限制大小的 LRU 缓存（线程安全）"""
+    
+    def __init__(self, max_bytes: int, epoch=None):
+        """epoch: 跨进程的失效标记（auth_cache.AuthEpoch），为 None 时只在本进程内失效"""
+        self.max_bytes = max_bytes
+        self.epoch = epoch
+        self._items: 'OrderedDict[str, PoseArrays]' = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._generation = 0  # 每次失效 +1，用于丢弃失效前开始加载的旧数据
+        self._epoch = epoch.current() if epoch is not None else None
+        self._epoch_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _check_epoch(self):
+        """其他进程更新了 epoch 文件时清空缓存（调用方持有锁）"""
+        if self.epoch is None:
+            return
+        now = time.monotonic()
+        if now - self._epoch_checked_at < POSE_EPOCH_CHECK_INTERVAL:
+            return
+        self._epoch_checked_at = now
+        epoch = self.epoch.current()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._generation += 1
+            self._items.clear()
+            self._current_bytes = 0
+    
+    def get(self, video_id: str, loader: Callable[[str], Optional[PoseArrays]]) -> Optional[PoseArrays]:
+        """读取缓存；未命中时调用 loader 加载并放入缓存（loader 返回 None 时不缓存）"""
+        with self._lock:
+            self._check_epoch()
+            arrays = self._items.get(video_id)
+            if arrays is not None:
+                self._items.move_to_end(video_id)
+                self.hits += 1
+                return arrays
+            self.misses += 1
+            generation = self._generation
+        
+        # 在锁外加载，避免慢查询阻塞其他线程
+        arrays = loader(video_id)
+        if arrays is not None:
+            self.put(video_id, arrays, generation)
+        return arrays
+    
+    def put(self, video_id: str, arrays: PoseArrays, generation: Optional[int] = None) -> bool:
+        """放入缓存；单个视频超过整个预算、或加载期间缓存已失效时不缓存，返回 False"""
+        size = arrays.nbytes
+        if size > self.max_bytes:
+            return False
+        
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            old = self._items.pop(video_id, None)
+            if old is not None:
+                self._current_bytes -= old.nbytes
+            self._items[video_id] = arrays
+            self._current_bytes += size
+            
+            while self._current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._current_bytes -= evicted.nbytes
+                self.evictions += 1
+        return True
+    
+    def has_room(self, size: int) -> bool:
+        """是否还能放入 size 字节而不淘汰已有数据（预热时使用）"""
+        with self._lock:
+            return self._current_bytes + size <= self.max_bytes
+    
+    def invalidate(self, video_id: str):
+        """删除某个视频的缓存，并通知其他进程"""
+        with self._lock:
+            self._generation += 1
+            old = self._items.pop(video_id, None)
+            if old is not None:
+                self._current_bytes -= old.nbytes
+            # 先处理其他进程已发出的失效通知，之后记下的 epoch 才只包含自己这一次更新
+            self._epoch_checked_at = float('-inf')
+            self._check_epoch()
+        epoch = self.epoch.bump() if self.epoch is not None else None
+        if epoch is not None:
+            with self._lock:
+                self._epoch = epoch
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+            self._current_bytes = 0
+    
+    def stats(self) -> Dict:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
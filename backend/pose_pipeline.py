@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+单解码流水线骨骼提取
+
+按帧数切段并行时，每个 worker 都要从第 0 帧 grab 到自己的起始帧，总解码量约为视频的 2.5 倍。
+流水线模式只用一个解码线程顺序读取视频，只解码、缩放每 n 帧中的采样帧，
+按块写入共享内存环形缓冲区；常驻 worker 进程（pose_workers）读取帧块做推理，结果按帧号重新排序。
+无论 worker 有多少个，整段视频都只解码一遍。
+
+chunked 模式下按关键帧切段（plan_keyframe_chunks），每个 worker 直接跳到关键帧开始解码。
+"""
+
+import bisect
+import logging
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from capabilities import ffmpeg_frame_rate_args, has_ffmpeg
+from metrics import POSE_STAGE_SECONDS, SUBPROCESS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 骨骼提取的并行方式：'pipeline' 单解码流水线（默认）/ 'chunked' 按帧数切段，各 worker 各自解码
+POSE_EXTRACTION_MODE = os.environ.get('POSE_EXTRACTION_MODE', 'pipeline')
+# 每个共享内存槽位存放的连续采样帧数（同一块内的帧由同一个 worker 按顺序推理，可以利用跟踪）
+POSE_PIPELINE_BLOCK_FRAMES = int(os.environ.get('POSE_PIPELINE_BLOCK_FRAMES', '16'))
+# 采样帧解码方式：'auto'（有 ffmpeg 时用 ffmpeg）/ 'ffmpeg' / 'opencv'
+POSE_DECODER = os.environ.get('POSE_DECODER', 'auto')
+# 超过这么久没有任何帧块完成，视为 worker 卡死
+PIPELINE_STALL_TIMEOUT = 300
+# 读取 ffmpeg 输出时超过这么久没有读到下一帧，视为 ffmpeg 卡死并结束进程
+FFMPEG_DECODE_STALL_TIMEOUT = 120
+
+
+class FrameSource:
+    """采样帧来源：按顺序产出 (frame_idx, RGB uint8[height, width, 3])，只产出 frame_idx % n == 0 的帧"""
+
+    width = 0
+    height = 0
+
+    def frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenCVFrameSource(FrameSource):
+    """用 OpenCV 解码：非采样帧只 grab 不解码，采样帧缩放到最长边不超过 max_side 并转为 RGB"""
+
+    def __init__(self, video_file: str, n: int, max_side: int):
+        import cv2
+        self._cv2 = cv2
+        self.n = n
+        self.cap = cv2.VideoCapture(video_file)
+        if not self.cap.isOpened():
+            raise IOError(f"无法打开视频: {video_file}")
+
+        src_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        src_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if src_width <= 0 or src_height <= 0:
+            raise IOError(f"无法获取视频分辨率: {video_file}")
+        scale = min(1.0, max_side / max(src_width, src_height))
+        self.width = int(src_width * scale)
+        self.height = int(src_height * scale)
+
+    def frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        cv2 = self._cv2
+        frame_idx = 0
+        while True:
+            if frame_idx % self.n == 0:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                if frame.shape[1] != self.width or frame.shape[0] != self.height:
+                    frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+                yield frame_idx, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            else:
+                if not self.cap.grab():
+                    break
+            frame_idx += 1
+
+    def close(self):
+        self.cap.release()
+
+
+class FFmpegFrameSource(FrameSource):
+    """用 ffmpeg 滤镜完成采样和缩放：select 只输出每 n 帧中的一帧，scale 缩放到目标尺寸，
+    直接输出 RGB 原始帧到管道（不需要 Python 侧 grab / resize / BGR→RGB，也能直接读取 webm/mkv）
+
+    stderr 写入临时文件（写满管道缓冲区会让 ffmpeg 卡住）；等待下一帧超过 FFMPEG_DECODE_STALL_TIMEOUT 秒时
+    结束 ffmpeg。ffmpeg 返回非 0（包括中途出错、被结束）时 frames() 抛出 IOError，不把中途截断的结果当作完整视频。
+    """
+
+    def __init__(self, video_file: str, n: int, max_side: int):
+        from media_probe import probe_video_stream
+        stream = probe_video_stream(video_file)
+        if stream is None:
+            raise IOError(f"ffprobe 无法读取视频流: {video_file}")
+
+        # 与 OpenCVFrameSource 使用相同的目标尺寸
+        scale = min(1.0, max_side / max(stream['width'], stream['height']))
+        self.width = int(stream['width'] * scale)
+        self.height = int(stream['height'] * scale)
+        self.n = n
+
+        video_filter = f"select='not(mod(n\\,{n}))',scale={self.width}:{self.height}:flags=bilinear"
+        cmd = [
+            'ffmpeg', '-v', 'error', '-nostdin',
+            '-i', video_file,
+            '-map', '0:v:0',
+            '-vf', video_filter,
+            *ffmpeg_frame_rate_args('passthrough'),  # 不补帧/丢帧，输出的第 k 帧就是原视频第 k*n 帧
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            'pipe:1'
+        ]
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=self.stderr)
+        self.started = time.perf_counter()
+        # 正在等待 ffmpeg 输出的开始时间（不在读取时为 None：消费方处理得慢不算 ffmpeg 卡住）
+        self._reading_since = None
+        self._stalled = False
+        self._closed = threading.Event()
+        threading.Thread(target=self._watchdog, name='ffmpeg-watchdog', daemon=True).start()
+
+    def _watchdog(self):
+        while not self._closed.wait(1):
+            reading_since = self._reading_since
+            if reading_since is not None and time.monotonic() - reading_since > FFMPEG_DECODE_STALL_TIMEOUT:
+                self._stalled = True
+                self.proc.kill()
+                return
+
+    def frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        frame_bytes = self.width * self.height * 3
+        count = 0
+        while True:
+            self._reading_since = time.monotonic()
+            data = self.proc.stdout.read(frame_bytes)
+            self._reading_since = None
+            if len(data) < frame_bytes:
+                break
+            yield count * self.n, np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            count += 1
+
+        self.proc.wait()
+        if self._stalled:
+            raise IOError(f"ffmpeg 解码超过 {FFMPEG_DECODE_STALL_TIMEOUT} 秒没有输出，已结束进程（已解码 {count} 帧）")
+        if self.proc.returncode != 0:
+            self.stderr.seek(0)
+            error = self.stderr.read().decode('utf-8', errors='replace').strip()
+            raise IOError(f"ffmpeg 解码失败（返回码 {self.proc.returncode}，已解码 {count} 帧）: {error[:300]}")
+
+    def close(self):
+        self._closed.set()
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.stderr.close()
+        if self.started is not None:
+            SUBPROCESS_SECONDS.observe(time.perf_counter() - self.started, tool='ffmpeg', purpose='decode')
+            self.started = None
+
+
+def open_frame_source(video_file: str, n: int, max_side: int) -> FrameSource:
+    """打开采样帧来源（按 POSE_DECODER 选择 ffmpeg 或 OpenCV；ffmpeg 不可用时回退到 OpenCV）"""
+    if POSE_DECODER == 'ffmpeg' or (POSE_DECODER == 'auto' and has_ffmpeg()):
+        try:
+            return FFmpegFrameSource(video_file, n, max_side)
+        except Exception as e:
+            logger.info("[提取骨骼] ffmpeg 解码不可用，改用 OpenCV: %s", e)
+    return OpenCVFrameSource(video_file, n, max_side)
+
+
+def iter_sampled_frames(video_file: str, n: int, max_side: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """逐个产出采样帧；ffmpeg 一帧都没解码出来时自动改用 OpenCV 重新读取"""
+    source = open_frame_source(video_file, n, max_side)
+    produced = False
+    try:
+        for item in source.frames():
+            produced = True
+            yield item
+    except IOError as e:
+        if produced or isinstance(source, OpenCVFrameSource):
+            raise
+        logger.info("[提取骨骼] %s，改用 OpenCV 解码", e)
+        source.close()
+        source = OpenCVFrameSource(video_file, n, max_side)
+        yield from source.frames()
+    finally:
+        source.close()
+
+
+def plan_keyframe_chunks(total_frames: int, keyframes: List[int], num_chunks: int,
+                         n: int) -> List[Tuple[int, int, int]]:
+    """把视频切成若干段，每段从关键帧开始解码（用于 chunked 模式）
+
+    每个等分点先回退到前一个关键帧，再前进到下一个 n 的整数倍帧，
+    这样各段处理的采样帧与单进程顺序读取完全相同。
+
+    Returns:
+        [(seek_frame, start_frame, end_frame), ...]：worker 先跳到 seek_frame（关键帧），
+        再顺序 grab 到 start_frame（少于 n 帧加一个 GOP 内），处理 [start_frame, end_frame)
+    """
+    boundaries = set()
+    for i in range(1, num_chunks):
+        target = i * total_frames // num_chunks
+        keyframe = keyframes[bisect.bisect_right(keyframes, target) - 1] if keyframes[0] <= target else 0
+        aligned = -(-keyframe // n) * n  # 向上取整到 n 的倍数
+        if 0 < aligned < total_frames:
+            boundaries.add(aligned)
+
+    starts = [0] + sorted(boundaries)
+    chunks = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else total_frames
+        seek = keyframes[bisect.bisect_right(keyframes, start) - 1] if keyframes[0] <= start else 0
+        chunks.append((seek, start, end))
+    return chunks
+
+
+def extract_poses_pipelined(source: FrameSource, worker_pool, selected_landmarks: List[int],
+                            slots: Optional[int] = None,
+                            block_frames: int = POSE_PIPELINE_BLOCK_FRAMES) -> Dict[int, Optional[List]]:
+    """单解码流水线提取骨骼数据
+
+    Args:
+        source: 采样帧来源
+        worker_pool: pose_workers.PoseWorkerPool
+        selected_landmarks: 需要保留的关键点编号
+        slots: 环形缓冲区槽位数，默认 worker 数的 2 倍（一半在推理，一半在写入）
+        block_frames: 每个槽位的帧数
+
+    Returns:
+        dict: 帧索引到骨骼数据的映射（按帧号排序），无骨骼时存储None
+    """
+    slots = slots or worker_pool.processes * 2
+    frame_shape = (source.height, source.width, 3)
+    slot_bytes = block_frames * int(np.prod(frame_shape))
+
+    shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+    ring = np.ndarray((slots, block_frames) + frame_shape, dtype=np.uint8, buffer=shm.buf)
+
+    # 空闲槽位；worker 完成一个帧块后在结果线程中把槽位放回来
+    free_slots = queue.Queue()
+    for slot in range(slots):
+        free_slots.put(slot)
+
+    results = {}
+    errors = []
+    results_lock = threading.Lock()
+    inference_seconds = 0.0
+    slot_wait_seconds = 0.0  # 解码线程等待空闲槽位的时间，不计入解码耗时
+
+    def on_done(slot, poses_data, stats):
+        nonlocal inference_seconds
+        with results_lock:
+            results.update(poses_data)
+            inference_seconds += stats['inference_seconds']
+        free_slots.put(slot)
+
+    def on_error(error):
+        errors.append(error)
+        free_slots.put(None)  # 唤醒等待中的解码线程
+
+    def acquire_slot() -> int:
+        nonlocal slot_wait_seconds
+        while True:
+            wait_started = time.perf_counter()
+            try:
+                slot = free_slots.get(timeout=PIPELINE_STALL_TIMEOUT)
+            except queue.Empty:
+                raise TimeoutError(f"骨骼提取 worker {PIPELINE_STALL_TIMEOUT} 秒内没有完成任何帧块")
+            finally:
+                slot_wait_seconds += time.perf_counter() - wait_started
+            if errors:
+                raise errors[0]
+            if slot is not None:
+                return slot
+
+    def submit(slot, frame_indices):
+        job = (shm.name, slot, slot * slot_bytes, frame_indices,
+               source.height, source.width, selected_landmarks)
+        worker_pool.submit_block(job, on_done, on_error)
+
+    started = time.time()
+    sampled = 0
+    try:
+        slot, frame_indices = None, []
+        for frame_idx, image_rgb in source.frames():
+            if slot is None:
+                slot = acquire_slot()
+            ring[slot, len(frame_indices)] = image_rgb
+            frame_indices.append(frame_idx)
+            sampled += 1
+            if len(frame_indices) == block_frames:
+                submit(slot, frame_indices)
+                slot, frame_indices = None, []
+        if frame_indices:
+            submit(slot, frame_indices)
+        elif slot is not None:
+            free_slots.put(slot)
+        decode_seconds = time.time() - started - slot_wait_seconds
+
+        # 等待所有槽位归还，即所有帧块推理完成
+        for _ in range(slots):
+            acquire_slot()
+    finally:
+        # 关闭共享内存前必须释放所有指向它的数组
+        ring = None
+        shm.close()
+        shm.unlink()
+
+    elapsed = time.time() - started
+    logger.debug("[提取骨骼] 流水线解码 %s 个采样帧，耗时 %.1f 秒（%.1f 帧/秒）", sampled, elapsed, sampled / elapsed if elapsed > 0 else 0)
+    POSE_STAGE_SECONDS.observe(decode_seconds, stage='decode')
+    POSE_STAGE_SECONDS.observe(inference_seconds, stage='inference')
+    return {frame_idx: results[frame_idx] for frame_idx in sorted(results)}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+姿势数据二进制列式存储
+
+每个视频的骨骼数据打包为三段连续的二进制数据，存入 pose_blobs 表的一行：
+    frame_indices: int32[frames]          采样帧的帧索引（升序）
+    presence:      uint8[frames]          该帧是否检测到人像（1=有骨骼，0=无骨骼）
+    poses:         float32[frames,13,4]   13 个关键点的 [x, y, z, visibility]，无骨骼的帧填 0
+
+读取时用 np.frombuffer 直接映射 SQLite 返回的 bytes，不做逐行 json.loads，也不拷贝数据。
+MediaPipe 输出的坐标本身就是 float32，因此以 float32 存储不会损失精度。
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+# 与 extract_poses_from_video 中 selected_landmarks 的数量保持一致
+NUM_LANDMARKS = 13
+LANDMARK_DIMS = 4  # x, y, z, visibility
+
+FRAME_INDEX_DTYPE = np.int32
+PRESENCE_DTYPE = np.uint8
+POSE_DTYPE = np.float32
+
+# 旧版 pose_data 表按 5fps 采样估算时间戳（frame_index * 0.2），保持兼容
+LEGACY_SECONDS_PER_FRAME = 0.2
+
+
+class PoseArrays(NamedTuple):
+    """一个视频的全部骨骼数据（只读数组）"""
+    frame_indices: np.ndarray  # int32[frames]
+    presence: np.ndarray       # bool[frames]
+    poses: np.ndarray          # float32[frames, 13, 4]
+    version: int = 0           # 数据版本号，每次重新写入 +1
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.frame_indices.shape[0])
+
+    @property
+    def valid_count(self) -> int:
+        return int(np.count_nonzero(self.presence))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.frame_indices.nbytes + self.presence.nbytes + self.poses.nbytes)
+
+    def present(self) -> 'PoseArrays':
+        """只保留检测到骨骼的帧（与旧版 pose_data 表只存有效帧的语义一致）"""
+        if self.presence.all():
+            return self
+        mask = self.presence
+        return PoseArrays(self.frame_indices[mask], self.presence[mask], self.poses[mask], self.version)
+
+
+def empty_pose_arrays(version: int = 0) -> PoseArrays:
+    """空的骨骼数据"""
+    return PoseArrays(
+        np.empty(0, dtype=FRAME_INDEX_DTYPE),
+        np.empty(0, dtype=bool),
+        np.empty((0, NUM_LANDMARKS, LANDMARK_DIMS), dtype=POSE_DTYPE),
+        version,
+    )
+
+
+def pack_poses(poses_data: Dict[int, Optional[List]], version: int = 0) -> PoseArrays:
+    """把 {frame_idx: [[x,y,z,vis], ...] 或 None} 转换为 PoseArrays
+
+    关键点数量不是 13 的帧按无骨骼处理（旧版 calculate_pose_difference 对这种帧也无法比较）。
+    """
+    if not poses_data:
+        return empty_pose_arrays(version)
+
+    frame_indices = np.array(sorted(poses_data.keys()), dtype=FRAME_INDEX_DTYPE)
+    presence = np.zeros(len(frame_indices), dtype=bool)
+    poses = np.zeros((len(frame_indices), NUM_LANDMARKS, LANDMARK_DIMS), dtype=POSE_DTYPE)
+
+    for i, frame_idx in enumerate(frame_indices.tolist()):
+        pose = poses_data[frame_idx]
+        if pose is None or len(pose) != NUM_LANDMARKS:
+            continue
+        poses[i] = pose
+        presence[i] = True
+
+    return PoseArrays(frame_indices, presence, poses, version)
+
+
+def encode_pose_arrays(arrays: PoseArrays) -> Dict:
+    """编码为可直接写入 pose_blobs 表的字段"""
+    return {
+        'frame_count': arrays.frame_count,
+        'valid_count': arrays.valid_count,
+        'frame_indices': np.ascontiguousarray(arrays.frame_indices, dtype=FRAME_INDEX_DTYPE).tobytes(),
+        'presence': np.ascontiguousarray(arrays.presence, dtype=PRESENCE_DTYPE).tobytes(),
+        'poses': np.ascontiguousarray(arrays.poses, dtype=POSE_DTYPE).tobytes(),
+    }
+
+
+def decode_pose_arrays(frame_count: int, frame_indices: bytes, presence: bytes,
+                       poses: bytes, version: int = 0) -> PoseArrays:
+    """从 pose_blobs 的一行解码（零拷贝，返回的数组只读）"""
+    if not frame_count:
+        return empty_pose_arrays(version)
+    return PoseArrays(
+        np.frombuffer(frame_indices, dtype=FRAME_INDEX_DTYPE, count=frame_count),
+        np.frombuffer(presence, dtype=PRESENCE_DTYPE, count=frame_count).view(bool),
+        np.frombuffer(poses, dtype=POSE_DTYPE).reshape(frame_count, NUM_LANDMARKS, LANDMARK_DIMS),
+        version,
+    )
+
+
+def pose_arrays_to_dict(arrays: PoseArrays) -> Dict[int, Optional[List]]:
+    """转换回 {frame_idx: [[x,y,z,vis], ...] 或 None}（兼容旧接口）"""
+    poses_list = arrays.poses.tolist()
+    return {
+        frame_idx: (poses_list[i] if present else None)
+        for i, (frame_idx, present) in enumerate(zip(arrays.frame_indices.tolist(), arrays.presence.tolist()))
+    }
+
+
+def pose_arrays_to_rows(arrays: PoseArrays) -> List[Dict]:
+    """转换为旧版 get_pose_data 的返回格式（只包含有骨骼的帧）"""
+    present = arrays.present()
+    poses_list = present.poses.tolist()
+    return [
+        {
+            'frame_index': frame_idx,
+            'pose_data': poses_list[i],
+            'timestamp': frame_idx * LEGACY_SECONDS_PER_FRAME,
+        }
+        for i, frame_idx in enumerate(present.frame_indices.tolist())
+    ]
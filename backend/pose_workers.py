@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+常驻骨骼提取进程池
+
+每个 worker 进程启动时只导入一次 cv2 / mediapipe 并创建 Pose 计算图，之后在多个视频之间复用；
+每个任务开始前调用 pose.reset() 清空跟踪状态，结果与新建计算图一致。
+worker 执行 POSE_WORKER_MAX_JOBS 个任务后自动退出并由新进程替换，防止内存持续增长。
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from metrics import POSE_FRAMES, POSE_WORKER_FRAMES_PER_SECOND, POSE_WORKER_UTILIZATION, registry
+
+logger = logging.getLogger(__name__)
+
+# 进程池大小（所有视频共用）
+POSE_WORKER_PROCESSES = int(os.environ.get('POSE_WORKER_PROCESSES', str(min(8, max(1, (os.cpu_count() or 2) - 1)))))
+# 每个 worker 进程最多执行的任务数，之后重建进程释放内存
+POSE_WORKER_MAX_JOBS = int(os.environ.get('POSE_WORKER_MAX_JOBS', '50'))
+
+# ---------- worker 进程内的全局状态 ----------
+_pose = None
+
+
+def _init_worker():
+    """worker 进程初始化：导入 mediapipe 并创建 Pose 计算图（每个进程只执行一次）"""
+    global _pose
+    import mediapipe as _mp
+    _pose = _mp.solutions.pose.Pose(
+        static_image_mode=False,
+        model_complexity=0,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
+
+
+def _pose_worker(args):
+    """提取一段视频 [start_frame, end_frame) 的骨骼数据
+
+    args 可以带第 7 个参数 seek_frame（不晚于 start_frame 的关键帧）：先直接跳到该关键帧，
+    再顺序 grab 到 start_frame；不带时从第 0 帧开始顺序 grab。
+
+    Returns:
+        (poses_data, stats)：stats 记录执行该任务的进程号、耗时、推理耗时和推理帧数
+    """
+    video_file, start_frame, end_frame, n, max_side, selected_landmarks_list = args[:6]
+    seek_frame = args[6] if len(args) > 6 else 0
+    import cv2 as _cv2
+
+    started = time.time()
+    selected_set = set(selected_landmarks_list)
+    poses_data = {}
+    processed = 0
+    inference_seconds = 0.0
+
+    # 清空上一个任务遗留的跟踪状态
+    _pose.reset()
+
+    cap = _cv2.VideoCapture(video_file)
+    try:
+        if not cap.isOpened():
+            return poses_data, _job_stats(started, processed, inference_seconds)
+
+        src_width = int(cap.get(_cv2.CAP_PROP_FRAME_WIDTH))
+        src_height = int(cap.get(_cv2.CAP_PROP_FRAME_HEIGHT))
+        scale = min(1.0, max_side / max(src_width, src_height)) if max(src_width, src_height) > 0 else 1.0
+        target_size = (int(src_width * scale), int(src_height * scale)) if scale < 1.0 else None
+
+        # 按关键帧定位；定位不准确时重新打开视频，从头顺序 grab
+        position = 0
+        if seek_frame > 0:
+            cap.set(_cv2.CAP_PROP_POS_FRAMES, seek_frame)
+            if int(cap.get(_cv2.CAP_PROP_POS_FRAMES)) == seek_frame:
+                position = seek_frame
+            else:
+                cap.release()
+                cap = _cv2.VideoCapture(video_file)
+
+        # 跳到起始帧（grab 不解码，更快）
+        for _ in range(start_frame - position):
+            if not cap.grab():
+                return poses_data, _job_stats(started, processed, inference_seconds)
+
+        frame_idx = start_frame
+        while frame_idx < end_frame:
+            if frame_idx % n == 0:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if target_size is not None:
+                    frame = _cv2.resize(frame, target_size, interpolation=_cv2.INTER_LINEAR)
+                image_rgb = _cv2.cvtColor(frame, _cv2.COLOR_BGR2RGB)
+                image_rgb.flags.writeable = False
+                inference_started = time.perf_counter()
+                results = _pose.process(image_rgb)
+                inference_seconds += time.perf_counter() - inference_started
+                processed += 1
+                if results.pose_landmarks:
+                    poses_data[frame_idx] = [
+                        [lm.x, lm.y, lm.z, lm.visibility]
+                        for i, lm in enumerate(results.pose_landmarks.landmark)
+                        if i in selected_set
+                    ]
+                else:
+                    poses_data[frame_idx] = None
+            else:
+                if not cap.grab():
+                    break
+            frame_idx += 1
+    finally:
+        cap.release()
+
+    return poses_data, _job_stats(started, processed, inference_seconds)
+
+
+def _pose_block_worker(args):
+    """对共享内存环形缓冲区中一个槽位里的连续采样帧做骨骼推理（见 pose_pipeline）
+
+    Returns:
+        (slot, poses_data, stats)：处理完成后主进程据 slot 回收该槽位
+    """
+    shm_name, slot, slot_offset, frame_indices, height, width, selected_landmarks_list = args
+    from multiprocessing import shared_memory
+    import numpy as _np
+
+    started = time.time()
+    selected_set = set(selected_landmarks_list)
+    poses_data = {}
+    inference_seconds = 0.0
+
+    # 每个槽位是一段连续的采样帧，帧之间可以继续使用跟踪；槽位之间重新开始
+    _pose.reset()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = image_rgb = None
+    try:
+        frames = _np.ndarray((len(frame_indices), height, width, 3), dtype=_np.uint8,
+                             buffer=shm.buf, offset=slot_offset)
+        for i, frame_idx in enumerate(frame_indices):
+            image_rgb = frames[i]
+            image_rgb.flags.writeable = False
+            inference_started = time.perf_counter()
+            results = _pose.process(image_rgb)
+            inference_seconds += time.perf_counter() - inference_started
+            if results.pose_landmarks:
+                poses_data[frame_idx] = [
+                    [lm.x, lm.y, lm.z, lm.visibility]
+                    for i, lm in enumerate(results.pose_landmarks.landmark)
+                    if i in selected_set
+                ]
+            else:
+                poses_data[frame_idx] = None
+    finally:
+        # 关闭共享内存前必须释放所有指向它的数组
+        frames = image_rgb = None
+        shm.close()
+
+    return slot, poses_data, _job_stats(started, len(frame_indices), inference_seconds)
+
+
+def _job_stats(started: float, frames: int, inference_seconds: float) -> Dict:
+    return {'pid': os.getpid(), 'busy_seconds': time.time() - started, 'frames': frames,
+            'inference_seconds': inference_seconds}
+
+
+# ---------- 主进程 ----------
+
+class PoseWorkerPool:
+    """常驻的骨骼提取进程池（首次使用时创建，或调用 start() 提前预热）"""
+
+    def __init__(self, processes: int = POSE_WORKER_PROCESSES, max_jobs_per_worker: int = POSE_WORKER_MAX_JOBS):
+        self.processes = max(1, processes)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._pool = None
+        self._lock = threading.Lock()
+        self._created_at = None
+        self._worker_stats: Dict[int, Dict] = {}
+        self._retired_workers = 0  # 执行满任务数后被回收的进程数
+        self._total_jobs = 0
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """创建进程池（spawn 启动后各进程立即执行初始化，预先加载模型）"""
+        with self._lock:
+            if self._pool is not None:
+                return self._pool
+            # 使用 spawn 启动方式（兼容 macOS / Linux），避免 mediapipe fork 问题
+            import multiprocessing as mp_proc
+            try:
+                ctx = mp_proc.get_context('spawn')
+            except Exception:
+                ctx = mp_proc
+            self._pool = ctx.Pool(
+                processes=self.processes,
+                initializer=_init_worker,
+                maxtasksperchild=self.max_jobs_per_worker or None,
+            )
+            self._created_at = time.time()
+            logger.info("[骨骼进程池] 已启动 %s 个常驻进程，每个进程执行 %s 个任务后重建", self.processes, self.max_jobs_per_worker)
+            return self._pool
+
+    def imap_unordered(self, jobs: List[Tuple]) -> Iterator[Tuple[Dict, Dict]]:
+        """并行执行若干个 (video_file, start_frame, end_frame, n, max_side, selected_landmarks) 任务，
+        按完成顺序逐个返回 (poses_data, stats)"""
+        pool = self.start()
+        for poses_data, stats in pool.imap_unordered(_pose_worker, jobs):
+            self._record(stats)
+            yield poses_data, stats
+
+    def submit_block(self, job: Tuple, callback, error_callback):
+        """异步提交一个共享内存帧块（见 _pose_block_worker），完成后在结果线程中回调 callback(slot, poses_data, stats)"""
+        pool = self.start()
+
+        def on_result(result):
+            slot, poses_data, stats = result
+            self._record(stats)
+            callback(slot, poses_data, stats)
+
+        return pool.apply_async(_pose_block_worker, (job,), callback=on_result, error_callback=error_callback)
+
+    def _record(self, stats: Dict):
+        now = time.time()
+        with self._stats_lock:
+            worker = self._worker_stats.get(stats['pid'])
+            if worker is None:
+                worker = self._worker_stats[stats['pid']] = {
+                    'first_job_at': now - stats['busy_seconds'],
+                    'jobs': 0,
+                    'frames': 0,
+                    'busy_seconds': 0.0,
+                }
+            worker['jobs'] += 1
+            worker['frames'] += stats['frames']
+            worker['busy_seconds'] += stats['busy_seconds']
+            worker['last_job_at'] = now
+            self._total_jobs += 1
+        POSE_FRAMES.inc(stats['frames'])
+
+    def shutdown(self):
+        """关闭进程池（等待正在执行的任务结束）"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def stats(self) -> Dict:
+        """进程池状态和每个 worker 的利用率（忙碌时间 / 自第一个任务起经过的时间）"""
+        with self._lock:
+            pool = self._pool
+            alive_pids = {p.pid for p in getattr(pool, '_pool', [])} if pool is not None else set()
+        now = time.time()
+        workers = []
+        with self._stats_lock:
+            # 已退出（被回收）的进程只计入 retired_workers
+            for pid in list(self._worker_stats):
+                if pid not in alive_pids:
+                    self._worker_stats.pop(pid)
+                    self._retired_workers += 1
+            retired_workers, total_jobs = self._retired_workers, self._total_jobs
+            for pid in sorted(alive_pids):
+                worker = self._worker_stats.get(pid)
+                if worker is None:
+                    workers.append({'pid': pid, 'jobs': 0, 'frames': 0, 'busy_seconds': 0.0, 'utilization': 0.0})
+                    continue
+                lifetime = max(now - worker['first_job_at'], 1e-6)
+                workers.append({
+                    'pid': pid,
+                    'jobs': worker['jobs'],
+                    'frames': worker['frames'],
+                    'busy_seconds': round(worker['busy_seconds'], 2),
+                    'utilization': round(min(1.0, worker['busy_seconds'] / lifetime), 4),
+                })
+        return {
+            'running': pool is not None,
+            'processes': self.processes,
+            'max_jobs_per_worker': self.max_jobs_per_worker,
+            'uptime_seconds': round(now - self._created_at, 1) if self._created_at else 0,
+            'total_jobs': total_jobs,
+            'retired_workers': retired_workers,
+            'workers': workers,
+        }
+
+
+pose_worker_pool = PoseWorkerPool()
+
+
+def _collect_worker_metrics():
+    """每个存活 worker 的推理速度和利用率（已退出的 worker 不再输出）"""
+    workers = pose_worker_pool.stats()['workers']
+    POSE_WORKER_FRAMES_PER_SECOND.replace({
+        (worker['pid'],): worker['frames'] / worker['busy_seconds'] if worker['busy_seconds'] > 0 else 0.0
+        for worker in workers
+    })
+    POSE_WORKER_UTILIZATION.replace({(worker['pid'],): worker['utilization'] for worker in workers})
+
+
+registry.add_collector(_collect_worker_metrics)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+视频文件的范围请求（Range）响应
+
+/video/<video_id> 和标记骨骼视频共用：
+    - 完整文件用 wsgi.file_wrapper 发送（服务器支持时走 sendfile），范围请求按固定大小分块读取，
+      每个观看者占用的内存与文件大小无关
+    - 开放式范围（bytes=0-）最多返回 RANGE_OPEN_ENDED_MAX_BYTES 字节，浏览器会按需继续请求后面的部分
+    - 支持多段范围（multipart/byteranges）、If-Range、ETag / Last-Modified 条件请求
+
+生产环境前面有 nginx 时，可以设置 MEDIA_ACCEL_REDIRECT 把文件交给 nginx 发送：
+接口只负责查库和权限检查，返回 X-Accel-Redirect 指向 nginx 的 internal location，
+Range、sendfile 和缓存都由 nginx 处理。未设置时仍由 Flask 发送（本地开发不需要 nginx）。
+"""
+
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header
+from werkzeug.wsgi import wrap_file
+
+# 开放式范围请求单次最多返回的字节数
+RANGE_OPEN_ENDED_MAX_BYTES = int(os.environ.get('RANGE_OPEN_ENDED_MAX_BYTES', str(8 * 1024 * 1024)))
+# 范围响应每次从文件读取的块大小
+RANGE_CHUNK_SIZE = 256 * 1024
+# 多段范围最多允许的段数，超过时忽略 Range 返回完整文件
+MAX_RANGES = 16
+
+# 本地目录到 nginx internal location 的映射，逗号分隔，如
+# "/app/uploads=/_media/uploads,/app/temp=/_media/temp"；为空时不使用 X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+
+
+def _parse_accel_mapping(value: str) -> List[Tuple[str, str]]:
+    mapping = []
+    for item in value.split(','):
+        local_dir, sep, location = item.strip().partition('=')
+        if sep and local_dir and location:
+            mapping.append((os.path.realpath(local_dir), location.rstrip('/')))
+    # 长路径优先，嵌套目录时匹配最具体的一个
+    return sorted(mapping, key=lambda item: len(item[0]), reverse=True)
+
+
+_accel_mapping = _parse_accel_mapping(MEDIA_ACCEL_REDIRECT)
+
+
+def accel_redirect_uri(path: str) -> Optional[str]:
+    """文件对应的 nginx internal URI；未启用或文件不在映射的目录中时返回 None"""
+    if not _accel_mapping:
+        return None
+    real_path = os.path.realpath(path)
+    for local_dir, location in _accel_mapping:
+        if real_path.startswith(local_dir + os.sep):
+            relative = os.path.relpath(real_path, local_dir).replace(os.sep, '/')
+            return f"{location}/{quote(relative)}"
+    return None
+
+
+def parse_byte_ranges(header: str, size: int,
+                      open_ended_max: int = RANGE_OPEN_ENDED_MAX_BYTES) -> Optional[List[Tuple[int, int]]]:
+    """解析 Range 请求头
+
+    Returns:
+        [(start, end), ...]（end 为包含的最后一个字节，已截断到文件范围内）；
+        语法无效时返回 None（应忽略 Range），所有范围都超出文件时返回 []（应返回 416）
+    """
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        start_str, sep, end_str = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not start_str:
+                # 后缀范围：最后 N 个字节
+                suffix = int(end_str)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+            else:
+                start = int(start_str)
+                if end_str:
+                    end = int(end_str)
+                    if end < start:
+                        return None
+                else:
+                    end = start + open_ended_max - 1
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def _iter_file_ranges(path: str, ranges: List[Tuple[int, int]], parts: List[bytes],
+                      closing: bytes = b'') -> Iterator[bytes]:
+    """按块读取文件中的若干范围；parts[i] 在第 i 段数据之前输出（多段响应的分隔头）"""
+    with open(path, 'rb') as f:
+        for (start, end), part_header in zip(ranges, parts):
+            if part_header:
+                yield part_header
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(RANGE_CHUNK_SIZE, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+    if closing:
+        yield closing
+
+
+def _if_range_matches(etag: str, last_modified: datetime) -> bool:
+    """If-Range 只能与强 ETag 或精确的修改时间匹配，不匹配时忽略 Range 返回完整文件"""
+    if_range = parse_if_range_header(request.headers.get('If-Range'))
+    if if_range.etag is not None:
+        return f'"{if_range.etag}"' == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
+
+
+def serve_file(path: str, mimetype: str) -> Response:
+    """发送文件，支持 Range / If-Range / If-None-Match / If-Modified-Since
+
+    启用 MEDIA_ACCEL_REDIRECT 时只返回 X-Accel-Redirect，由 nginx 读取文件并处理上述请求头。
+    """
+    accel_uri = accel_redirect_uri(path)
+    if accel_uri is not None:
+        response = Response(status=200, mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_uri
+        return response
+
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+    }
+
+    if not is_resource_modified(request.environ, etag=etag.strip('"'), last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    range_header = request.headers.get('Range')
+    ranges = None
+    if range_header and (not request.headers.get('If-Range') or _if_range_matches(etag, last_modified)):
+        ranges = parse_byte_ranges(range_header, size)
+
+    if ranges is None:
+        # 完整文件：交给 wsgi.file_wrapper（支持时由服务器用 sendfile 发送）
+        headers['Content-Length'] = str(size)
+        return Response(wrap_file(request.environ, open(path, 'rb')), status=200,
+                        mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+        return Response(_iter_file_ranges(path, ranges, [b'']), status=206,
+                        mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+    # 多段范围：multipart/byteranges，每段前面带各自的 Content-Type / Content-Range
+    boundary = uuid.uuid4().hex
+    parts = [
+        (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode('ascii')
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    headers['Content-Length'] = str(sum(len(p) for p in parts) + len(closing)
+                                    + sum(end - start + 1 for start, end in ranges))
+    return Response(_iter_file_ranges(path, ranges, parts, closing), status=206,
+                    content_type=f'multipart/byteranges; boundary={boundary}',
+                    headers=headers, direct_passthrough=True)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+对比报告目录（report_<work_id>）的清单文件
+
+标记骨骼视频写入后只验证一次（ffprobe，不可用时用 OpenCV 读取一帧），结论连同文件大小、修改时间
+记录在报告目录的 manifest.json 中。播放接口（包括浏览器拖动进度条时的大量范围请求）只需核对
+文件大小和修改时间，不再每次都调用 ffprobe 或解码视频。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from capabilities import has_ffprobe
+from media_probe import probe_media
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# 浏览器可以直接播放的容器格式
+PLAYABLE_FORMATS = ('mp4', 'mov', 'quicktime')
+
+_lock = threading.Lock()
+
+
+def validate_pose_video(video_file: str) -> Dict:
+    """验证标记骨骼视频能否播放
+
+    Returns:
+        {'valid', 'format_name', 'duration', 'size', 'mtime_ns', 'method', 'error', 'validated_at'}
+    """
+    stat = os.stat(video_file)
+    verdict = {
+        'valid': False,
+        'format_name': None,
+        'duration': None,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'method': None,
+        'error': None,
+        'validated_at': time.time(),
+    }
+    if stat.st_size == 0:
+        verdict['error'] = '视频文件为空'
+        return verdict
+
+    media_info = probe_media(video_file) if has_ffprobe() else None
+    if media_info is not None:
+        verdict['method'] = 'ffprobe'
+        verdict['format_name'] = media_info['format_name']
+        verdict['duration'] = media_info['duration']
+        if any(name in media_info['format_name'].lower() for name in PLAYABLE_FORMATS):
+            verdict['valid'] = True
+        else:
+            verdict['error'] = f"视频格式可能不兼容: {media_info['format_name']}"
+        return verdict
+
+    # ffprobe 不可用或无法读取时，用 OpenCV 读取一帧
+    verdict['method'] = 'opencv'
+    try:
+        import cv2
+        cap = cv2.VideoCapture(video_file)
+        try:
+            ret, frame = cap.read() if cap.isOpened() else (False, None)
+        finally:
+            cap.release()
+        if ret and frame is not None:
+            verdict['valid'] = True
+        else:
+            verdict['error'] = 'OpenCV 无法读取视频帧'
+    except Exception as e:
+        verdict['error'] = f"OpenCV 验证失败: {e}"
+    return verdict
+
+
+def _read_manifest(report_dir: str) -> Dict:
+    try:
+        with open(os.path.join(report_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_pose_video(report_dir: str, video_type: str, video_file: str) -> Dict:
+    """验证刚写入的标记骨骼视频，并把结论写入清单（video_type: 'reference' / 'user'）"""
+    verdict = validate_pose_video(video_file)
+    verdict['file'] = os.path.basename(video_file)
+
+    manifest_file = os.path.join(report_dir, MANIFEST_FILENAME)
+    with _lock:
+        manifest = _read_manifest(report_dir)
+        manifest.setdefault('pose_videos', {})[video_type] = verdict
+        # 先写临时文件再替换，读取方不会读到写了一半的清单
+        temp_file = f"{manifest_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_file, manifest_file)
+
+    if not verdict['valid']:
+        logger.warning("[报告清单] %s 验证未通过: %s", video_file, verdict['error'])
+    return verdict
+
+
+def lookup_pose_video(report_dir: str, video_type: str, video_file: str) -> Optional[Dict]:
+    """读取清单中记录的验证结论；没有记录或文件在验证后被修改过时返回 None"""
+    verdict = _read_manifest(report_dir).get('pose_videos', {}).get(video_type)
+    if not verdict:
+        return None
+    try:
+        stat = os.stat(video_file)
+    except OSError:
+        return None
+    if (verdict.get('size'), verdict.get('mtime_ns')) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return verdict
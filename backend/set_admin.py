@@ -27,6 +27,8 @@ def main():
             print(f"已将用户 '{args.username}' 的权限降为普通用户")
         else:
             print(f"已将用户 '{args.username}' 设置为管理员")
+        # update_user_role 已更新 epoch 文件，运行中的服务会清除缓存的角色
+        print("运行中的服务无需重启，新权限在 1 秒内生效")
     else:
         print(f"操作失败，请检查数据库")
 
@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 """
 舞蹈姿势对比服务启动脚本
+
+    python start_server.py          开发服务器（Flask 自带，单进程，修改代码自动重载）
+    python start_server.py --prod   生产模式：gunicorn 多进程多线程处理请求 + 单独的任务进程
+    python start_server.py --jobs   只运行任务进程（骨骼提取进程池和任务队列）
 """
 
+import argparse
+import glob
 import os
+import shutil
+import signal
 import sys
 import subprocess
+import tempfile
+import threading
 import time
 
+from log_config import setup_logging
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def check_dependencies():
     """检查依赖是否安装"""
     required_packages = [
@@ -55,7 +69,84 @@ def init_database():
         print(f"数据库初始化失败: {e}")
         return False
 
+def run_jobs():
+    """任务进程：运行骨骼提取进程池和任务队列，直到收到 SIGTERM / SIGINT"""
+    from app import start_background_services, stop_background_services
+    
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    
+    start_background_services()
+    print(f"[任务进程] 已启动 (pid {os.getpid()})")
+    while not stop_event.wait(1):
+        pass
+    
+    print("[任务进程] 正在停止，等待正在执行的任务结束...")
+    stop_background_services()
+    print("[任务进程] 已停止")
+
+def prepare_metrics_dir():
+    """各进程写运行指标快照的目录（见 metrics.py）：未指定 METRICS_DIR 时创建临时目录，
+    指定时清掉上次运行留下的快照。返回需要在退出时删除的临时目录"""
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if not metrics_dir:
+        metrics_dir = tempfile.mkdtemp(prefix='dance-metrics-')
+        os.environ['METRICS_DIR'] = metrics_dir
+        return metrics_dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        os.remove(path)
+    return None
+
+def run_prod():
+    """生产模式：启动任务进程和 gunicorn，任意一个退出时停止另一个并以其退出码退出（交给容器重启）"""
+    temp_metrics_dir = prepare_metrics_dir()
+    commands = {
+        'jobs': [sys.executable, os.path.join(BACKEND_DIR, 'start_server.py'), '--jobs'],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'), 'app:app'],
+    }
+    processes = {name: subprocess.Popen(cmd, cwd=BACKEND_DIR) for name, cmd in commands.items()}
+    
+    def forward(signum, frame):
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signum)
+    
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    
+    exit_code = None
+    while processes:
+        for name, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            print(f"[服务启动] {name} 进程已退出，退出码 {code}")
+            del processes[name]
+            if exit_code is None:
+                # 第一个退出的进程决定退出码，并停止其余进程
+                exit_code = code
+                forward(signal.SIGTERM, None)
+        time.sleep(0.5)
+    if temp_metrics_dir:
+        shutil.rmtree(temp_metrics_dir, ignore_errors=True)
+    sys.exit(exit_code)
+
 def main():
+    parser = argparse.ArgumentParser(description='舞蹈姿势对比服务')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--prod', action='store_true', help='生产模式：gunicorn + 单独的任务进程')
+    mode.add_argument('--jobs', action='store_true', help='只运行任务进程（骨骼提取和任务队列）')
+    args = parser.parse_args()
+    
+    os.chdir(BACKEND_DIR)
+    setup_logging()
+    
+    if args.jobs:
+        run_jobs()
+        return
+    
     print("=" * 50)
     print("舞蹈姿势对比服务")
     print("=" * 50)
@@ -74,6 +165,11 @@ def main():
     if not init_database():
         sys.exit(1)
     
+    if args.prod:
+        print("启动生产服务（gunicorn + 任务进程）...")
+        run_prod()
+        return
+    
     # 启动服务
     print("启动Flask服务...")
     print("服务地址: http://localhost:8128")
@@ -87,12 +183,16 @@ def main():
     print("  - 获取姿势数据: GET /api/videos/<video_id>/pose-data")
     print("  - 删除视频: DELETE /api/videos/<video_id>")
     print("  - 数据库统计: GET /api/database/stats")
+    print("  - 运行指标: GET /metrics")
     print("\n按 Ctrl+C 停止服务")
     print("-" * 50)
     
     try:
         # 启动Flask应用
-        from app import app
+        from app import app, start_background_services
+        # debug 模式下后台服务只在 Werkzeug 真正处理请求的子进程中启动
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_services()
         app.run(host='0.0.0.0', port=8128, debug=True)
     except KeyboardInterrupt:
         print("\n服务已停止")
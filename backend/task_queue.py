@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+后台任务队列
+
+任务持久化在 async_tasks 表中，由固定数量的工作线程按优先级（高优先）+ 提交顺序（先进先出）领取执行：
+    - 并发上限由 JOB_CONCURRENCY 环境变量控制（默认 2），上传再多视频也不会同时跑更多提取任务
+    - 领取任务是一条原子 UPDATE ... RETURNING，多个线程/进程不会重复领取同一个任务
+    - 服务重启后，上次中断的 processing 任务会重新放回队列（pending 任务本来就在队列中）
+"""
+
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from metrics import TASK_ACTIVE, TASK_SECONDS, TASK_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 任务优先级（数值越大越先执行）
+PRIORITY_HIGH = 10    # 用户正在等待结果的任务（用户视频骨骼提取）
+PRIORITY_NORMAL = 5   # 普通后台任务（教学视频骨骼提取）
+PRIORITY_LOW = 0      # 可以慢慢做的任务
+
+# 同时执行的任务数上限
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '2'))
+
+# 没有新任务通知时，多久检查一次数据库（其他进程提交的任务只能靠轮询发现）
+POLL_INTERVAL = 2.0
+
+
+class TaskQueue:
+    """基于 async_tasks 表的任务调度器"""
+
+    def __init__(self, db, concurrency: int = JOB_CONCURRENCY):
+        self.db = db
+        self.concurrency = max(1, concurrency)
+        self._handlers: Dict[str, Callable[[Dict], None]] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def register(self, task_type: str, handler: Callable[[Dict], None]):
+        """注册任务处理函数
+
+        handler 接收 async_tasks 的一行（payload 已解析为 dict），
+        正常返回视为成功，抛出异常视为失败。
+        """
+        self._handlers[task_type] = handler
+
+    def submit(self, task_id: str, video_id: str, video_type: str, task_type: str,
+               priority: int = PRIORITY_NORMAL, payload: Optional[Dict] = None) -> bool:
+        """提交任务（写入 async_tasks 表后唤醒工作线程）"""
+        if not self.db.create_async_task(task_id, video_id, video_type, task_type, priority, payload):
+            return False
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        """恢复中断的任务并启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._threads:
+                return
+
+            recovered = self.db.requeue_interrupted_tasks()
+            if recovered:
+                logger.info("[任务队列] 已恢复 %s 个中断的任务", recovered)
+
+            self._stop.clear()
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._worker_loop, name=f"task-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info("[任务队列] 已启动 %s 个工作线程，任务类型: %s", self.concurrency, ', '.join(self._handlers))
+
+    def stop(self, timeout: float = None):
+        """通知工作线程退出（正在执行的任务会先执行完）"""
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            task = self.db.claim_next_task(list(self._handlers))
+            if task is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(task)
+
+    def _run(self, task: Dict):
+        task_id, task_type = task['task_id'], task['task_type']
+        handler = self._handlers[task_type]
+        logger.info("[任务队列] 开始执行任务 %s (%s, %s, 优先级 %s)", task_id, task_type, task['video_type'], task['priority'])
+        wait_seconds = _queued_seconds(task)
+        if wait_seconds is not None:
+            TASK_WAIT_SECONDS.observe(wait_seconds, task_type=task_type)
+        TASK_ACTIVE.inc(task_type=task_type)
+        started = time.perf_counter()
+        status = 'completed'
+        try:
+            handler(task)
+            self.db.finish_task(task_id, 'completed')
+            logger.info("[任务队列] 任务 %s 完成", task_id)
+        except Exception as e:
+            status = 'failed'
+            error_msg = f"处理失败: {str(e)}\n{traceback.format_exc()}"
+            logger.exception("[任务队列] 任务 %s 失败: %s", task_id, e)
+            self.db.finish_task(task_id, 'failed', error_msg)
+        finally:
+            # 任务出错时可能在本线程的连接上留下未提交的事务，领取下一个任务前回滚，不占着写锁
+            self.db.connections.release()
+            TASK_ACTIVE.dec(task_type=task_type)
+            TASK_SECONDS.observe(time.perf_counter() - started, task_type=task_type, status=status)
+
+    def stats(self) -> Dict:
+        """队列状态"""
+        return {
+            'concurrency': self.concurrency,
+            'running': bool(self._threads),
+            'pending': self.db.count_tasks('pending'),
+            'processing': self.db.count_tasks('processing'),
+        }
+
+
+def _queued_seconds(task: Dict) -> Optional[float]:
+    """任务从提交到被领取的时间（created_at / started_at 是 SQLite 的 CURRENT_TIMESTAMP，精度为秒）"""
+    try:
+        created_at = datetime.strptime(task['created_at'], '%Y-%m-%d %H:%M:%S')
+        started_at = datetime.strptime(task['started_at'], '%Y-%m-%d %H:%M:%S')
+    except (KeyError, TypeError, ValueError):
+        return None
+    return max(0.0, (started_at - created_at).total_seconds())
@@ -14,6 +14,9 @@ interface Comment {
   created_at: string;
 }
 
+// 每次加载的评论条数
+const COMMENTS_PAGE_SIZE = 20;
+
 interface CommentModalProps {
   videoId: string;
   videoType: 'reference' | 'user';
@@ -29,7 +32,10 @@ const CommentModal: React.FC<CommentModalProps> = ({
 }) => {
   const { isAuthenticated, user } = useAuth();
   const [comments, setComments] = useState<Comment[]>([]);
+  const [total, setTotal] = useState(0);
+  const [nextBeforeId, setNextBeforeId] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [commentText, setCommentText] = useState('');
   const [submitting, setSubmitting] = useState(false);
 
@@ -40,9 +46,11 @@ const CommentModal: React.FC<CommentModalProps> = ({
   const fetchComments = async () => {
     try {
       setLoading(true);
-      const response = await apiService.getComments(videoId, videoType);
+      const response = await apiService.getComments(videoId, videoType, { limit: COMMENTS_PAGE_SIZE });
       if (response.success) {
         setComments(response.comments || []);
+        setTotal(response.total ?? response.comments?.length ?? 0);
+        setNextBeforeId(response.has_more ? response.next_before_id ?? null : null);
       }
     } catch (error) {
       console.error('获取评论失败:', error);
@@ -51,6 +59,30 @@ const CommentModal: React.FC<CommentModalProps> = ({
     }
   };
 
+  // 加载更早的评论（按上一页最后一条评论的 id 继续往后翻）
+  const fetchMoreComments = async () => {
+    if (!nextBeforeId || loadingMore) {
+      return;
+    }
+
+    try {
+      setLoadingMore(true);
+      const response = await apiService.getComments(videoId, videoType, {
+        limit: COMMENTS_PAGE_SIZE,
+        beforeId: nextBeforeId,
+      });
+      if (response.success) {
+        setComments((prev) => [...prev, ...(response.comments || [])]);
+        setNextBeforeId(response.has_more ? response.next_before_id ?? null : null);
+      }
+    } catch (error) {
+      console.error('加载更多评论失败:', error);
+      showToast('加载更多评论失败，请重试', 'error');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async () => {
     if (!commentText.trim() || !isAuthenticated) {
       return;
@@ -61,7 +93,13 @@ const CommentModal: React.FC<CommentModalProps> = ({
       const response = await apiService.addComment(videoId, videoType, commentText);
       if (response.success) {
         setCommentText('');
-        await fetchComments();
+        // 接口返回了新评论，直接插到列表最前面，不再重新拉取整个评论列表
+        if (response.comment) {
+          setComments((prev) => [response.comment as Comment, ...prev]);
+          setTotal((prev) => prev + 1);
+        } else {
+          await fetchComments();
+        }
         if (onCommentSubmit) {
           onCommentSubmit();
         }
@@ -86,7 +124,7 @@ const CommentModal: React.FC<CommentModalProps> = ({
     <div className="comment-modal-backdrop" onClick={handleBackdropClick}>
       <div className="comment-modal" onClick={(e) => e.stopPropagation()}>
         <div className="comment-modal-header">
-          <h3>评论 ({comments.length})</h3>
+          <h3>评论 ({total})</h3>
           <button className="close-button" onClick={onClose}>
             ×
           </button>
@@ -110,6 +148,15 @@ const CommentModal: React.FC<CommentModalProps> = ({
                   <div className="comment-content">{comment.content}</div>
                 </div>
               ))}
+              {nextBeforeId !== null && (
+                <button
+                  className="load-more-button"
+                  onClick={fetchMoreComments}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? '加载中...' : '加载更多评论'}
+                </button>
+              )}
             </div>
           )}
         </div>
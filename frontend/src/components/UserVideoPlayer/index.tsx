@@ -46,9 +46,9 @@ const UserVideoPlayer: React.FC = () => {
           if (foundVideo) {
             setVideo(foundVideo);
             // 获取评论数量
-            const commentsResponse = await apiService.getComments(id, 'user');
+            const commentsResponse = await apiService.getComments(id, 'user', { limit: 1 });
             if (commentsResponse.success) {
-              setCommentCount(commentsResponse.comments?.length || 0);
+              setCommentCount(commentsResponse.total ?? 0);
             }
           } else {
             setError('未找到指定的视频');
@@ -80,9 +80,9 @@ const UserVideoPlayer: React.FC = () => {
   const handleCommentSubmit = async () => {
     // 刷新评论数量
     if (id) {
-      const commentsResponse = await apiService.getComments(id, 'user');
+      const commentsResponse = await apiService.getComments(id, 'user', { limit: 1 });
       if (commentsResponse.success) {
-        setCommentCount(commentsResponse.comments?.length || 0);
+        setCommentCount(commentsResponse.total ?? 0);
       }
     }
   };
@@ -66,9 +66,9 @@ const VideoPlayer: React.FC = () => {
           if (foundVideo) {
             setVideo(foundVideo);
             // 获取评论数量
-            const commentsResponse = await apiService.getComments(id, 'reference');
+            const commentsResponse = await apiService.getComments(id, 'reference', { limit: 1 });
             if (commentsResponse.success) {
-              setCommentCount(commentsResponse.comments?.length || 0);
+              setCommentCount(commentsResponse.total ?? 0);
             }
           } else {
             setError('未找到指定的视频');
@@ -420,9 +420,9 @@ const VideoPlayer: React.FC = () => {
   const handleCommentSubmit = async () => {
     // 刷新评论数量
     if (id) {
-      const commentsResponse = await apiService.getComments(id, 'reference');
+      const commentsResponse = await apiService.getComments(id, 'reference', { limit: 1 });
       if (commentsResponse.success) {
-        setCommentCount(commentsResponse.comments?.length || 0);
+        setCommentCount(commentsResponse.total ?? 0);
       }
     }
   };
@@ -550,11 +550,21 @@ class ApiService {
   // ==================== 评论相关 API ====================
 
   // 获取评论列表
-  async getComments(videoId: string, videoType: 'reference' | 'user' = 'user'): Promise<{
+  async getComments(
+    videoId: string,
+    videoType: 'reference' | 'user' = 'user',
+    options: { limit?: number; beforeId?: number | null } = {}
+  ): Promise<{
     success: boolean;
     comments: Comment[];
+    total?: number;
+    next_before_id?: number | null;
+    has_more?: boolean;
   }> {
-    return this.makeRequest(`${this.baseUrl}/comments/${videoId}?video_type=${videoType}`);
+    const params = new URLSearchParams({ video_type: videoType });
+    if (options.limit) params.set('limit', String(options.limit));
+    if (options.beforeId) params.set('before_id', String(options.beforeId));
+    return this.makeRequest(`${this.baseUrl}/comments/${videoId}?${params.toString()}`);
   }
 
   // 添加评论